@@ -0,0 +1,259 @@
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+WORDS = ['dataset', 'tokenizer', 'stream', 'batch', 'shard', 'split', 'column', 'feature', 'cache', 'config',
+         'model', 'pipeline', 'trainer', 'loads', 'returns', 'the', 'a', 'of', 'to', 'and', 'with', 'from', 'each']
+
+# Generated documentation site. Every page has a main article (paragraphs up to page_bytes
+# and code_blocks code blocks), a sidebar, and a nav block with links to the next page and
+# to fanout other pages; the nav is boilerplate, so duplicate pages can copy another page's
+# article and keep their own links. Pages are rebuilt from (seed, id) on every request.
+class SyntheticSite:
+    def __init__(self, pages=500, fanout=8, code_blocks=3, page_bytes=8000, duplicate_ratio=0.1, seed=0):
+        self.pages = pages
+        self.fanout = fanout
+        self.code_blocks = code_blocks
+        self.page_bytes = page_bytes
+        self.duplicate_ratio = duplicate_ratio
+        self.seed = seed
+
+    def _rng(self, page_id, salt):
+        return random.Random(f'{self.seed}:{salt}:{page_id}')
+
+    # The page whose article this page repeats (itself unless it is a duplicate)
+    def source_of(self, page_id):
+        rng = self._rng(page_id, 'duplicate')
+        if page_id > 0 and rng.random() < self.duplicate_ratio:
+            return rng.randrange(page_id)
+        return page_id
+
+    def article(self, page_id):
+        source = self.source_of(page_id)
+        rng = self._rng(source, 'article')
+        parts = [f'<h1>Guide section {source}</h1>']
+        for block in range(self.code_blocks):
+            lines = [f'def {rng.choice(WORDS)}_{block}(value):']
+            lines += [f'    value = value.{rng.choice(WORDS)}({rng.randint(0, 99)})' for _ in range(rng.randint(3, 15))]
+            lines.append('    return value')
+            parts.append('<pre><code class="language-python">' + '\n'.join(lines) + '</code></pre>')
+        size = sum(len(part) for part in parts)
+        while size < self.page_bytes:
+            paragraph = '<p>' + ' '.join(rng.choice(WORDS) for _ in range(rng.randint(40, 90))) + '.</p>'
+            parts.insert(1 + rng.randrange(len(parts)), paragraph)
+            size += len(paragraph)
+        return '\n'.join(parts)
+
+    def links(self, page_id):
+        rng = self._rng(page_id, 'links')
+        targets = [page_id + 1] if page_id + 1 < self.pages else []
+        targets += [rng.randrange(self.pages) for _ in range(self.fanout)]
+        return targets
+
+    def render(self, page_id):
+        title = 'Index' if page_id < 0 else f'Page {page_id}'
+        sidebar = ''.join(f'<a class="sidebar-link" href="page-{i}.html">Page {i}</a>' for i in range(min(self.pages, 10)))
+        nav = ''.join(f'<a href="page-{i}.html">Page {i}</a>' for i in self.links(page_id))
+        # Links out of scope, which the crawl must not follow
+        nav += '<a href="https://example.org/elsewhere">Elsewhere</a><a href="/blog/post.html">Blog</a>'
+        return (f'<!DOCTYPE html><html><head><title>{title}</title></head><body>'
+                f'<aside class="sidebar">{sidebar}</aside><nav>{nav}</nav>'
+                f'<main>{self.article(page_id)}</main><footer>Synthetic docs</footer></body></html>')
+
+# Function to serve a SyntheticSite under /docs/ (the index links to page 0), adding latency
+# (seconds, +-50% jitter) to every response and answering a throttle_rate fraction of
+# requests with 429 and Retry-After. Returns the aiohttp runner and the request counters.
+async def serve_site(site, host='127.0.0.1', port=0, latency=0.0, throttle_rate=0.0, retry_after=1, seed=0):
+    from aiohttp import web
+
+    rng = random.Random(seed)
+    stats = {'requests': 0, 'throttled': 0, 'not_found': 0}
+
+    async def page(request):
+        stats['requests'] += 1
+        if latency:
+            await asyncio.sleep(latency * rng.uniform(0.5, 1.5))
+        if throttle_rate and rng.random() < throttle_rate:
+            stats['throttled'] += 1
+            return web.Response(status=429, headers={'Retry-After': str(retry_after)})
+        name = request.match_info.get('name', '')
+        if name in ('', 'index.html'):
+            page_id = -1
+        elif name.startswith('page-') and name.endswith('.html') and name[5:-5].isdigit() and int(name[5:-5]) < site.pages:
+            page_id = int(name[5:-5])
+        else:
+            stats['not_found'] += 1
+            raise web.HTTPNotFound()
+        return web.Response(text=site.render(page_id), content_type='text/html')
+
+    app = web.Application()
+    app.router.add_get('/docs/', page)
+    app.router.add_get('/docs/{name}', page)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site_server = web.TCPSite(runner, host, port)
+    await site_server.start()
+    bound_port = site_server._server.sockets[0].getsockname()[1]
+    return runner, stats, f'http://{host}:{bound_port}/docs/'
+
+# Function to run WebsiteSpider in workdir against start_url with scrape_settings overrides,
+# writing elapsed time, page outcomes and the stage metrics to result_path. Runs in its own
+# process, so settings are patched before any crawler module reads them.
+def run_crawl(workdir, start_url, overrides, result_path):
+    os.chdir(workdir)
+    os.environ['TQDM_DISABLE'] = '1'
+    import scrape_settings
+
+    for name, value in overrides.items():
+        setattr(scrape_settings, name, value)
+    with open('links_to_scrape.txt', 'w') as f:
+        f.write(start_url + '\n')
+
+    from scrapy.crawler import CrawlerProcess
+    from spider import WebsiteSpider
+    from telemetry import metrics
+
+    process = CrawlerProcess({
+        'LOG_LEVEL': 'WARNING',
+        'TELNETCONSOLE_ENABLED': False,
+        'TWISTED_REACTOR': WebsiteSpider.custom_settings['TWISTED_REACTOR'],
+    })
+    process.crawl(WebsiteSpider)
+    started = time.perf_counter()
+    process.start()
+    elapsed = time.perf_counter() - started
+    outcomes = {dict(labels)['outcome']: value for (name, labels), value in metrics.counters.items()
+                if name == 'pages_total'}
+    with open(result_path, 'w') as f:
+        json.dump({'elapsed': elapsed, 'outcomes': outcomes, 'metrics': metrics.snapshot()}, f, default=str)
+
+# Function to measure the stored database: rows and bytes after a WAL checkpoint
+def database_stats(path):
+    conn = sqlite3.connect(path)
+    try:
+        conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+        pages = conn.execute('SELECT COUNT(*) FROM page_texts').fetchone()[0]
+        code_blocks = conn.execute('SELECT COUNT(*) FROM code_block_texts').fetchone()[0]
+    finally:
+        conn.close()
+    size = sum(os.path.getsize(path + suffix) for suffix in ('', '-wal') if os.path.exists(path + suffix))
+    return {'pages': pages, 'code_blocks': code_blocks, 'bytes': size,
+            'bytes_per_page': round(size / pages) if pages else None}
+
+def directory_bytes(path):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+async def run(args):
+    from governor import ProcessTreeSampler
+    from scrape_settings import DB_PATH, ARCHIVE_DIR
+
+    site = SyntheticSite(args.pages, args.fanout, args.code_blocks, args.page_bytes, args.duplicate_ratio, args.seed)
+    runner, server_stats, start_url = await serve_site(site, latency=args.latency, throttle_rate=args.throttle_rate,
+                                                       retry_after=args.retry_after, seed=args.seed)
+    overrides = {
+        'CONCURRENT_REQUESTS': args.concurrency,
+        'ARCHIVE_ENABLED': args.archive,
+        'TELEMETRY_PORT': None,
+    }
+    if not args.polite:
+        # One local host: let the AIMD limits start high instead of at one request per second
+        overrides.update({'POLITENESS_INITIAL_RATE': 1000.0, 'POLITENESS_MAX_RATE': 1000.0, 'POLITENESS_BURST': 100,
+                          'POLITENESS_INITIAL_CONCURRENCY': 32, 'POLITENESS_MAX_CONCURRENCY': 64,
+                          'POLITENESS_MAX_LEASED_PER_HOST': 200})
+    with tempfile.TemporaryDirectory(prefix='bench_crawl_') as workdir:
+        result_path = os.path.join(workdir, 'result.json')
+        # spawn: the crawler starts its own reactor and worker pool
+        crawler = multiprocessing.get_context('spawn').Process(
+            target=run_crawl, args=(workdir, start_url, overrides, result_path))
+        crawler.start()
+        peak_rss = 0.0
+        sampler = None
+        while crawler.is_alive():
+            try:
+                sampler = sampler or ProcessTreeSampler(crawler.pid)
+                peak_rss = max(peak_rss, sampler.sample()[0])
+            except Exception:
+                pass
+            await asyncio.sleep(args.sample_interval)
+        await runner.cleanup()
+        if crawler.exitcode != 0 or not os.path.exists(result_path):
+            raise SystemExit(f"Crawl failed with exit code {crawler.exitcode}")
+        with open(result_path) as f:
+            result = json.load(f)
+        database = database_stats(os.path.join(workdir, DB_PATH))
+        archive_dir = os.path.join(workdir, ARCHIVE_DIR)
+        archive_bytes = directory_bytes(archive_dir) if os.path.isdir(archive_dir) else 0
+
+    finished = sum(result['outcomes'].values())
+    elapsed = result['elapsed']
+    return {
+        'timestamp': time.time(),
+        'config': {key: value for key, value in vars(args).items() if key not in ('output', 'baseline', 'json')},
+        'site_pages': args.pages + 1,
+        'elapsed': round(elapsed, 3),
+        'pages_per_second': round(finished / elapsed, 2),
+        'stored_per_second': round(result['outcomes'].get('stored', 0) / elapsed, 2),
+        'outcomes': result['outcomes'],
+        'stages': {stage: {key: row[key] for key in ('count', 'mean', 'p50', 'p99')}
+                   for stage, row in result['metrics']['stages'].items()},
+        'peak_rss_mb': round(peak_rss, 1),
+        'database': database,
+        'archive_bytes_per_page': round(archive_bytes / finished) if finished else None,
+        'server': server_stats,
+    }
+
+def print_report(report, baseline=None):
+    print(f"{report['site_pages']} site pages in {report['elapsed']}s: {report['pages_per_second']} pages/s, "
+          f"{report['stored_per_second']} stored/s, peak RSS {report['peak_rss_mb']} MB")
+    print(f"outcomes {report['outcomes']}, server {report['server']}")
+    database = report['database']
+    print(f"database: {database['pages']} pages, {database['code_blocks']} code blocks, "
+          f"{database['bytes_per_page']} bytes/page; archive {report['archive_bytes_per_page']} bytes/page")
+    print(f"{'stage':<16}{'count':>8}{'p50 ms':>10}{'p99 ms':>10}")
+    for stage, row in report['stages'].items():
+        print(f"{stage:<16}{row['count']:>8}{row['p50'] * 1000:>10.2f}{row['p99'] * 1000:>10.2f}")
+    if baseline is not None:
+        ratio = report['pages_per_second'] / baseline['pages_per_second'] if baseline['pages_per_second'] else None
+        print(f"vs baseline: {baseline['pages_per_second']} pages/s ({ratio:.2f}x), "
+              f"peak RSS {baseline['peak_rss_mb']} MB, {baseline['database']['bytes_per_page']} DB bytes/page")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='End-to-end crawl benchmark against a local synthetic documentation site')
+    parser.add_argument('--pages', type=int, default=500)
+    parser.add_argument('--fanout', type=int, default=8, help='Links from each page to other pages')
+    parser.add_argument('--code-blocks', type=int, default=3, help='Code blocks per page')
+    parser.add_argument('--page-bytes', type=int, default=8000, help='Approximate size of each page')
+    parser.add_argument('--duplicate-ratio', type=float, default=0.1, help='Fraction of pages repeating another page')
+    parser.add_argument('--latency', type=float, default=0.02, help='Seconds added to every response (+-50%%)')
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help='Fraction of requests answered with 429')
+    parser.add_argument('--retry-after', type=int, default=1, help='Retry-After seconds sent with a 429')
+    parser.add_argument('--concurrency', type=int, default=16, help='CONCURRENT_REQUESTS for the crawl')
+    parser.add_argument('--archive', action='store_true', help='Keep the raw page archive enabled')
+    parser.add_argument('--polite', action='store_true', help='Keep the default politeness rates')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--sample-interval', type=float, default=0.1, help='Seconds between RSS samples')
+    parser.add_argument('--output', default=None, help='JSON file for the results (default: bench_results/crawl-<time>.json)')
+    parser.add_argument('--baseline', default=None, help='Earlier results JSON to compare against')
+    parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    output = args.output or os.path.join('bench_results', time.strftime('crawl-%Y%m%d-%H%M%S.json'))
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report, baseline)
+        print(f"Saved to {output}")
@@ -0,0 +1,67 @@
+import argparse
+import json
+import random
+import sys
+import time
+
+from dedup import Hash64Set, ScalableBloomFilter, canonicalize_url
+
+# Function to generate documentation-like URLs with realistic length and shape
+def generate_urls(count, seed=0, prefix='page'):
+    rng = random.Random(seed)
+    hosts = ['huggingface.co', 'docs.python.org', 'developer.mozilla.org', 'docs.rs', 'nextjs.org']
+    words = ['api', 'guide', 'reference', 'tutorial', 'main_classes', 'model_doc', 'trainer', 'pipelines',
+             'tokenizer', 'datasets', 'loading', 'process', 'stream', 'v4.44.0', 'en', 'docs', 'concepts']
+    urls = []
+    for i in range(count):
+        path = '/'.join(rng.choice(words) for _ in range(rng.randint(2, 5)))
+        urls.append(f'https://{rng.choice(hosts)}/{path}/{prefix}-{i}')
+    return urls
+
+# Function to approximate the heap footprint of a Python set of URL strings
+def set_nbytes(urls_set):
+    return sys.getsizeof(urls_set) + sum(sys.getsizeof(url) for url in urls_set)
+
+def run(count, error_rate):
+    urls = [canonicalize_url(url) for url in generate_urls(count)]
+    probes = generate_urls(count, seed=1, prefix='unseen')  # Never inserted, so every hit is a false positive
+    results = {}
+
+    start = time.perf_counter()
+    baseline = set(urls)
+    results['set[str]'] = (set_nbytes(baseline), time.perf_counter() - start, 0)
+
+    for name, structure in [
+        ('Hash64Set', Hash64Set(1024)),
+        (f'ScalableBloomFilter(p={error_rate:g})', ScalableBloomFilter(1024, error_rate))
+    ]:
+        start = time.perf_counter()
+        for url in urls:
+            structure.add(url)
+        elapsed = time.perf_counter() - start
+        false_positives = sum(1 for url in probes if url in structure)
+        results[name] = (structure.nbytes, elapsed, false_positives)
+
+    report = {}
+    for name, (nbytes, elapsed, false_positives) in results.items():
+        report[name] = {
+            'bytes_per_url': round(nbytes / count, 2),
+            'inserts_per_sec': round(count / elapsed) if elapsed else None,
+            'false_positive_rate': false_positives / len(probes),
+        }
+    return report
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Memory footprint of URL dedup structures')
+    parser.add_argument('--urls', type=int, default=200000)
+    parser.add_argument('--error-rate', type=float, default=1e-6)
+    parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+    args = parser.parse_args()
+
+    report = run(args.urls, args.error_rate)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"{'structure':<36}{'bytes/url':>12}{'inserts/s':>14}{'fp rate':>12}")
+        for name, row in report.items():
+            print(f"{name:<36}{row['bytes_per_url']:>12}{row['inserts_per_sec']:>14}{row['false_positive_rate']:>12.2e}")
@@ -0,0 +1,70 @@
+import argparse
+import glob
+import json
+import os
+import re
+import time
+
+from html_extract import BACKENDS, extract_page, clean_text
+
+# The pre-extraction pipeline: html.parser for the body text, a second html.parser pass for
+# <code>, and three chained regex substitutions to clean the text
+def legacy_extract(html):
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(html, 'html.parser')
+    text = soup.body.get_text() if soup.body else soup.get_text()
+    content = re.sub(r'\s+', ' ', re.sub(r'[^\w\s]', '', re.sub(r'<[^>]+>', '', text))).lower()
+    code_blocks = [tag.get_text().strip() for tag in BeautifulSoup(html, 'html.parser').find_all('code')]
+    return content, code_blocks
+
+def available_backends():
+    backends = []
+    for name in BACKENDS:
+        try:
+            extract_page('<html><body><p>probe</p></body></html>', name)
+            backends.append(name)
+        except ImportError:
+            continue
+    return backends
+
+def time_per_page(fn, documents, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for html in documents:
+            fn(html)
+    return (time.perf_counter() - start) / (repeat * len(documents))
+
+def run(fixtures_dir, repeat):
+    paths = sorted(glob.glob(os.path.join(fixtures_dir, '*.html')))
+    if not paths:
+        raise SystemExit(f"No .html fixtures found in {fixtures_dir}")
+    documents = []
+    for path in paths:
+        with open(path, encoding='utf-8') as f:
+            documents.append(f.read())
+
+    report = {
+        'pages': len(documents),
+        'bytes_per_page': round(sum(len(html) for html in documents) / len(documents)),
+        'ms_per_page': {'legacy (bs4 x2 + 3 regex)': round(time_per_page(legacy_extract, documents, repeat) * 1000, 3)},
+    }
+    for backend in available_backends():
+        seconds = time_per_page(lambda html: clean_text(extract_page(html, backend)['text']), documents, repeat)
+        report['ms_per_page'][backend] = round(seconds * 1000, 3)
+    return report
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Microbenchmark of HTML extraction backends over saved pages')
+    parser.add_argument('--fixtures', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bench_fixtures', 'html'))
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+    args = parser.parse_args()
+
+    report = run(args.fixtures, args.repeat)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"{report['pages']} pages, {report['bytes_per_page']} bytes/page on average")
+        for name, ms in report['ms_per_page'].items():
+            print(f"{name:<28}{ms:>10.3f} ms/page")
@@ -0,0 +1,99 @@
+import argparse
+import json
+import random
+import time
+
+import torch
+import transformers
+
+from generation import BatchedGenerator, load_model
+from qa_generator import LlamaQAGenerator
+
+WORDS = ['tokenizer', 'dataset', 'batch', 'stream', 'model', 'pipeline', 'config', 'cache', 'shard', 'split',
+         'padding', 'attention', 'trainer', 'checkpoint', 'the', 'a', 'of', 'to', 'and', 'returns', 'loads']
+
+# Function to build a small random Llama and a byte-level BPE tokenizer, entirely offline
+def random_model(seed=0):
+    from tokenizers import Tokenizer, decoders, models, pre_tokenizers, trainers
+    from transformers import LlamaConfig, LlamaForCausalLM, PreTrainedTokenizerFast
+
+    bpe = Tokenizer(models.BPE())
+    bpe.pre_tokenizer = pre_tokenizers.ByteLevel(add_prefix_space=False)
+    bpe.decoder = decoders.ByteLevel()
+    trainer = trainers.BpeTrainer(vocab_size=2000, special_tokens=['<s>', '</s>'],
+                                  initial_alphabet=pre_tokenizers.ByteLevel.alphabet())
+    bpe.train_from_iterator([' '.join(WORDS)] * 100, trainer)
+    tokenizer = PreTrainedTokenizerFast(tokenizer_object=bpe, bos_token='<s>', eos_token='</s>', pad_token='</s>',
+                                        clean_up_tokenization_spaces=False)
+    tokenizer.padding_side = 'left'
+    torch.manual_seed(seed)
+    config = LlamaConfig(vocab_size=len(tokenizer), hidden_size=256, intermediate_size=688, num_hidden_layers=4,
+                         num_attention_heads=8, num_key_value_heads=8, max_position_embeddings=4096,
+                         bos_token_id=0, eos_token_id=1, pad_token_id=1)
+    model = LlamaForCausalLM(config)
+    model.name_or_path = 'random-tiny-llama'
+    model.eval()
+    return tokenizer, model
+
+# Function to generate page rows (id, url, title, content, source_type) and their code blocks
+def generate_pages(count, blocks_per_page, seed=0):
+    rng = random.Random(seed)
+    pages = []
+    code_blocks = {}
+    for page_id in range(1, count + 1):
+        content = ' '.join(rng.choice(WORDS) for _ in range(120))
+        pages.append((page_id, f'https://docs.example.com/guide/page-{page_id}', f'Page {page_id}', content, 'documentation'))
+        code_blocks[page_id] = [
+            ('\n'.join(f'x{line} = load_{rng.choice(WORDS)}({line})' for line in range(rng.randint(3, 12))), 'python')
+            for _ in range(blocks_per_page)
+        ]
+    return pages, code_blocks
+
+def run(tokenizer, model, pages, code_blocks, max_new_tokens, batch_size):
+    # The prompt builders don't touch the instance, so no model or database is loaded for them
+    qa = LlamaQAGenerator.__new__(LlamaQAGenerator)
+    rows = len(pages) + sum(len(blocks) for blocks in code_blocks.values())
+    report = {'rows': rows}
+    for name, reuse_kv in (('full_prompts', False), ('kv_reuse', True)):
+        timings = {}
+        for label, new_tokens in (('prefill', 1), ('generate', max_new_tokens)):
+            generator = BatchedGenerator(model, tokenizer, max_new_tokens=new_tokens, batch_size=batch_size,
+                                         reuse_kv=reuse_kv)
+            qa._process_pages(pages[:1], code_blocks, generator)  # Warm-up
+            generator.tokens_reused = 0
+            started = time.perf_counter()
+            qa._process_pages(pages, code_blocks, generator)
+            timings[label] = time.perf_counter() - started
+        report[name] = {
+            # One new token per question and answer, so this is almost all prefill
+            'prefill_ms_per_row': round(timings['prefill'] / rows * 1000, 3),
+            'ms_per_row': round(timings['generate'] / rows * 1000, 3),
+            'prompt_tokens_reused_per_row': round(generator.tokens_reused / rows, 1),
+        }
+    report['prefill_speedup'] = round(report['full_prompts']['prefill_ms_per_row'] / report['kv_reuse']['prefill_ms_per_row'], 2)
+    report['speedup'] = round(report['full_prompts']['ms_per_row'] / report['kv_reuse']['ms_per_row'], 2)
+    return report
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Q&A generation time per row with and without KV-cache reuse')
+    parser.add_argument('--model', default=None, help='Model name or path (default: a random tiny Llama built offline)')
+    parser.add_argument('--pages', type=int, default=16)
+    parser.add_argument('--code-blocks', type=int, default=3, help='Code blocks per page')
+    parser.add_argument('--max-new-tokens', type=int, default=32)
+    parser.add_argument('--batch-size', type=int, default=16)
+    parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+    args = parser.parse_args()
+    transformers.logging.set_verbosity_error()
+
+    tokenizer, model = load_model(args.model) if args.model else random_model()
+    pages, code_blocks = generate_pages(args.pages, args.code_blocks)
+    report = run(tokenizer, model, pages, code_blocks, args.max_new_tokens, args.batch_size)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"{report['rows']} rows (question + answer each), model {getattr(model, 'name_or_path', '')}")
+        print(f"{'mode':<16}{'prefill ms/row':>16}{'ms/row':>12}{'tokens reused/row':>20}")
+        for name in ('full_prompts', 'kv_reuse'):
+            row = report[name]
+            print(f"{name:<16}{row['prefill_ms_per_row']:>16.3f}{row['ms_per_row']:>12.3f}{row['prompt_tokens_reused_per_row']:>20}")
+        print(f"prefill speedup {report['prefill_speedup']}x, end-to-end speedup {report['speedup']}x")
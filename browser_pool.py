@@ -0,0 +1,213 @@
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from itertools import count
+from random import choice
+
+import psutil
+from selenium import webdriver
+from selenium.webdriver.chrome.options import Options
+from selenium.webdriver.chrome.service import Service
+from selenium.webdriver.support.ui import WebDriverWait
+
+from scrape_settings import (
+    USER_AGENTS, BROWSER_POOL_SIZE, BROWSER_MAX_PAGES, BROWSER_MAX_RSS,
+    BROWSER_PAGE_LOAD_TIMEOUT, CHROME_BINARY, CHROMEDRIVER_PATH
+)
+
+# Function to build a headless Chrome driver with its own user agent and proxy
+def create_driver(user_agent, proxy=None):
+    options = Options()
+    options.add_argument("--headless=new")
+    options.add_argument(f'user-agent={user_agent}')
+    if proxy:
+        options.add_argument(f'--proxy-server={proxy}')
+    if CHROME_BINARY:
+        options.binary_location = CHROME_BINARY
+    service = Service(executable_path=CHROMEDRIVER_PATH) if CHROMEDRIVER_PATH else Service()
+    driver = webdriver.Chrome(service=service, options=options)
+    driver.set_page_load_timeout(BROWSER_PAGE_LOAD_TIMEOUT)
+    return driver
+
+# Function to measure the resident memory of a driver and all of its Chrome children
+def driver_rss_mb(driver):
+    try:
+        process = psutil.Process(driver.service.process.pid)
+        processes = [process] + process.children(recursive=True)
+    except (AttributeError, psutil.Error):
+        return 0.0
+    rss = 0
+    for proc in processes:
+        try:
+            rss += proc.memory_info().rss
+        except psutil.Error:
+            continue
+    return rss / 1024 / 1024
+
+# A single Chrome instance leased out of a BrowserPool. Selenium is synchronous,
+# so every driver call runs on a worker thread to keep the event loop free.
+class PooledBrowser:
+    def __init__(self, browser_id, user_agent, proxy=None):
+        self.browser_id = browser_id
+        self.user_agent = user_agent
+        self.proxy = proxy
+        self.pages_served = 0
+        self.script_timeout = None
+        self.generation = 0
+        self.driver = create_driver(user_agent, proxy)
+
+    async def run(self, fn, *args, **kwargs):
+        return await asyncio.to_thread(fn, *args, **kwargs)
+
+    async def get(self, url):
+        await self.run(self.driver.get, url)
+
+    async def execute_script(self, script, *args):
+        return await self.run(self.driver.execute_script, script, *args)
+
+    async def execute_async_script(self, script, *args):
+        return await self.run(self.driver.execute_async_script, script, *args)
+
+    async def set_script_timeout(self, seconds):
+        if seconds != self.script_timeout:
+            await self.run(self.driver.set_script_timeout, seconds)
+            self.script_timeout = seconds
+
+    async def find_element(self, by, value):
+        return await self.run(self.driver.find_element, by, value)
+
+    async def find_elements(self, by, value):
+        return await self.run(self.driver.find_elements, by, value)
+
+    async def click(self, element):
+        await self.run(element.click)
+
+    async def wait_until(self, condition, timeout=10):
+        return await self.run(WebDriverWait(self.driver, timeout).until, condition)
+
+    async def title(self):
+        return await self.run(lambda: self.driver.title)
+
+    async def page_source(self):
+        return await self.run(lambda: self.driver.page_source)
+
+    async def current_url(self):
+        return await self.run(lambda: self.driver.current_url)
+
+    async def is_healthy(self):
+        try:
+            return await asyncio.wait_for(self.execute_script("return 1"), timeout=5) == 1
+        except Exception as e:
+            logging.warning(f"Browser {self.browser_id} failed health check: {str(e)}")
+            return False
+
+    async def rss_mb(self):
+        return await self.run(driver_rss_mb, self.driver)
+
+    async def quit(self):
+        try:
+            await self.run(self.driver.quit)
+        except Exception as e:
+            logging.debug(f"Error quitting browser {self.browser_id}: {str(e)}")
+
+# Fixed-size pool of reusable headless browsers. Browsers start lazily, are leased
+# through acquire/release (or lease()), and are recycled after max_pages page loads
+# or once their process tree grows past max_rss MB.
+class BrowserPool:
+    def __init__(self, size=BROWSER_POOL_SIZE, max_pages=BROWSER_MAX_PAGES, max_rss=BROWSER_MAX_RSS,
+                 user_agents=None, proxies=None):
+        self.size = size
+        self.max_pages = max_pages
+        self.max_rss = max_rss
+        self.user_agents = user_agents or USER_AGENTS
+        self.proxies = proxies or []
+        self._ids = count(1)
+        self.generation = 0
+        self._idle = []
+        self._browsers = set()
+        self._slots = None
+        self.closed = False
+
+    @property
+    def in_use(self):
+        return len(self._browsers) - len(self._idle)
+
+    def _ensure_slots(self):
+        # Created on first use so the pool can be built outside a running loop
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.size)
+        return self._slots
+
+    async def _launch(self):
+        proxy = choice(self.proxies) if self.proxies else None
+        browser_id = next(self._ids)
+        browser = await asyncio.to_thread(PooledBrowser, browser_id, choice(self.user_agents), proxy)
+        browser.generation = self.generation
+        self._browsers.add(browser)
+        logging.info(f"Started browser {browser_id} (proxy={proxy})")
+        return browser
+
+    async def _discard(self, browser, reason):
+        logging.info(f"Recycling browser {browser.browser_id} after {browser.pages_served} pages: {reason}")
+        self._browsers.discard(browser)
+        await browser.quit()
+
+    async def acquire(self):
+        if self.closed:
+            raise RuntimeError("Browser pool is closed")
+        await self._ensure_slots().acquire()
+        try:
+            while self._idle:
+                browser = self._idle.pop()
+                if await browser.is_healthy():
+                    return browser
+                await self._discard(browser, "unhealthy")
+            return await self._launch()
+        except BaseException:
+            self._slots.release()
+            raise
+
+    async def release(self, browser, healthy=True):
+        try:
+            browser.pages_served += 1
+            if self.closed or not healthy:
+                await self._discard(browser, "closed" if self.closed else "marked unhealthy")
+            elif browser.generation < self.generation:
+                await self._discard(browser, "recycle requested")
+            elif self.max_pages and browser.pages_served >= self.max_pages:
+                await self._discard(browser, "page limit reached")
+            elif self.max_rss and (rss := await browser.rss_mb()) > self.max_rss:
+                await self._discard(browser, f"RSS {rss:.0f} MB > {self.max_rss} MB")
+            else:
+                self._idle.append(browser)
+        finally:
+            self._slots.release()
+
+    @asynccontextmanager
+    async def lease(self):
+        browser = await self.acquire()
+        healthy = True
+        try:
+            yield browser
+        except BaseException:
+            healthy = await browser.is_healthy()
+            raise
+        finally:
+            await self.release(browser, healthy=healthy)
+
+    async def recycle_idle(self):
+        idle, self._idle = self._idle, []
+        await asyncio.gather(*[self._discard(browser, "recycle requested") for browser in idle])
+
+    # Resident memory of every running browser, idle or leased, with its Chrome children
+    async def rss_mb(self):
+        return sum(await asyncio.gather(*[browser.rss_mb() for browser in list(self._browsers)]))
+
+    # Restart every browser: idle ones now, leased ones when they are released
+    async def recycle_all(self):
+        self.generation += 1
+        await self.recycle_idle()
+
+    async def close(self):
+        self.closed = True
+        await self.recycle_idle()
@@ -0,0 +1,336 @@
+import argparse
+import asyncio
+import hashlib
+import logging
+import random
+import sqlite3
+import time
+
+import aiosqlite
+
+from scrape_settings import (
+    DB_PATH, DB_BATCH_SIZE, DB_FLUSH_INTERVAL, DB_QUEUE_SIZE, DB_BUSY_RETRIES, DB_BUSY_BACKOFF, DB_BUSY_BACKOFF_MAX
+)
+from telemetry import metrics
+from token_store import CREATE_TOKEN_TYPES, INSERT_TOKEN_TYPES, vocabulary_rows
+
+# Page text and code are stored once per distinct value in blobs, keyed by content hash;
+# pages has one row per URL and code_blocks one row per block, in page order.
+SCHEMA = [
+    '''
+    CREATE TABLE IF NOT EXISTS blobs (
+        hash BLOB PRIMARY KEY,
+        data TEXT NOT NULL
+    ) WITHOUT ROWID
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS pages (
+        id INTEGER PRIMARY KEY,
+        url TEXT NOT NULL UNIQUE,
+        title TEXT,
+        content_hash BLOB REFERENCES blobs (hash),
+        source_type TEXT,
+        updated_at REAL,
+        fingerprint BLOB,
+        changed_at REAL
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS code_blocks (
+        id INTEGER PRIMARY KEY,
+        page_id INTEGER NOT NULL REFERENCES pages (id) ON DELETE CASCADE,
+        ordinal INTEGER NOT NULL,
+        code_hash BLOB NOT NULL REFERENCES blobs (hash),
+        language TEXT,
+        tokens BLOB,
+        UNIQUE (page_id, ordinal)
+    )
+    ''',
+    'CREATE INDEX IF NOT EXISTS pages_content_hash ON pages (content_hash)',
+    'CREATE INDEX IF NOT EXISTS code_blocks_code_hash ON code_blocks (code_hash)',
+    '''
+    CREATE VIEW IF NOT EXISTS page_texts AS
+    SELECT pages.id, pages.url, pages.title, blobs.data AS content, pages.source_type
+    FROM pages LEFT JOIN blobs ON blobs.hash = pages.content_hash
+    ''',
+    '''
+    CREATE VIEW IF NOT EXISTS code_block_texts AS
+    SELECT code_blocks.id, code_blocks.page_id, code_blocks.ordinal, blobs.data AS code,
+           code_blocks.language, code_blocks.tokens
+    FROM code_blocks JOIN blobs ON blobs.hash = code_blocks.code_hash
+    ''',
+]
+
+INSERT_BLOB = 'INSERT OR IGNORE INTO blobs (hash, data) VALUES (?, ?)'
+
+# Columns added after the first pages schema; older databases get them on open
+PAGE_COLUMNS = {'fingerprint': 'BLOB', 'changed_at': 'REAL'}
+
+CREATE_CHANGED_INDEX = 'CREATE INDEX IF NOT EXISTS pages_changed_at ON pages (changed_at)'
+
+SELECT_PAGE = 'SELECT id, fingerprint, content_hash FROM pages WHERE url = ?'
+
+INSERT_PAGE = '''
+    INSERT INTO pages (url, title, content_hash, source_type, updated_at, fingerprint) VALUES (?, ?, ?, ?, ?, ?)
+    RETURNING id
+'''
+
+# changed_at marks pages whose stored content changed after they were first written,
+# so qa_generator can regenerate just those
+UPDATE_PAGE = '''
+    UPDATE pages SET title = ?, content_hash = ?, source_type = ?, updated_at = ?, fingerprint = ?,
+        changed_at = COALESCE(?, changed_at)
+    WHERE id = ?
+'''
+
+TOUCH_PAGE = 'UPDATE pages SET updated_at = ? WHERE id = ?'
+
+DELETE_CODE_BLOCKS = 'DELETE FROM code_blocks WHERE page_id = ?'
+
+INSERT_CODE_BLOCK = '''
+    INSERT INTO code_blocks (page_id, ordinal, code_hash, language, tokens) VALUES (?, ?, ?, ?, ?)
+'''
+
+PRAGMAS = [
+    'PRAGMA journal_mode=WAL',
+    'PRAGMA synchronous=NORMAL',
+    'PRAGMA temp_store=MEMORY',
+    'PRAGMA cache_size=-65536',
+    'PRAGMA busy_timeout=5000',
+    'PRAGMA foreign_keys=ON',
+]
+
+# Function to tell a lock timeout (SQLITE_BUSY and its extended codes) from other errors
+def is_busy(error):
+    return isinstance(error, sqlite3.OperationalError) and (getattr(error, 'sqlite_errorcode', 0) & 0xFF) == sqlite3.SQLITE_BUSY
+
+# Function to compute the content-address of a text value
+def blob_hash(text):
+    return hashlib.blake2b(text.encode('utf-8'), digest_size=16).digest()
+
+# Function to fingerprint everything stored for a page: title, text, and each block's code and language
+def page_fingerprint(title, content_hash, blocks):
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update((title or '').encode('utf-8'))
+    digest.update(content_hash)
+    for code_hash, block in blocks:
+        digest.update(code_hash)
+        digest.update((block['language'] or '').encode('utf-8'))
+    return digest.digest()
+
+# Function to create the normalized tables and views
+async def create_schema(db):
+    for statement in SCHEMA:
+        await db.execute(statement)
+    async with db.execute('PRAGMA table_info(pages)') as cursor:
+        columns = {row[1] for row in await cursor.fetchall()}
+    for column, column_type in PAGE_COLUMNS.items():
+        if column not in columns:
+            await db.execute(f'ALTER TABLE pages ADD COLUMN {column} {column_type}')
+    await db.execute(CREATE_CHANGED_INDEX)
+    await db.execute(CREATE_TOKEN_TYPES)
+    await db.executemany(INSERT_TOKEN_TYPES, vocabulary_rows())
+    await db.commit()
+
+# Function to write page records in the current transaction: upsert the page by URL,
+# replace its code blocks, and insert any text not already present in blobs. A page whose
+# fingerprint matches the stored one only has updated_at bumped.
+async def write_pages(db, pages):
+    blocks_written = 0
+    now = time.time()
+    for page in pages:
+        content = page['content'] or ''
+        content_hash = blob_hash(content)
+        blocks = [(blob_hash(block['code']), block) for block in page['code_blocks']]
+        fingerprint = page_fingerprint(page['title'], content_hash, blocks)
+        async with db.execute(SELECT_PAGE, (page['url'],)) as cursor:
+            existing = await cursor.fetchone()
+        if existing is not None and existing[1] == fingerprint:
+            await db.execute(TOUCH_PAGE, (now, existing[0]))
+            metrics.inc('items_total', kind='pages_unchanged')
+            continue
+        await db.executemany(INSERT_BLOB, [(content_hash, content)] + [(code_hash, block['code']) for code_hash, block in blocks])
+        source_type = page.get('source_type', 'unknown')
+        if existing is None:
+            async with db.execute(INSERT_PAGE, (page['url'], page['title'], content_hash, source_type,
+                                                now, fingerprint)) as cursor:
+                page_id = (await cursor.fetchone())[0]
+        else:
+            page_id, old_fingerprint, old_content_hash = existing
+            # Rows from before fingerprints only count as changed when their text differs
+            changed = old_fingerprint is not None or old_content_hash != content_hash
+            await db.execute(UPDATE_PAGE, (page['title'], content_hash, source_type, now, fingerprint,
+                                           now if changed else None, page_id))
+        await db.execute(DELETE_CODE_BLOCKS, (page_id,))
+        await db.executemany(INSERT_CODE_BLOCK, [(page_id, ordinal, code_hash, block['language'], block['tokens'])
+                                                 for ordinal, (code_hash, block) in enumerate(blocks)])
+        blocks_written += len(blocks)
+    return blocks_written
+
+# Function to move rows from the old one-row-per-code-block code_data table into the
+# normalized schema. Rows are streamed in (url, id) order through an index, so only the
+# current page is held in memory (its first row's title and content win), and pages are
+# written and committed chunk_pages at a time. The old table is kept as code_data_legacy;
+# an interrupted run is safe to repeat, since rewriting an unchanged page only touches it.
+async def migrate_code_data(db, chunk_rows=5000, chunk_pages=DB_BATCH_SIZE):
+    async with db.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'code_data'") as cursor:
+        if await cursor.fetchone() is None:
+            return 0
+    logging.info("Migrating code_data to the pages/code_blocks schema")
+    await db.execute('CREATE INDEX IF NOT EXISTS code_data_url ON code_data (url, id)')
+    chunk = []
+    page = None
+    migrated = 0
+    pages = 0
+    async with db.execute('SELECT url, title, content, code_block, language, tokens, source_type FROM code_data '
+                          'ORDER BY url, id') as cursor:
+        while True:
+            rows = await cursor.fetchmany(chunk_rows)
+            if not rows:
+                break
+            for url, title, content, code_block, language, tokens, source_type in rows:
+                if page is None or page['url'] != url:
+                    if len(chunk) >= chunk_pages:
+                        await write_pages(db, chunk)
+                        await db.commit()
+                        chunk = []
+                    page = {'url': url, 'title': title, 'content': content, 'source_type': source_type, 'code_blocks': []}
+                    chunk.append(page)
+                    pages += 1
+                if code_block:
+                    page['code_blocks'].append({'code': code_block, 'language': language, 'tokens': tokens})
+            migrated += len(rows)
+    await write_pages(db, chunk)
+    await db.execute('ALTER TABLE code_data RENAME TO code_data_legacy')
+    await db.commit()
+    logging.info(f"Migrated {migrated} code_data rows into {pages} pages")
+    return migrated
+
+# Function to open a database with the writer's pragmas and an up-to-date schema
+async def open_database(path=DB_PATH):
+    db = await aiosqlite.connect(path)
+    try:
+        for pragma in PRAGMAS:
+            await db.execute(pragma)
+        await create_schema(db)
+        await migrate_code_data(db)
+    except BaseException:
+        # aiosqlite's worker thread would otherwise keep the process from exiting
+        await db.close()
+        raise
+    return db
+
+# Long-lived SQLite writer. Page records go through a bounded queue (so producers get
+# backpressure) and are written by one task over one WAL connection, one transaction
+# per batch, flushed by size or after flush_interval seconds. Several writers can share a
+# database (one per crawl shard): a batch that times out on another writer's lock is rolled
+# back and retried with jittered exponential backoff, up to busy_retries times.
+class DBWriter:
+    def __init__(self, db_path=DB_PATH, batch_size=DB_BATCH_SIZE, flush_interval=DB_FLUSH_INTERVAL,
+                 queue_size=DB_QUEUE_SIZE, busy_retries=DB_BUSY_RETRIES, busy_backoff=DB_BUSY_BACKOFF):
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.queue_size = queue_size
+        self.busy_retries = busy_retries
+        self.busy_backoff = busy_backoff
+        self.pages_written = 0
+        self.blocks_written = 0
+        self._queue = None
+        self._db = None
+        self._task = None
+        self._start_lock = None
+
+    @property
+    def queue_depth(self):
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def start(self):
+        if self._start_lock is None:
+            self._start_lock = asyncio.Lock()
+        async with self._start_lock:
+            if self._task is not None:
+                return
+            self._db = await open_database(self.db_path)
+            self._queue = asyncio.Queue(maxsize=self.queue_size)
+            self._task = asyncio.create_task(self._run())
+
+    async def store_data(self, data):
+        if self._task is None:
+            await self.start()
+        if self._task.done():
+            raise RuntimeError("DB writer task has stopped")
+        for page in data:
+            await self._queue.put(page)
+
+    async def _run(self):
+        while True:
+            batch = [await self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            try:
+                started = time.perf_counter()
+                blocks = await self._write_batch(batch)
+                metrics.observe_stage('db_write', time.perf_counter() - started)
+                metrics.inc('items_total', len(batch), kind='pages_written')
+                self.pages_written += len(batch)
+                self.blocks_written += blocks
+            except Exception as e:
+                await self._db.rollback()
+                logging.error(f"Error writing {len(batch)} pages to {self.db_path}: {str(e)}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def _write_batch(self, batch):
+        delay = self.busy_backoff
+        for attempt in range(self.busy_retries + 1):
+            try:
+                blocks = await write_pages(self._db, batch)
+                await self._db.commit()
+                return blocks
+            except sqlite3.OperationalError as e:
+                if not is_busy(e) or attempt == self.busy_retries:
+                    raise
+                await self._db.rollback()
+                metrics.inc('items_total', kind='db_busy_retries')
+                logging.warning(f"{self.db_path} is locked; retrying {len(batch)} pages in {delay:.1f}s")
+                await asyncio.sleep(delay * random.uniform(0.5, 1.5))
+                delay = min(delay * 2, DB_BUSY_BACKOFF_MAX)
+
+    # Wait until every queued page has been committed
+    async def flush(self):
+        if self._task is not None and not self._task.done():
+            await self._queue.join()
+
+    async def close(self):
+        if self._task is None:
+            return
+        await self.flush()
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        await self._db.close()
+        self._task = None
+        logging.info(f"DB writer closed after writing {self.pages_written} pages and {self.blocks_written} code blocks")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Migrate a code_data database to the pages/code_blocks schema')
+    parser.add_argument('db_path', nargs='?', default=DB_PATH)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    async def migrate():
+        db = await open_database(args.db_path)
+        await db.close()
+
+    asyncio.run(migrate())
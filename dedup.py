@@ -0,0 +1,274 @@
+import math
+import mmap
+import os
+from array import array
+from hashlib import blake2b
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+from scrape_settings import DEDUP_BACKEND, DEDUP_INITIAL_CAPACITY, DEDUP_ERROR_RATE, DEDUP_SPILL_DIR
+
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+# Function to canonicalize a URL so trivially different spellings dedup to one key:
+# lowercase scheme/host, no default port, no fragment, sorted query, no trailing slash
+def canonicalize_url(url):
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or '').lower()
+    if parts.port and parts.port != DEFAULT_PORTS.get(scheme):
+        host = f'{host}:{parts.port}'
+    path = parts.path or '/'
+    if len(path) > 1:
+        path = path.rstrip('/') or '/'
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return urlunsplit((scheme, host, path, query, ''))
+
+# Function to hash a string or bytes key to a 64-bit integer
+def hash64(key):
+    if isinstance(key, str):
+        key = key.encode('utf-8', 'surrogatepass')
+    return int.from_bytes(blake2b(key, digest_size=8).digest(), 'little')
+
+# Exact set of 64-bit hashes in one open-addressing array: 8 bytes per slot,
+# ~16 bytes per key at the maximum load factor, versus ~100+ for a set of URL strings.
+class Hash64Set:
+    MAX_LOAD = 0.5
+
+    def __init__(self, capacity=DEDUP_INITIAL_CAPACITY):
+        size = 1 << max(4, math.ceil(math.log2(max(capacity, 1) / self.MAX_LOAD)))
+        self._table = array('Q', bytes(8 * size))
+        self._mask = size - 1
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    @property
+    def nbytes(self):
+        return self._table.itemsize * len(self._table)
+
+    def _slot(self, h):
+        # 0 marks an empty slot, so the (astronomically rare) zero hash is remapped
+        h = h or 1
+        table, mask = self._table, self._mask
+        i = h & mask
+        while table[i] and table[i] != h:
+            i = (i + 1) & mask
+        return i, h
+
+    def __contains__(self, key):
+        i, h = self._slot(hash64(key))
+        return self._table[i] == h
+
+    def add(self, key):
+        return self.add_hash(hash64(key))
+
+    # Returns True when the hash was not present before
+    def add_hash(self, h):
+        i, h = self._slot(h)
+        if self._table[i] == h:
+            return False
+        self._table[i] = h
+        self._count += 1
+        if self._count > self.MAX_LOAD * len(self._table):
+            self._grow()
+        return True
+
+    def _grow(self):
+        old = self._table
+        self._table = array('Q', bytes(16 * len(old)))
+        self._mask = len(self._table) - 1
+        self._count = 0
+        for h in old:
+            if h:
+                self.add_hash(h)
+
+# Fixed-size Bloom filter. Bits live in a bytearray, or in an mmap'd file when a
+# spill path is given so large filters can be paged by the OS instead of the heap.
+# attach=True maps a file another process created (same capacity and error rate)
+# without clearing it; the mapping is shared, and the file is left for its creator.
+class BloomFilter:
+    def __init__(self, capacity, error_rate, path=None, attach=False):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.num_bits = max(64, math.ceil(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        self.count = 0
+        self.path = path
+        self.attached = attach
+        num_bytes = (self.num_bits + 7) // 8
+        if path:
+            self._file = open(path, 'r+b' if attach else 'w+b')
+            if not attach:
+                self._file.truncate(num_bytes)
+            self._bits = mmap.mmap(self._file.fileno(), num_bytes)
+        else:
+            self._file = None
+            self._bits = bytearray(num_bytes)
+
+    @property
+    def nbytes(self):
+        return len(self._bits)
+
+    @property
+    def full(self):
+        return self.count >= self.capacity
+
+    def _positions(self, h):
+        # Enhanced double hashing (Dillinger & Manolios) from the two halves of one 64-bit
+        # hash; plain double hashing lets keys with equal steps share most of their bits
+        m = self.num_bits
+        x, y = (h & 0xFFFFFFFF) % m, (h >> 32) % m
+        positions = []
+        for i in range(self.num_hashes):
+            positions.append(x)
+            x = (x + y) % m
+            y = (y + i) % m
+        return positions
+
+    def contains_hash(self, h):
+        bits = self._bits
+        return all(bits[p >> 3] & (1 << (p & 7)) for p in self._positions(h))
+
+    # Returns True when at least one bit was newly set, i.e. the key was definitely new
+    def add_hash(self, h):
+        bits = self._bits
+        new = False
+        for p in self._positions(h):
+            byte, mask = p >> 3, 1 << (p & 7)
+            if not bits[byte] & mask:
+                bits[byte] |= mask
+                new = True
+        if new:
+            self.count += 1
+        return new
+
+    def close(self):
+        if self._file is not None:
+            self._bits.close()
+            self._file.close()
+            if not self.attached:
+                os.remove(self.path)
+            self._file = None
+
+# Bloom filter that grows by chaining slices of doubling capacity and tightening error
+# rate (Almeida et al.), so the overall false-positive rate stays near error_rate.
+class ScalableBloomFilter:
+    GROWTH = 2
+    TIGHTENING = 0.8
+
+    def __init__(self, initial_capacity=DEDUP_INITIAL_CAPACITY, error_rate=DEDUP_ERROR_RATE, spill_dir=DEDUP_SPILL_DIR,
+                 name='dedup'):
+        self.initial_capacity = initial_capacity
+        self.error_rate = error_rate
+        self.spill_dir = spill_dir
+        self.name = name
+        self._filters = []
+        self._count = 0
+        if spill_dir:
+            os.makedirs(spill_dir, exist_ok=True)
+        self._add_slice()
+
+    def _add_slice(self):
+        index = len(self._filters)
+        capacity = self.initial_capacity * self.GROWTH ** index
+        error_rate = self.error_rate * (1 - self.TIGHTENING) * self.TIGHTENING ** index
+        path = os.path.join(self.spill_dir, f'{self.name}.{os.getpid()}.{index}.bloom') if self.spill_dir else None
+        self._filters.append(BloomFilter(capacity, error_rate, path))
+
+    def __len__(self):
+        return self._count
+
+    @property
+    def nbytes(self):
+        return sum(f.nbytes for f in self._filters)
+
+    def __contains__(self, key):
+        return self.contains_hash(hash64(key))
+
+    def contains_hash(self, h):
+        return any(f.contains_hash(h) for f in reversed(self._filters))
+
+    def add(self, key):
+        return self.add_hash(hash64(key))
+
+    def add_hash(self, h):
+        if self.contains_hash(h):
+            return False
+        if self._filters[-1].full:
+            self._add_slice()
+        self._filters[-1].add_hash(h)
+        self._count += 1
+        return True
+
+    def close(self):
+        for f in self._filters:
+            f.close()
+
+# Function to build the configured membership structure ('bloom' or 'hashset')
+def make_filter(backend=DEDUP_BACKEND, name='dedup', **kwargs):
+    if backend == 'hashset':
+        return Hash64Set(kwargs.get('initial_capacity', DEDUP_INITIAL_CAPACITY))
+    if backend == 'bloom':
+        return ScalableBloomFilter(name=name, **kwargs)
+    raise ValueError(f"Unknown dedup backend: {backend}")
+
+# URL dedup: canonicalizes before hashing so /docs/, /docs and /docs#intro are one URL
+class URLDedup:
+    def __init__(self, backend=DEDUP_BACKEND, **kwargs):
+        self.filter = make_filter(backend, name='urls', **kwargs)
+
+    def __len__(self):
+        return len(self.filter)
+
+    def __contains__(self, url):
+        return canonicalize_url(url) in self.filter
+
+    def add(self, url):
+        return self.filter.add(canonicalize_url(url))
+
+    def close(self):
+        if hasattr(self.filter, 'close'):
+            self.filter.close()
+
+# Content dedup over a fixed-width 64-bit digest of the page text and its code blocks
+class ContentDedup:
+    def __init__(self, backend=DEDUP_BACKEND, **kwargs):
+        self.filter = make_filter(backend, name='content', **kwargs)
+
+    def __len__(self):
+        return len(self.filter)
+
+    @staticmethod
+    def fingerprint(content, code_blocks):
+        digest = blake2b(digest_size=8)
+        digest.update(content.encode('utf-8', 'surrogatepass'))
+        for code in code_blocks:
+            digest.update(code.encode('utf-8', 'surrogatepass'))
+        return int.from_bytes(digest.digest(), 'little')
+
+    def add(self, content, code_blocks):
+        return self.filter.add_hash(self.fingerprint(content, code_blocks))
+
+    def add_fingerprint(self, fingerprint):
+        return self.filter.add_hash(fingerprint)
+
+    def close(self):
+        if hasattr(self.filter, 'close'):
+            self.filter.close()
+
+# Content dedup shared by the workers of a sharded crawl (see shard.py): every worker maps
+# the same fixed-size Bloom filter file, and a cross-process lock makes check-and-add
+# atomic so two workers can't both store one page. It can't grow like ScalableBloomFilter,
+# since each worker would add its own slices, so the capacity is set up front.
+class SharedContentDedup(ContentDedup):
+    def __init__(self, path, lock, capacity, error_rate=DEDUP_ERROR_RATE):
+        self.filter = BloomFilter(capacity, error_rate, path, attach=True)
+        self.lock = lock
+
+    def add(self, content, code_blocks):
+        return self.add_fingerprint(self.fingerprint(content, code_blocks))
+
+    def add_fingerprint(self, fingerprint):
+        with self.lock:
+            return self.filter.add_hash(fingerprint)
@@ -0,0 +1,145 @@
+import logging
+import re
+from urllib.parse import urlparse
+
+from aiohttp import ClientSession, ClientTimeout, TCPConnector
+
+from scrape_settings import (
+    USER_AGENTS, CONCURRENT_REQUESTS, STATIC_FETCH_TIMEOUT, STATIC_MIN_TEXT_CHARS, SPA_SHELL_MARKERS,
+    STATIC_ESCALATE_AFTER, STATIC_REPROBE_EVERY
+)
+
+NOSCRIPT_PATTERN = re.compile(r'<noscript[^>]*>(.*?)</noscript>', re.IGNORECASE | re.DOTALL)
+NOSCRIPT_HINTS = ('enable javascript', 'javascript is disabled', 'requires javascript', 'javascript to run this app')
+SCRIPT_STYLE_PATTERN = re.compile(r'<(script|style|noscript|template)[^>]*>.*?</\1>', re.IGNORECASE | re.DOTALL)
+TAG_PATTERN = re.compile(r'<[^>]+>')
+
+# Function to estimate how much visible text a raw HTML document carries
+def visible_text_length(html):
+    text = TAG_PATTERN.sub(' ', SCRIPT_STYLE_PATTERN.sub(' ', html))
+    return len(re.sub(r'\s+', ' ', text).strip())
+
+# Function to decide whether static HTML is incomplete without running JavaScript.
+# Returns the reason as a string so the escalation can be logged, or None.
+def needs_javascript(html):
+    if not html or not html.strip():
+        return 'empty body'
+    text_length = visible_text_length(html)
+    if text_length < STATIC_MIN_TEXT_CHARS:
+        return f'only {text_length} characters of text'
+    # Server-rendered pages often carry these markers too, so they only count on thin pages
+    if text_length < STATIC_MIN_TEXT_CHARS * 5:
+        lowered = html.lower()
+        for noscript in NOSCRIPT_PATTERN.findall(lowered):
+            if any(hint in noscript for hint in NOSCRIPT_HINTS):
+                return 'noscript marker'
+        for marker in SPA_SHELL_MARKERS:
+            if marker in lowered:
+                return f'SPA shell ({marker})'
+    return None
+
+# Static-first fetch tier. Pages are taken from the Scrapy response (or a pooled
+# aiohttp session) and only escalated to a browser when needs_javascript() says so.
+# A domain goes browser-first after escalate_after escalations in a row, so one thin
+# 404 or redirect stub doesn't send a server-rendered site through Selenium, and every
+# reprobe_every-th page of a browser-first domain still tries the static tier first.
+class TieredFetcher:
+    STATIC = 'static'
+    BROWSER = 'browser'
+
+    def __init__(self, concurrency=CONCURRENT_REQUESTS, politeness=None, escalate_after=STATIC_ESCALATE_AFTER,
+                 reprobe_every=STATIC_REPROBE_EVERY):
+        self.concurrency = concurrency
+        self.politeness = politeness
+        self.escalate_after = escalate_after
+        self.reprobe_every = reprobe_every
+        self.domain_modes = {}
+        self.escalations = {}
+        self.browser_pages = {}
+        self._session = None
+
+    @staticmethod
+    def domain(url):
+        return urlparse(url).netloc.lower()
+
+    def prefers_browser(self, url):
+        return self.domain_modes.get(self.domain(url)) == self.BROWSER
+
+    def remember(self, url, mode):
+        domain = self.domain(url)
+        if self.domain_modes.get(domain) != mode:
+            logging.info(f"Using {mode} fetch tier for {domain}")
+        self.domain_modes[domain] = mode
+        if mode == self.STATIC:
+            self.escalations.pop(domain, None)
+            self.browser_pages.pop(domain, None)
+
+    # Count a page that needed JavaScript; the domain turns browser-first after enough in a row
+    def escalate(self, url):
+        domain = self.domain(url)
+        count = self.escalations.get(domain, 0) + 1
+        self.escalations[domain] = count
+        if count >= self.escalate_after:
+            self.remember(url, self.BROWSER)
+
+    # True when a page of a browser-first domain should go straight to the browser,
+    # i.e. every page but each reprobe_every-th one
+    def skip_static(self, url):
+        if not self.prefers_browser(url):
+            return False
+        domain = self.domain(url)
+        pages = self.browser_pages.get(domain, 0) + 1
+        self.browser_pages[domain] = pages
+        return not self.reprobe_every or pages % self.reprobe_every != 0
+
+    async def session(self):
+        if self._session is None or self._session.closed:
+            self._session = ClientSession(
+                connector=TCPConnector(limit=self.concurrency * 4, limit_per_host=self.concurrency),
+                timeout=ClientTimeout(total=STATIC_FETCH_TIMEOUT),
+                headers={'User-Agent': USER_AGENTS[0]}
+            )
+        return self._session
+
+    async def fetch_html(self, url):
+        if self.politeness is None:
+            return await self._get_html(url)
+        async with self.politeness.slot(url) as lease:
+            return await self._get_html(url, lease)
+
+    async def _get_html(self, url, lease=None):
+        session = await self.session()
+        async with session.get(url) as resp:
+            if lease is not None:
+                lease.status = resp.status
+                lease.retry_after = resp.headers.get('Retry-After')
+            if resp.status >= 400 or 'html' not in resp.headers.get('Content-Type', 'text/html'):
+                return None
+            return await resp.text(errors='replace')
+
+    # Returns static HTML that is good enough to extract from, or None when the page
+    # needs a browser render. A browser-first domain skips straight to None, except on re-probes.
+    async def fetch_static(self, response):
+        if self.skip_static(response.url):
+            return None
+        html = None
+        try:
+            html = response.text if response.body else None
+        except AttributeError:
+            html = None  # Non-text response
+        if html is None:
+            try:
+                html = await self.fetch_html(response.url)
+            except Exception as e:
+                logging.debug(f"Static fetch failed for {response.url}: {str(e)}")
+        reason = needs_javascript(html)
+        if reason:
+            logging.info(f"Escalating {response.url} to browser: {reason}")
+            self.escalate(response.url)
+            return None
+        self.remember(response.url, self.STATIC)
+        return html
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
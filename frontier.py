@@ -0,0 +1,185 @@
+import logging
+import sqlite3
+import time
+from urllib.parse import urlparse
+
+from scrape_settings import FRONTIER_PATH, FRONTIER_CHECKPOINT_EVERY, FRONTIER_CHECKPOINT_INTERVAL
+
+QUEUED = 'queued'
+IN_FLIGHT = 'in_flight'
+DONE = 'done'
+FAILED = 'failed'
+
+CREATE_FRONTIER = '''
+    CREATE TABLE IF NOT EXISTS frontier (
+        url TEXT PRIMARY KEY,
+        host TEXT,
+        state TEXT NOT NULL DEFAULT 'queued',
+        priority INTEGER NOT NULL DEFAULT 0,
+        depth INTEGER NOT NULL DEFAULT 0,
+        callback TEXT NOT NULL DEFAULT 'parse',
+        attempts INTEGER NOT NULL DEFAULT 0,
+        updated_at REAL,
+        etag TEXT,
+        last_modified TEXT,
+        body_hash BLOB
+    )
+'''
+
+# Validators added after the first frontier schema; older frontier files get them on open
+VALIDATOR_COLUMNS = {'etag': 'TEXT', 'last_modified': 'TEXT', 'body_hash': 'BLOB'}
+
+CREATE_FRONTIER_INDEX = '''
+    CREATE INDEX IF NOT EXISTS frontier_state ON frontier (state, priority DESC, depth)
+'''
+
+CREATE_FRONTIER_HOST_INDEX = '''
+    CREATE INDEX IF NOT EXISTS frontier_host ON frontier (state, host, priority DESC, depth)
+'''
+
+# Up to per_host best queued URLs of every host that has any. Hosts are enumerated with a
+# loose index scan (each step seeks frontier_host to the next host), and each host's URLs
+# come from a LIMIT over the same index, so a lease reads hosts x per_host rows no matter
+# how many URLs are queued
+SELECT_HOST_HEADS = '''
+    WITH RECURSIVE hosts (host) AS (
+        SELECT MIN(host) FROM frontier WHERE state = :state
+        UNION ALL
+        SELECT (SELECT MIN(host) FROM frontier WHERE state = :state AND host > hosts.host) FROM hosts
+        WHERE hosts.host IS NOT NULL
+    )
+    SELECT queued.url, queued.depth, queued.callback, queued.host, queued.priority
+    FROM hosts JOIN frontier AS queued ON queued.rowid IN (
+        SELECT rowid FROM frontier WHERE state = :state AND host = hosts.host
+        ORDER BY priority DESC, depth LIMIT :per_host
+    )
+'''
+
+# Disk-backed crawl frontier. Every URL the spider has seen is a row whose state moves
+# queued -> in_flight -> done/failed; state changes are committed in checkpoints so a
+# crash or a 'q' in main() loses at most one checkpoint of progress. Leases that were
+# in flight when the previous run died are re-queued on open. Each URL also keeps the
+# ETag, Last-Modified and body hash of its last fetch for conditional re-crawls.
+class Frontier:
+    def __init__(self, path=FRONTIER_PATH, checkpoint_every=FRONTIER_CHECKPOINT_EVERY,
+                 checkpoint_interval=FRONTIER_CHECKPOINT_INTERVAL):
+        self.path = path
+        self.checkpoint_every = checkpoint_every
+        self.checkpoint_interval = checkpoint_interval
+        self.conn = sqlite3.connect(path)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute(CREATE_FRONTIER)
+        columns = {row[1] for row in self.conn.execute('PRAGMA table_info(frontier)')}
+        for column, column_type in VALIDATOR_COLUMNS.items():
+            if column not in columns:
+                self.conn.execute(f'ALTER TABLE frontier ADD COLUMN {column} {column_type}')
+        self.conn.execute(CREATE_FRONTIER_INDEX)
+        self.conn.execute(CREATE_FRONTIER_HOST_INDEX)
+        self._pending_changes = 0
+        self._last_checkpoint = time.monotonic()
+        recovered = self.conn.execute(
+            'UPDATE frontier SET state = ? WHERE state = ?', (QUEUED, IN_FLIGHT)
+        ).rowcount
+        self.conn.commit()
+        if recovered:
+            logging.info(f"Re-queued {recovered} URLs left in flight by a previous run")
+
+    def _changed(self, count=1):
+        self._pending_changes += count
+        if (self._pending_changes >= self.checkpoint_every
+                or time.monotonic() - self._last_checkpoint >= self.checkpoint_interval):
+            self.checkpoint()
+
+    def checkpoint(self):
+        self.conn.commit()
+        self._pending_changes = 0
+        self._last_checkpoint = time.monotonic()
+
+    # Queue URLs that have never been seen; returns how many were new
+    def add(self, urls, depth=0, priority=0, callback='parse'):
+        now = time.time()
+        before = self.conn.total_changes
+        self.conn.executemany(
+            'INSERT OR IGNORE INTO frontier (url, host, priority, depth, callback, updated_at) VALUES (?, ?, ?, ?, ?, ?)',
+            [(url, urlparse(url).netloc.lower(), priority, depth, callback, now) for url in urls]
+        )
+        added = self.conn.total_changes - before
+        if added:
+            self._changed(added)
+        return added
+
+    # Move up to n queued URLs to in_flight, highest priority and shallowest first. With
+    # per_host, hosts are interleaved and no host gets more than per_host URLs in flight,
+    # counting the in_flight mapping of host -> URLs the caller already holds.
+    def lease(self, n, per_host=None, in_flight=None):
+        if per_host is None:
+            rows = self.conn.execute(
+                'SELECT url, depth, callback FROM frontier WHERE state = ? ORDER BY priority DESC, depth LIMIT ?',
+                (QUEUED, n)
+            ).fetchall()
+        else:
+            rows = self._lease_interleaved(n, per_host, in_flight or {})
+        if rows:
+            self.conn.executemany(
+                'UPDATE frontier SET state = ?, attempts = attempts + 1, updated_at = ? WHERE url = ?',
+                [(IN_FLIGHT, time.time(), url) for url, _, _ in rows]
+            )
+            self._changed(len(rows))
+        return rows
+
+    # Ranks each host's URLs and takes the best URL of every host before the second-best of
+    # any, interleaving hosts instead of draining one at a time
+    def _lease_interleaved(self, n, per_host, in_flight):
+        heads = {}
+        for url, depth, callback, host, priority in self.conn.execute(SELECT_HOST_HEADS,
+                                                                      {'state': QUEUED, 'per_host': per_host}):
+            heads.setdefault(host, []).append((-priority, depth, url, callback))
+        ranked = []
+        for host, queued in heads.items():
+            queued.sort()
+            room = max(0, per_host - in_flight.get(host, 0))
+            ranked.extend((rank, *entry) for rank, entry in enumerate(queued[:room]))
+        ranked.sort()
+        return [(url, depth, callback) for _, _, depth, url, callback in ranked[:n]]
+
+    def _set_state(self, url, state):
+        self.conn.execute('UPDATE frontier SET state = ?, updated_at = ? WHERE url = ?', (state, time.time(), url))
+        self._changed()
+
+    def mark_done(self, url):
+        self._set_state(url, DONE)
+
+    def mark_failed(self, url):
+        self._set_state(url, FAILED)
+
+    # Returns (etag, last_modified, body_hash) stored from the last successful fetch of url
+    def validators(self, url):
+        row = self.conn.execute('SELECT etag, last_modified, body_hash FROM frontier WHERE url = ?', (url,)).fetchone()
+        return row or (None, None, None)
+
+    def set_validators(self, url, etag, last_modified, body_hash):
+        self.conn.execute('UPDATE frontier SET etag = ?, last_modified = ?, body_hash = ? WHERE url = ?',
+                          (etag, last_modified, body_hash, url))
+        self._changed()
+
+    # Queue every finished URL again for an incremental re-crawl; their validators are kept,
+    # so unchanged pages come back as 304s or matching body hashes
+    def requeue_done(self):
+        count = self.conn.execute('UPDATE frontier SET state = ? WHERE state = ?', (QUEUED, DONE)).rowcount
+        self.checkpoint()
+        return count
+
+    def requeue_failed(self):
+        count = self.conn.execute('UPDATE frontier SET state = ? WHERE state = ?', (QUEUED, FAILED)).rowcount
+        self.checkpoint()
+        return count
+
+    def counts(self):
+        counts = dict.fromkeys((QUEUED, IN_FLIGHT, DONE, FAILED), 0)
+        counts.update(self.conn.execute('SELECT state, COUNT(*) FROM frontier GROUP BY state').fetchall())
+        return counts
+
+    def close(self):
+        self.checkpoint()
+        self.conn.close()
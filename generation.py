@@ -0,0 +1,252 @@
+import logging
+import time
+
+import torch
+from transformers import AutoTokenizer, AutoModelForCausalLM, pipeline
+
+from generation_cache import generation_key
+from telemetry import metrics
+from scrape_settings import (
+    QA_MODEL, QA_MAX_NEW_TOKENS, QA_BATCH_SIZE, QA_MAX_BATCH_TOKENS, QA_TEMPERATURE, QA_TOP_P,
+    QA_REPETITION_PENALTY, QA_REUSE_KV_CACHE
+)
+
+# Function to load a causal LM and its tokenizer: fp16 across available GPUs, fp32 on CPU
+def load_model(model_name=QA_MODEL):
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    if torch.cuda.is_available():
+        model = AutoModelForCausalLM.from_pretrained(model_name, torch_dtype=torch.float16, device_map='auto')
+    else:
+        model = AutoModelForCausalLM.from_pretrained(model_name, torch_dtype=torch.float32)
+    # Decoder-only models continue from the last position, so batches must be left-padded
+    tokenizer.padding_side = 'left'
+    if tokenizer.pad_token is None:
+        tokenizer.pad_token = tokenizer.eos_token
+    return tokenizer, model
+
+# Function to split prompts into batches of similar length. Prompts are taken longest first,
+# so padding stays small and a batch that doesn't fit in memory fails at the start of a run.
+# A batch closes at max_batch_size prompts or when batch size x (longest prompt + new tokens)
+# would exceed max_batch_tokens. key (descending) replaces prompt length as the order.
+def plan_batches(lengths, max_new_tokens, max_batch_size=QA_BATCH_SIZE, max_batch_tokens=QA_MAX_BATCH_TOKENS, key=None):
+    order = sorted(range(len(lengths)), key=key or lengths.__getitem__, reverse=True)
+    batches = []
+    batch = []
+    longest = 0
+    for index in order:
+        if batch:
+            padded_length = max(longest, lengths[index]) + max_new_tokens
+            if len(batch) == max_batch_size or padded_length * (len(batch) + 1) > max_batch_tokens:
+                batches.append(batch)
+                batch = []
+                longest = 0
+        batch.append(index)
+        longest = max(longest, lengths[index])
+    if batch:
+        batches.append(batch)
+    return batches
+
+# Function to build the prompt for a follow-up generation (e.g. the answer to a generated question)
+def followup_prompt(prompt, completion, followup):
+    return f"{prompt}\n{completion}{followup}"
+
+# Function to count the leading tokens two id lists share
+def common_prefix_length(a, b):
+    n = 0
+    for x, y in zip(a, b):
+        if x != y:
+            break
+        n += 1
+    return n
+
+# Batched text generation over a transformers pipeline. generate() takes any number of
+# prompts, runs them in length-sorted dynamic batches and returns only the generated
+# continuations, in input order. With a GenerationCache, cached prompts and repeats within
+# one call are not sent to the model.
+# generate_with_followup() generates a completion and then a follow-up to prompt plus that
+# completion. With reuse_kv, prompts sharing a prefix (the same page context) have it
+# prefilled once per batch, and the follow-up continues from the first pass's KV cache
+# instead of encoding the prompt and completion again.
+class BatchedGenerator:
+    def __init__(self, model, tokenizer, max_new_tokens=QA_MAX_NEW_TOKENS, batch_size=QA_BATCH_SIZE,
+                 max_batch_tokens=QA_MAX_BATCH_TOKENS, temperature=QA_TEMPERATURE, top_p=QA_TOP_P,
+                 repetition_penalty=QA_REPETITION_PENALTY, cache=None, reuse_kv=QA_REUSE_KV_CACHE):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.model_id = getattr(model, 'name_or_path', type(model).__name__)
+        self.cache = cache
+        self.max_new_tokens = max_new_tokens
+        self.batch_size = batch_size
+        self.max_batch_tokens = max_batch_tokens
+        self.pipe = pipeline("text-generation", model=model, tokenizer=tokenizer)
+        self.generation_kwargs = {
+            'max_new_tokens': max_new_tokens,
+            'return_full_text': False,
+            'do_sample': True,
+            'temperature': temperature,
+            'top_p': top_p,
+            'repetition_penalty': repetition_penalty,
+            'pad_token_id': tokenizer.pad_token_id,
+        }
+        self.reuse_kv = reuse_kv
+        self.prompts_generated = 0
+        self.batches_run = 0
+        self.tokens_reused = 0
+
+    def _key(self, prompt):
+        params = {k: v for k, v in self.generation_kwargs.items() if k != 'pad_token_id'}
+        return generation_key(self.model_id, params, prompt)
+
+    def generate(self, prompts):
+        if not prompts:
+            return []
+        if self.cache is None:
+            return self._generate(prompts)
+        keys = [self._key(prompt) for prompt in prompts]
+        cached = self.cache.get_many(keys)
+        missing = {}
+        for key, prompt in zip(keys, prompts):
+            if key not in cached:
+                missing.setdefault(key, prompt)
+        if missing:
+            generated = self._generate(list(missing.values()))
+            new_items = list(zip(missing.keys(), generated))
+            self.cache.put_many(new_items)
+            cached.update(new_items)
+        return [cached[key] for key in keys]
+
+    def _generate(self, prompts):
+        lengths = [len(ids) for ids in self.tokenizer(prompts)['input_ids']]
+        results = [None] * len(prompts)
+        for batch in plan_batches(lengths, self.max_new_tokens, self.batch_size, self.max_batch_tokens):
+            started = time.perf_counter()
+            outputs = self.pipe([prompts[i] for i in batch], batch_size=len(batch), **self.generation_kwargs)
+            metrics.observe_stage('generate', time.perf_counter() - started)
+            metrics.inc('items_total', len(batch), kind='prompts_generated')
+            for index, output in zip(batch, outputs):
+                results[index] = output[0]['generated_text'].strip()
+            self.batches_run += 1
+            logging.debug(f"Generated batch of {len(batch)} prompts, longest {lengths[batch[0]]} tokens")
+        self.prompts_generated += len(prompts)
+        return results
+
+    # Returns (completions, follow-ups) for the prompts prefix + suffix, where each follow-up
+    # continues followup_prompt(prompt, completion, followup). Cached completions have their
+    # follow-ups generated (or looked up) as plain prompts.
+    def generate_with_followup(self, prefixes, suffixes, followup):
+        prompts = [prefix + suffix for prefix, suffix in zip(prefixes, suffixes)]
+        if not self.reuse_kv:
+            first = self.generate(prompts)
+            return first, self.generate([followup_prompt(p, c, followup) for p, c in zip(prompts, first)])
+        first = [None] * len(prompts)
+        second = [None] * len(prompts)
+        if self.cache is not None:
+            keys = [self._key(prompt) for prompt in prompts]
+            cached = self.cache.get_many(keys)
+            first = [cached.get(key) for key in keys]
+        missing = {}
+        for i, prompt in enumerate(prompts):
+            if first[i] is None:
+                missing.setdefault(prompt, i)
+        if missing:
+            rows = list(missing.values())
+            generated = dict(zip(missing, zip(*self._generate_chained(
+                [prefixes[i] for i in rows], [suffixes[i] for i in rows], followup))))
+            for i, prompt in enumerate(prompts):
+                if prompt in generated:
+                    first[i], second[i] = generated[prompt]
+            if self.cache is not None:
+                self.cache.put_many([(self._key(prompt), completion) for prompt, (completion, _) in generated.items()]
+                                    + [(self._key(followup_prompt(prompt, completion, followup)), answer)
+                                       for prompt, (completion, answer) in generated.items()])
+        rest = [i for i in range(len(prompts)) if second[i] is None]
+        for i, text in zip(rest, self.generate([followup_prompt(prompts[i], first[i], followup) for i in rest])):
+            second[i] = text
+        return first, second
+
+    # Left-pad token id lists into (input_ids, attention_mask) tensors on the model's device
+    def _left_pad(self, sequences):
+        width = max(len(ids) for ids in sequences)
+        ids = torch.full((len(sequences), width), self.tokenizer.pad_token_id, dtype=torch.long)
+        mask = torch.zeros((len(sequences), width), dtype=torch.long)
+        for row, sequence in enumerate(sequences):
+            if sequence:
+                ids[row, width - len(sequence):] = torch.tensor(sequence, dtype=torch.long)
+                mask[row, width - len(sequence):] = 1
+        return ids.to(self.model.device), mask.to(self.model.device)
+
+    # Both passes for each batch, sharing one KV cache. Every prompt is tokenized whole, as the
+    # pipeline does, and a page's prompts share only the tokens they all start with, since
+    # tokenizing a prefix on its own can split differently at its end:
+    # 1. the distinct prefixes in the batch are prefilled once (left-padded, with positions
+    #    from the attention mask so padding doesn't shift them) and the cache rows are
+    #    selected per prompt;
+    # 2. generate() prefills only the suffixes and samples the completions;
+    # 3. each row's followup_prompt() text is tokenized whole, the cache is cropped back to
+    #    the prompt tokens it still starts with, and generate() continues from there with the
+    #    rest (the completion, re-encoded from its stripped text, and the follow-up). The
+    #    follow-up therefore sees exactly the tokens a plain prompt would, and matches what
+    #    generate() and the cache key would give for it.
+    def _generate_chained(self, prefixes, suffixes, followup):
+        prefix_index = {}
+        page_of = [prefix_index.setdefault(prefix, len(prefix_index)) for prefix in prefixes]
+        prompts = [prefix + suffix for prefix, suffix in zip(prefixes, suffixes)]
+        prompt_ids = self.tokenizer(prompts)['input_ids']
+        prefix_ids = self.tokenizer(list(prefix_index))['input_ids']
+        shared = [len(ids) for ids in prefix_ids]
+        for i, ids in enumerate(prompt_ids):
+            shared[page_of[i]] = min(shared[page_of[i]], common_prefix_length(prefix_ids[page_of[i]], ids))
+        prefix_ids = [ids[:n] for ids, n in zip(prefix_ids, shared)]
+        suffix_ids = [ids[shared[page_of[i]]:] for i, ids in enumerate(prompt_ids)]
+        followup_ids = self.tokenizer(followup, add_special_tokens=False)['input_ids']
+        lengths = [len(prefix_ids[page_of[i]]) + len(suffix_ids[i]) for i in range(len(suffixes))]
+        generation_kwargs = {k: v for k, v in self.generation_kwargs.items() if k != 'return_full_text'}
+        first = [None] * len(suffixes)
+        second = [None] * len(suffixes)
+        # Longest prefixes first, with each page's prompts kept together so its prefix is shared
+        order = lambda i: (len(prefix_ids[page_of[i]]), -page_of[i], len(suffix_ids[i]))
+        for batch in plan_batches(lengths, 2 * self.max_new_tokens + len(followup_ids), self.batch_size,
+                                  self.max_batch_tokens, key=order):
+            started = time.perf_counter()
+            pages = list(dict.fromkeys(page_of[i] for i in batch))
+            rows = {page: row for row, page in enumerate(pages)}
+            ids, mask = self._left_pad([prefix_ids[page] for page in pages])
+            with torch.no_grad():
+                cache = self.model(input_ids=ids, attention_mask=mask, position_ids=(mask.cumsum(-1) - 1).clamp(min=0),
+                                   use_cache=True).past_key_values
+            select = torch.tensor([rows[page_of[i]] for i in batch], device=self.model.device)
+            cache.reorder_cache(select)
+            suffix, suffix_mask = self._left_pad([suffix_ids[i] for i in batch])
+            ids = torch.cat([ids[select], suffix], 1)
+            mask = torch.cat([mask[select], suffix_mask], 1)
+            output = self.model.generate(input_ids=ids, attention_mask=mask, past_key_values=cache,
+                                         return_dict_in_generate=True, **generation_kwargs)
+            completions = self.tokenizer.batch_decode(output.sequences[:, ids.shape[1]:], skip_special_tokens=True)
+            for index, completion in zip(batch, completions):
+                first[index] = completion.strip()
+            continued_ids = self.tokenizer([followup_prompt(prompts[i], first[i], followup) for i in batch])['input_ids']
+            # Prompt tokens at the end of a row that its follow-up text tokenizes differently
+            dropped = max(len(prompt_ids[i]) - common_prefix_length(prompt_ids[i], continued)
+                          for i, continued in zip(batch, continued_ids))
+            kept = ids.shape[1] - dropped
+            cache = output.past_key_values
+            cache.crop(kept)
+            rest, rest_mask = self._left_pad([continued[max(0, len(prompt_ids[i]) - dropped):]
+                                              for i, continued in zip(batch, continued_ids)])
+            continued = torch.cat([ids[:, :kept], rest], 1)
+            continued_mask = torch.cat([mask[:, :kept], rest_mask], 1)
+            answers = self.model.generate(input_ids=continued, attention_mask=continued_mask, past_key_values=cache,
+                                          return_dict_in_generate=True, **generation_kwargs).sequences[:, continued.shape[1]:]
+            for index, answer in zip(batch, self.tokenizer.batch_decode(answers, skip_special_tokens=True)):
+                second[index] = answer.strip()
+            # Prompt tokens served from the cache instead of being encoded again
+            reused = (sum(len(prefix_ids[page_of[i]]) for i in batch) - sum(len(prefix_ids[page]) for page in pages)
+                      + int(mask[:, :kept].sum()))
+            self.tokens_reused += reused
+            metrics.observe_stage('generate', time.perf_counter() - started)
+            metrics.inc('items_total', 2 * len(batch), kind='prompts_generated')
+            metrics.inc('items_total', reused, kind='prompt_tokens_reused')
+            self.batches_run += 1
+            logging.debug(f"Generated batch of {len(batch)} prompt pairs over {len(pages)} shared prefixes")
+        self.prompts_generated += 2 * len(suffixes)
+        return first, second
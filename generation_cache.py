@@ -0,0 +1,107 @@
+import hashlib
+import json
+import logging
+import sqlite3
+import time
+
+from scrape_settings import QA_CACHE_PATH, QA_CACHE_MAX_BYTES
+
+CREATE_GENERATIONS = '''
+    CREATE TABLE IF NOT EXISTS generations (
+        key BLOB PRIMARY KEY,
+        response TEXT NOT NULL,
+        size INTEGER NOT NULL,
+        last_used REAL NOT NULL
+    )
+'''
+
+CREATE_GENERATIONS_INDEX = '''
+    CREATE INDEX IF NOT EXISTS generations_last_used ON generations (last_used)
+'''
+
+SQLITE_MAX_VARIABLES = 900
+
+# Function to derive the cache key for a prompt under a given model and generation parameters
+def generation_key(model_id, params, prompt):
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(json.dumps([model_id, params], sort_keys=True, default=str).encode('utf-8'))
+    digest.update(b'\0')
+    digest.update(prompt.encode('utf-8'))
+    return digest.digest()
+
+# Persistent prompt -> generation cache. Entries are keyed by generation_key, so changing
+# the model or any sampling parameter misses instead of returning stale output. When the
+# stored responses exceed max_bytes, least recently used entries are evicted down to 90%.
+class GenerationCache:
+    def __init__(self, path=QA_CACHE_PATH, max_bytes=QA_CACHE_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.conn = sqlite3.connect(path)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute(CREATE_GENERATIONS)
+        self.conn.execute(CREATE_GENERATIONS_INDEX)
+        self.conn.commit()
+        self.total_bytes = self.conn.execute('SELECT COALESCE(SUM(size), 0) FROM generations').fetchone()[0]
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_many(self, keys):
+        found = {}
+        unique = list(dict.fromkeys(keys))
+        for start in range(0, len(unique), SQLITE_MAX_VARIABLES):
+            chunk = unique[start:start + SQLITE_MAX_VARIABLES]
+            placeholders = ','.join('?' * len(chunk))
+            found.update(self.conn.execute(
+                f'SELECT key, response FROM generations WHERE key IN ({placeholders})', chunk
+            ).fetchall())
+        if found:
+            now = time.time()
+            self.conn.executemany('UPDATE generations SET last_used = ? WHERE key = ?', [(now, key) for key in found])
+            self.conn.commit()
+        hits = sum(1 for key in keys if key in found)
+        self.hits += hits
+        self.misses += len(keys) - hits
+        return found
+
+    def put_many(self, items):
+        now = time.time()
+        rows = [(key, response, len(response.encode('utf-8')), now) for key, response in items]
+        if not rows:
+            return
+        for key, _, size, _ in rows:
+            previous = self.conn.execute('SELECT size FROM generations WHERE key = ?', (key,)).fetchone()
+            self.total_bytes += size - (previous[0] if previous else 0)
+        self.conn.executemany('INSERT OR REPLACE INTO generations (key, response, size, last_used) VALUES (?, ?, ?, ?)', rows)
+        self.conn.commit()
+        if self.total_bytes > self.max_bytes:
+            self.evict(int(self.max_bytes * 0.9))
+
+    def evict(self, target_bytes):
+        cursor = self.conn.execute('SELECT key, size FROM generations ORDER BY last_used')
+        doomed = []
+        for key, size in cursor:
+            if self.total_bytes <= target_bytes:
+                break
+            doomed.append((key,))
+            self.total_bytes -= size
+        cursor.close()
+        self.conn.executemany('DELETE FROM generations WHERE key = ?', doomed)
+        self.conn.commit()
+        self.evictions += len(doomed)
+        logging.info(f"Evicted {len(doomed)} cached generations, {self.total_bytes} bytes remain")
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'evictions': self.evictions,
+            'entries': self.conn.execute('SELECT COUNT(*) FROM generations').fetchone()[0],
+            'bytes': self.total_bytes,
+        }
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,173 @@
+import asyncio
+import gc
+import logging
+import os
+import time
+
+import psutil
+
+from scrape_settings import (
+    MEMORY_LIMIT, CPU_LIMIT, GOVERNOR_INTERVAL, GOVERNOR_RESUME_RATIO, GOVERNOR_RESUME_SAMPLES,
+    GOVERNOR_THROTTLE_FACTOR, GOVERNOR_RECYCLE_COOLDOWN, GOVERNOR_BROWSER_SHARE
+)
+
+NORMAL = 'normal'
+THROTTLED = 'throttled'
+PAUSED = 'paused'
+STATE_LEVELS = {NORMAL: 0, THROTTLED: 1, PAUSED: 2}
+
+# Samples RSS and CPU of this process and all of its children (chromedriver, Chrome and
+# the post-processing workers). Process handles are kept between samples because
+# cpu_percent() measures since the previous call on the same handle.
+class ProcessTreeSampler:
+    def __init__(self, pid=None):
+        self.root = psutil.Process(pid or os.getpid())
+        self.cpu_count = psutil.cpu_count() or 1
+        self._processes = {}
+
+    # Returns (RSS in MB, CPU as a percentage of the whole machine)
+    def sample(self):
+        try:
+            current = [self.root] + self.root.children(recursive=True)
+        except psutil.Error:
+            current = [self.root]
+        processes = {}
+        rss = 0
+        cpu = 0.0
+        for proc in current:
+            proc = self._processes.get(proc.pid, proc)
+            try:
+                rss += proc.memory_info().rss
+                cpu += proc.cpu_percent(None)
+            except psutil.Error:
+                continue
+            processes[proc.pid] = proc
+        self._processes = processes
+        return rss / 1024 / 1024, cpu / self.cpu_count
+
+# Enforces MEMORY_LIMIT and CPU_LIMIT on a running crawl. Sampling runs on a worker thread
+# every interval seconds, so the event loop never blocks on it. Going over CPU_LIMIT
+# throttles the politeness scheduler to throttle_factor of its concurrency. Going over
+# MEMORY_LIMIT also pauses new frontier leases and flushes in-memory buffers. Browsers (the
+# usual source of growth) are recycled once per escalation to paused, only when they hold
+# more than browser_share of the RSS, and at most once per recycle_cooldown seconds, since
+# restarting Chrome is slow and frees nothing when the growth is elsewhere. The governor
+# steps back down only after resume_samples consecutive samples below resume_ratio of both
+# limits (hysteresis), so it doesn't flap around a limit.
+class ResourceGovernor:
+    def __init__(self, scheduler=None, browser_pool=None, flush_buffers=None, on_resume=None,
+                 memory_limit=MEMORY_LIMIT, cpu_limit=CPU_LIMIT, interval=GOVERNOR_INTERVAL,
+                 resume_ratio=GOVERNOR_RESUME_RATIO, resume_samples=GOVERNOR_RESUME_SAMPLES,
+                 throttle_factor=GOVERNOR_THROTTLE_FACTOR, recycle_cooldown=GOVERNOR_RECYCLE_COOLDOWN,
+                 browser_share=GOVERNOR_BROWSER_SHARE, sampler=None):
+        self.scheduler = scheduler
+        self.browser_pool = browser_pool
+        self.flush_buffers = flush_buffers
+        self.on_resume = on_resume
+        self.memory_limit = memory_limit
+        self.cpu_limit = cpu_limit
+        self.interval = interval
+        self.resume_ratio = resume_ratio
+        self.resume_samples = resume_samples
+        self.throttle_factor = throttle_factor
+        self.recycle_cooldown = recycle_cooldown
+        self.browser_share = browser_share
+        self.sampler = sampler or ProcessTreeSampler()
+        self.state = NORMAL
+        self.rss_mb = 0.0
+        self.cpu_percent = 0.0
+        self.interventions = 0
+        self.recycles = 0
+        self._calm_samples = 0
+        self._last_recycle = None
+        self._task = None
+
+    @property
+    def paused(self):
+        return self.state == PAUSED
+
+    @property
+    def level(self):
+        return STATE_LEVELS[self.state]
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.check()
+            except Exception as e:
+                logging.error(f"Resource governor check failed: {str(e)}")
+
+    # Take one sample and move between states
+    async def check(self):
+        self.rss_mb, self.cpu_percent = await asyncio.to_thread(self.sampler.sample)
+        if self.rss_mb > self.memory_limit:
+            target = PAUSED
+        elif self.cpu_percent > self.cpu_limit:
+            target = THROTTLED
+        else:
+            target = None
+        if target is not None:
+            self._calm_samples = 0
+            if STATE_LEVELS[target] > self.level or target == PAUSED:
+                await self._escalate(target)
+            return
+        if self.state == NORMAL:
+            return
+        calm = (self.rss_mb < self.memory_limit * self.resume_ratio
+                and self.cpu_percent < self.cpu_limit * self.resume_ratio)
+        self._calm_samples = self._calm_samples + 1 if calm else 0
+        if self._calm_samples >= self.resume_samples:
+            self._resume()
+
+    async def _escalate(self, state):
+        first = self.state != state
+        if first:
+            logging.warning(f"Resource limits exceeded ({self.rss_mb:.0f} MB / {self.memory_limit} MB, "
+                            f"{self.cpu_percent:.0f}% / {self.cpu_limit}% CPU); {state} crawl")
+        self.state = state
+        self.interventions += 1
+        if self.scheduler is not None:
+            self.scheduler.set_limit(int(self.scheduler.total_concurrency * self.throttle_factor))
+        if state != PAUSED:
+            return
+        if first and self.browser_pool is not None:
+            await self._maybe_recycle_browsers()
+        # Still over the memory limit on later samples: keep reclaiming
+        if self.flush_buffers is not None:
+            await self.flush_buffers()
+        await asyncio.to_thread(gc.collect)
+
+    async def _maybe_recycle_browsers(self):
+        now = time.monotonic()
+        if self._last_recycle is not None and now - self._last_recycle < self.recycle_cooldown:
+            return
+        browser_mb = await self.browser_pool.rss_mb()
+        if browser_mb <= self.rss_mb * self.browser_share:
+            logging.info(f"Browsers hold {browser_mb:.0f} of {self.rss_mb:.0f} MB; not recycling them")
+            return
+        self._last_recycle = now
+        self.recycles += 1
+        await self.browser_pool.recycle_all()
+
+    def _resume(self):
+        logging.info(f"Resources back under limits ({self.rss_mb:.0f} MB, {self.cpu_percent:.0f}% CPU); resuming crawl")
+        self.state = NORMAL
+        self._calm_samples = 0
+        if self.scheduler is not None:
+            self.scheduler.set_limit(self.scheduler.total_concurrency)
+        if self.on_resume is not None:
+            self.on_resume()
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
@@ -0,0 +1,198 @@
+import logging
+import re
+from itertools import islice
+
+from lang_detect import language_from_classes
+from scrape_settings import HTML_PARSER_BACKEND
+
+BOILERPLATE_TAGS = {'script', 'style', 'noscript', 'template', 'svg', 'nav', 'header', 'footer', 'aside', 'button', 'iframe'}
+BOILERPLATE_ROLES = {'navigation', 'banner', 'contentinfo', 'search', 'complementary'}
+MAIN_TAGS = ('main', 'article')
+HINT_ANCESTOR_DEPTH = 2  # Highlighters often put language-xxx on a wrapper <div> around <pre>
+CLEAN_PATTERN = re.compile(r'<[^>]+>|[^\w\s]')
+
+# Function to clean text: drop tag remnants and punctuation, collapse whitespace, lowercase
+def clean_text(text):
+    return ' '.join(CLEAN_PATTERN.sub('', text).split()).lower()
+
+def _is_boilerplate(tag, role):
+    return tag in BOILERPLATE_TAGS or role in BOILERPLATE_ROLES
+
+# Function to pick a code block's class hint: its own classes (or, for <pre>, its inner
+# <code>'s) when they name a language, else the nearest of up to HINT_ANCESTOR_DEPTH ancestors
+# whose classes do. Ancestor classes that name no language (Sphinx's "highlight", MkDocs'
+# "md-typeset") are skipped rather than ending the walk; without any match the block's own
+# classes are kept, since a bare name like "python" is still a hint to detect_language.
+def _pick_hint(own, ancestor_classes):
+    for classes in own:
+        if classes and language_from_classes(classes):
+            return classes
+    for classes in islice(ancestor_classes, HINT_ANCESTOR_DEPTH):
+        if classes and language_from_classes(classes):
+            return classes
+    return next((classes for classes in own if classes), None)
+
+def _class_string(value):
+    if not value:
+        return ''
+    return value if isinstance(value, str) else ' '.join(value)
+
+# Every backend returns the same record from a single parse of the document:
+# title, main-content text (boilerplate stripped, not yet cleaned), code blocks as
+# (code, class hint) with <code> inside <pre> counted once, and links as (href, class).
+# Boilerplate is removed in reverse document order so nested elements go before their parents,
+# and a <main>/<article> inside boilerplate (e.g. cards in a <nav>) is never taken as the main content.
+def _record(title, text, code_blocks, links):
+    return {'title': (title or '').strip(), 'text': text, 'code_blocks': code_blocks, 'links': links}
+
+def _extract_selectolax(html):
+    from selectolax.lexbor import LexborHTMLParser
+
+    tree = LexborHTMLParser(html)
+    title_node = tree.css_first('title')
+    links = []
+    code_blocks = []
+    boilerplate = []
+    main = None
+    root = tree.body or tree.root
+    for node in root.traverse():
+        tag = node.tag
+        if tag == 'a':
+            href = node.attributes.get('href')
+            if href:
+                links.append((href, node.attributes.get('class') or ''))
+        elif tag == 'pre' or (tag == 'code' and not _has_ancestor(node, 'pre')):
+            own = [node.attributes.get('class')]
+            if tag == 'pre':
+                inner = node.css_first('code')
+                own.append(inner.attributes.get('class') if inner is not None else None)
+            hint = _pick_hint(own, (parent.attributes.get('class') for parent in _ancestors(node)))
+            code_blocks.append((node.text(deep=True).strip(), hint))
+        if _is_boilerplate(tag, node.attributes.get('role')):
+            boilerplate.append(node)
+        elif main is None and (tag in MAIN_TAGS or node.attributes.get('role') == 'main'):
+            if not _in_boilerplate(node):
+                main = node
+    for node in reversed(boilerplate):
+        node.decompose()
+    text = (main or tree.body or tree.root).text(deep=True, separator=' ')
+    return _record(title_node.text() if title_node else '', text, code_blocks, links)
+
+def _ancestors(node):
+    parent = node.parent
+    while parent is not None:
+        yield parent
+        parent = parent.parent
+
+def _has_ancestor(node, tag):
+    return any(parent.tag == tag for parent in _ancestors(node))
+
+def _in_boilerplate(node):
+    return any(_is_boilerplate(parent.tag, parent.attributes.get('role')) for parent in _ancestors(node))
+
+def _extract_lxml(html):
+    import lxml.etree
+    import lxml.html
+
+    # Bytes with an explicit encoding: lxml rejects a str that carries an <?xml encoding=...?>
+    # declaration, and the text is already decoded, so a <meta charset> must not re-decode it
+    if isinstance(html, str):
+        html = html.encode('utf-8', 'surrogatepass')
+    try:
+        doc = lxml.html.document_fromstring(html, parser=lxml.html.HTMLParser(encoding='utf-8'))
+    except lxml.etree.ParserError:
+        return _record('', '', [], [])  # Empty document, as the other backends return it
+    title = ''
+    links = []
+    code_blocks = []
+    boilerplate = []
+    main = None
+    for el in doc.iter():
+        tag = el.tag
+        if not isinstance(tag, str):
+            continue  # Comments and processing instructions
+        if tag == 'title' and not title:
+            title = el.text_content()
+        elif tag == 'a':
+            href = el.get('href')
+            if href:
+                links.append((href, el.get('class') or ''))
+        elif tag == 'pre' or (tag == 'code' and next(el.iterancestors('pre'), None) is None):
+            own = [el.get('class')]
+            if tag == 'pre':
+                inner = next(el.iter('code'), None)
+                own.append(inner.get('class') if inner is not None else None)
+            hint = _pick_hint(own, (parent.get('class') for parent in el.iterancestors()))
+            code_blocks.append((el.text_content().strip(), hint))
+        if _is_boilerplate(tag, el.get('role')):
+            boilerplate.append(el)
+        elif main is None and (tag in MAIN_TAGS or el.get('role') == 'main'):
+            if not any(_is_boilerplate(parent.tag, parent.get('role')) for parent in el.iterancestors()):
+                main = el
+    for el in reversed(boilerplate):
+        el.drop_tree()
+    body = main if main is not None else (doc.find('body') if doc.find('body') is not None else doc)
+    text = ' '.join(body.itertext())
+    return _record(title, text, code_blocks, links)
+
+def _extract_bs4(html):
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(html, 'html.parser')
+    title = soup.title.get_text() if soup.title else ''
+    links = []
+    code_blocks = []
+    boilerplate = []
+    main = None
+    for el in soup.find_all(True):
+        tag = el.name
+        if tag == 'a':
+            href = el.get('href')
+            if href:
+                links.append((href, _class_string(el.get('class'))))
+        elif tag == 'pre' or (tag == 'code' and el.find_parent('pre') is None):
+            own = [_class_string(el.get('class'))]
+            if tag == 'pre':
+                inner = el.find('code')
+                own.append(_class_string(inner.get('class')) if inner is not None else None)
+            hint = _pick_hint(own, (_class_string(parent.get('class')) for parent in el.parents))
+            code_blocks.append((el.get_text().strip(), hint or None))
+        if _is_boilerplate(tag, el.get('role')):
+            boilerplate.append(el)
+        elif main is None and (tag in MAIN_TAGS or el.get('role') == 'main'):
+            if not any(_is_boilerplate(parent.name, parent.get('role')) for parent in el.parents):
+                main = el
+    for el in reversed(boilerplate):
+        el.decompose()
+    body = main or soup.body or soup
+    return _record(title, body.get_text(' '), code_blocks, links)
+
+BACKENDS = {
+    'selectolax': _extract_selectolax,
+    'lxml': _extract_lxml,
+    'bs4': _extract_bs4,
+}
+
+# Function to pick the fastest installed backend ('auto') or the configured one
+def resolve_backend(name=HTML_PARSER_BACKEND):
+    if name != 'auto':
+        return name
+    for candidate, module in (('selectolax', 'selectolax.lexbor'), ('lxml', 'lxml.html')):
+        try:
+            __import__(module)
+            return candidate
+        except ImportError:
+            continue
+    return 'bs4'
+
+_backend = None
+
+# Function to parse a document once and return its title, main text, code blocks and links
+def extract_page(html, backend=None):
+    global _backend
+    if backend is None:
+        if _backend is None:
+            _backend = resolve_backend()
+            logging.info(f"Using {_backend} HTML extraction backend")
+        backend = _backend
+    return BACKENDS[backend](html)
@@ -0,0 +1,217 @@
+import math
+import os
+import re
+
+from scrape_settings import LANGUAGE_MIN_CONFIDENCE
+
+UNKNOWN = 'unknown'
+
+# Canonical names are Pygments aliases so token_store can look the lexer up directly
+LANGUAGE_ALIASES = {
+    'py': 'python', 'python3': 'python', 'py3': 'python', 'ipython': 'python', 'pycon': 'python',
+    'js': 'javascript', 'jsx': 'javascript', 'node': 'javascript', 'nodejs': 'javascript', 'mjs': 'javascript',
+    'react': 'javascript', 'nextjs': 'javascript',
+    'ts': 'typescript', 'tsx': 'typescript',
+    'rs': 'rust', 'sol': 'solidity', 'golang': 'go',
+    'sh': 'bash', 'shell': 'bash', 'zsh': 'bash', 'console': 'bash', 'shell-session': 'bash', 'terminal': 'bash',
+    'yml': 'yaml', 'c++': 'cpp', 'cxx': 'cpp', 'cs': 'csharp', 'c#': 'csharp', 'rb': 'ruby', 'kt': 'kotlin',
+    'md': 'markdown', 'htm': 'html', 'xml': 'html', 'postgresql': 'sql', 'mysql': 'sql', 'sqlite': 'sql',
+}
+
+KNOWN_LANGUAGES = {
+    'python', 'javascript', 'typescript', 'rust', 'solidity', 'go', 'java', 'c', 'cpp', 'csharp', 'ruby',
+    'php', 'kotlin', 'swift', 'bash', 'json', 'yaml', 'toml', 'html', 'css', 'sql', 'markdown',
+}
+
+EXTENSION_LANGUAGES = {
+    '.py': 'python', '.pyi': 'python', '.ipynb': 'json',
+    '.js': 'javascript', '.mjs': 'javascript', '.cjs': 'javascript', '.jsx': 'javascript',
+    '.ts': 'typescript', '.tsx': 'typescript', '.mts': 'typescript',
+    '.rs': 'rust', '.sol': 'solidity', '.go': 'go', '.java': 'java',
+    '.c': 'c', '.h': 'c', '.cc': 'cpp', '.cpp': 'cpp', '.cxx': 'cpp', '.hpp': 'cpp', '.cs': 'csharp',
+    '.rb': 'ruby', '.php': 'php', '.kt': 'kotlin', '.swift': 'swift',
+    '.sh': 'bash', '.bash': 'bash', '.zsh': 'bash',
+    '.json': 'json', '.yaml': 'yaml', '.yml': 'yaml', '.toml': 'toml',
+    '.html': 'html', '.htm': 'html', '.css': 'css', '.scss': 'css', '.sql': 'sql', '.md': 'markdown',
+}
+
+SHEBANG_LANGUAGES = {
+    'python': 'python', 'python3': 'python', 'node': 'javascript', 'deno': 'typescript', 'ts-node': 'typescript',
+    'bash': 'bash', 'sh': 'bash', 'zsh': 'bash', 'ruby': 'ruby', 'php': 'php',
+}
+
+CLASS_PREFIXES = ('language-', 'lang-', 'highlight-source-', 'highlight-', 'hljs-', 'brush:')
+
+# Token weights per language. Only tokens that discriminate between languages are
+# listed; everything else is ignored by the single scoring pass in score_tokens().
+TOKEN_WEIGHTS = {
+    'python': {
+        'def': 3, 'elif': 4, 'self': 3, 'None': 3, 'True': 1.5, 'False': 1.5, 'import': 1, 'from': 1.5,
+        'lambda': 2, 'print': 1.5, 'pass': 2, 'yield': 1, 'async': 0.5, 'await': 0.5, '__init__': 4,
+        'kwargs': 3, 'args': 1, 'pip': 2, 'isinstance': 3, 'range': 1.5, 'len': 1.5, 'np': 1.5, 'torch': 3,
+        'with': 1, 'as': 1, 'not': 1, 'and': 1, 'or': 0.5, 'in': 0.5, 'is': 1, 'except': 3, 'raise': 2,
+        '>>>': 4, '"""': 3, ':': 0.3,
+    },
+    'javascript': {
+        'function': 2.5, 'const': 1.5, 'let': 1.5, 'var': 2, 'console': 3, 'require': 3, 'module': 1.5,
+        'exports': 2, 'undefined': 3, 'null': 1, 'this': 1, 'new': 0.5, 'document': 3, 'window': 3,
+        'async': 0.5, 'await': 0.5, 'export': 1.5, 'default': 1, '=>': 2, '===': 3, '!==': 3, 'npm': 2,
+        'useState': 3, 'useEffect': 3, 'props': 2, 'React': 2, 'JSON': 1.5, 'then': 1.5,
+    },
+    'typescript': {
+        'interface': 3, 'type': 1, 'readonly': 3, 'implements': 1.5, 'enum': 1, 'namespace': 2,
+        'string': 1.5, 'number': 2, 'boolean': 2, 'any': 2, 'unknown': 2, 'keyof': 4, 'as': 0.5,
+        'const': 1, 'export': 1.5, 'import': 0.5, '=>': 1.5, '===': 2, 'private': 1, 'public': 0.5,
+    },
+    'rust': {
+        'fn': 4, 'let': 1, 'mut': 4, 'impl': 4, 'pub': 3, 'struct': 1.5, 'enum': 1, 'match': 1.5,
+        'crate': 4, 'use': 1.5, 'mod': 2, 'trait': 3, 'Self': 2, 'self': 0.5, 'Option': 2, 'Some': 3,
+        'Ok': 2, 'Err': 3, 'Vec': 3, 'String': 1, 'unwrap': 4, 'println': 4, 'cargo': 3, '::': 1.5,
+        '->': 1, '&mut': 4, '#[': 3, 'usize': 4, 'u32': 2, 'u64': 2, 'i32': 2, 'where': 0.5,
+    },
+    'solidity': {
+        'pragma': 4, 'solidity': 5, 'contract': 4, 'address': 3, 'uint256': 5, 'uint': 3, 'msg': 3,
+        'sender': 3, 'payable': 5, 'modifier': 4, 'emit': 4, 'event': 2, 'mapping': 5, 'require': 1,
+        'external': 3, 'view': 2, 'returns': 2, 'memory': 2, 'storage': 2, 'wei': 3, 'ether': 3,
+    },
+    'go': {
+        'func': 4, 'package': 2, 'import': 0.5, 'chan': 4, 'go': 1.5, 'defer': 4, 'fmt': 4, 'err': 1.5,
+        'nil': 3, ':=': 3, 'struct': 1, 'interface': 0.5, 'Println': 2, 'range': 1, 'make': 1.5,
+    },
+    'java': {
+        'public': 1.5, 'private': 1, 'static': 1, 'void': 1.5, 'class': 1, 'extends': 1.5,
+        'implements': 1.5, 'System': 3, 'out': 1, 'println': 1, 'String': 1, 'new': 0.5, 'final': 2,
+        '@Override': 4, 'throws': 3, 'import': 0.5, 'package': 1, 'boolean': 1, 'int': 0.5,
+    },
+    'c': {
+        '#include': 3, 'printf': 3, 'malloc': 4, 'free': 2, 'sizeof': 3, 'struct': 1, 'int': 1,
+        'char': 2, 'void': 1, 'NULL': 3, 'return': 0.3, '->': 0.5, 'typedef': 3, 'unsigned': 2,
+    },
+    'cpp': {
+        '#include': 2.5, 'std': 4, 'cout': 4, 'cin': 4, 'endl': 4, 'namespace': 2, 'template': 3,
+        'typename': 4, '::': 1.5, 'auto': 1, 'nullptr': 4, 'vector': 2, 'class': 0.5, 'public': 0.5,
+    },
+    'csharp': {
+        'using': 2.5, 'namespace': 1.5, 'var': 0.5, 'string': 1, 'Console': 4, 'WriteLine': 4,
+        'public': 1, 'static': 0.5, 'void': 1, 'async': 0.5, 'Task': 2, 'get': 1, 'set': 1,
+    },
+    'ruby': {
+        'def': 1.5, 'end': 2.5, 'puts': 4, 'require': 1, 'attr_accessor': 5, 'do': 1.5, 'elsif': 5,
+        'nil': 2, 'module': 1, 'unless': 3, 'gem': 3, 'self': 0.5,
+    },
+    'php': {
+        '<?php': 6, 'echo': 2, 'function': 0.5, 'namespace': 0.5, 'use': 0.5, 'public': 0.5,
+        '$this': 5, '->': 1, 'array': 1.5, 'foreach': 2,
+    },
+    'bash': {
+        'echo': 2, 'export': 1, 'sudo': 4, 'cd': 3, 'ls': 2, 'mkdir': 3, 'rm': 2, 'fi': 4, 'then': 1,
+        'esac': 5, 'done': 2, 'apt': 3, 'brew': 3, 'pip': 2, 'npm': 2, 'npx': 3, 'yarn': 3, 'git': 2,
+        'curl': 3, 'wget': 3, 'cargo': 1.5, 'docker': 3, 'python': 1, 'install': 1.5, '$': 1, '&&': 1,
+        '|': 0.5, '--': 0.5,
+    },
+    'json': {'{': 0.3, '}': 0.3, '":': 2, 'true': 0.5, 'false': 0.5, 'null': 0.5},
+    'yaml': {'---': 2, 'name': 0.5, 'version': 0.5, 'on': 0.5, 'steps': 2, 'runs-on': 4, 'uses': 2, '-': 0.3},
+    'toml': {'[package]': 5, '[dependencies]': 5, '[tool': 4, 'version': 0.5, 'edition': 3},
+    'html': {'<div': 3, '</div>': 3, '<span': 3, '<a': 2, 'href': 2, 'class': 0.5, '<html': 4, '<script': 3, '<!DOCTYPE': 5},
+    'css': {'px': 2, 'color': 2, 'margin': 3, 'padding': 3, 'display': 2, 'font-size': 4, '!important': 4, 'rem': 2},
+    'sql': {
+        'SELECT': 4, 'FROM': 2, 'WHERE': 3, 'INSERT': 3, 'INTO': 2, 'VALUES': 3, 'UPDATE': 2, 'JOIN': 3,
+        'CREATE': 2, 'TABLE': 3, 'GROUP': 2, 'ORDER': 1.5, 'BY': 1, 'PRIMARY': 3, 'KEY': 1,
+        'select': 2, 'from': 0.5, 'where': 0.5,
+    },
+}
+
+# Inverted once at import: token -> ((language, weight), ...), so scoring is one dict hit per token
+TOKEN_INDEX = {}
+for _language, _weights in TOKEN_WEIGHTS.items():
+    for _token, _weight in _weights.items():
+        TOKEN_INDEX.setdefault(_token, []).append((_language, _weight))
+TOKEN_INDEX = {token: tuple(entries) for token, entries in TOKEN_INDEX.items()}
+
+TOKEN_PATTERN = re.compile(
+    r'<\?php|<!DOCTYPE|</?\w+>?|\[\w+\]?|#\[|#include|@\w+|\$this|&mut|'
+    r'[A-Za-z_][\w-]*|===|!==|=>|->|::|:=|>>>|"""|":|&&|---|--|\$|[{}:|-]'
+)
+
+# Function to normalize a language name from a class attribute, alias or file extension
+def normalize_language(name):
+    if not name:
+        return None
+    name = name.strip().lower()
+    name = LANGUAGE_ALIASES.get(name, name)
+    return name if name in KNOWN_LANGUAGES else None
+
+# Function to read a language hint from class names like "language-python" or "lang-js"
+def language_from_classes(classes):
+    if isinstance(classes, str):
+        classes = classes.split()
+    for css_class in classes or ():
+        lowered = css_class.lower()
+        for prefix in CLASS_PREFIXES:
+            if lowered.startswith(prefix):
+                language = normalize_language(lowered[len(prefix):])
+                if language:
+                    return language
+    return None
+
+def language_from_filename(filename):
+    if not filename:
+        return None
+    return EXTENSION_LANGUAGES.get(os.path.splitext(filename)[1].lower())
+
+def language_from_shebang(code):
+    if not code.startswith('#!'):
+        return None
+    interpreter = code[2:code.find('\n') if '\n' in code else len(code)].split()
+    if not interpreter:
+        return None
+    program = os.path.basename(interpreter[1] if os.path.basename(interpreter[0]) == 'env' and len(interpreter) > 1 else interpreter[0])
+    return SHEBANG_LANGUAGES.get(program)
+
+# Function to score code against the token model in one pass; returns (language, confidence)
+def score_tokens(code):
+    scores = {}
+    index = TOKEN_INDEX
+    for token in TOKEN_PATTERN.findall(code):
+        entries = index.get(token)
+        if entries:
+            for language, weight in entries:
+                scores[language] = scores.get(language, 0.0) + weight
+    if not scores:
+        return UNKNOWN, 0.0
+    ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+    best_language, best_score = ranked[0]
+    runner_up = ranked[1][1] if len(ranked) > 1 else 0.0
+    # Confidence grows with both the margin over the runner-up and the amount of evidence
+    margin = (best_score - runner_up) / best_score
+    evidence = 1 - math.exp(-best_score / 8)
+    return best_language, round(margin * evidence, 3)
+
+# Function to detect the language of a code block. Explicit signals (class hint, file
+# extension, shebang) win outright; otherwise the token model decides, and a guess below
+# min_confidence comes back as unknown (with its confidence) rather than a coin flip.
+def detect_language(code, hint=None, filename=None, min_confidence=LANGUAGE_MIN_CONFIDENCE):
+    # hint is either a language name or the class attribute of the <code>/<pre> tag
+    language = language_from_classes(hint) or (normalize_language(hint) if isinstance(hint, str) else None)
+    if language:
+        return language, 1.0
+    language = language_from_filename(filename)
+    if language:
+        return language, 0.95
+    language = language_from_shebang(code)
+    if language:
+        return language, 0.95
+    language, confidence = score_tokens(code)
+    if confidence < min_confidence:
+        return UNKNOWN, confidence
+    return language, confidence
+
+# Function to detect many blocks at once; items are code strings or (code, hint, filename) tuples
+def detect_languages(blocks):
+    results = []
+    for block in blocks:
+        if isinstance(block, str):
+            results.append(detect_language(block))
+        else:
+            results.append(detect_language(*block))
+    return results
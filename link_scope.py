@@ -0,0 +1,67 @@
+import re
+from urllib.parse import urlsplit
+
+from dedup import canonicalize_url
+from scrape_settings import LINK_INCLUDE_PATTERNS, LINK_EXCLUDE_PATTERNS
+
+CRAWLABLE_SCHEMES = ('http', 'https')
+_END = ''
+
+def _segments(path):
+    return [segment for segment in path.split('/') if segment]
+
+def _compile(patterns):
+    patterns = list(patterns or ())
+    return re.compile('|'.join(f'(?:{pattern})' for pattern in patterns)) if patterns else None
+
+# Decides which discovered links belong to the crawl. Every start URL contributes its host
+# and path prefix: hosts are a dict lookup and each host's prefixes form a trie of path
+# segments, so matching costs one walk down the link's path however many start URLs there
+# are (and /docs/datasets doesn't match /docs/datasets-server the way a string prefix would).
+# A link in scope is then kept if it matches an include pattern (when any are set) and
+# no exclude pattern.
+class LinkScope:
+    def __init__(self, start_urls=(), include=LINK_INCLUDE_PATTERNS, exclude=LINK_EXCLUDE_PATTERNS):
+        self.hosts = {}
+        self.include = _compile(include)
+        self.exclude = _compile(exclude)
+        for url in start_urls:
+            self.add(url)
+
+    # Add a start URL; everything under its path on the same host is in scope
+    def add(self, url):
+        parts = urlsplit(canonicalize_url(url))
+        if parts.scheme not in CRAWLABLE_SCHEMES or not parts.netloc:
+            return
+        node = self.hosts.setdefault(parts.netloc, {})
+        for segment in _segments(parts.path):
+            if _END in node:
+                # A shorter prefix already covers this one
+                return
+            node = node.setdefault(segment, {})
+        node.clear()
+        node[_END] = True
+
+    # True when a canonical URL is under one of the start URLs and passes the patterns
+    def matches(self, url):
+        parts = urlsplit(url)
+        if parts.scheme not in CRAWLABLE_SCHEMES:
+            return False
+        node = self.hosts.get(parts.netloc)
+        if node is None:
+            return False
+        for segment in _segments(parts.path):
+            if _END in node:
+                break
+            node = node.get(segment)
+            if node is None:
+                return False
+        else:
+            if _END not in node:
+                return False
+        if self.include is not None and not self.include.search(url):
+            return False
+        return self.exclude is None or not self.exclude.search(url)
+
+    def filter(self, urls):
+        return [url for url in urls if self.matches(url)]
@@ -0,0 +1,166 @@
+import random
+from array import array
+from collections import OrderedDict
+
+import numpy as np
+
+from dedup import hash64
+from scrape_settings import NEAR_DUP_THRESHOLD, NEAR_DUP_NUM_PERM, NEAR_DUP_SHINGLE_SIZE, NEAR_DUP_MAX_PAGES
+
+MERSENNE_PRIME = (1 << 61) - 1
+MAX_HASH = (1 << 61) - 1
+SIGNATURE_CHUNK = 512  # Shingles per vectorized step, bounding the num_perm x chunk temporaries
+_LOW32 = np.uint64(0xFFFFFFFF)
+_LOW29 = np.uint64((1 << 29) - 1)
+_PRIME = np.uint64(MERSENNE_PRIME)
+
+# Function to compute min over shingles of (a * h + b) mod 2^61 - 1 for every permutation, exactly in
+# uint64 arithmetic. a, b and h are below 2^61, so a * h is split into 32-bit limbs: 2^64 is 8 mod p,
+# the middle limb times 2^32 folds to (mid >> 29) + (mid mod 2^29) << 32, and since 2^61 is 1 mod p
+# the bits above 61 fold onto the low ones. Every partial sum stays under 2^64.
+def _min_universal_hash(a_lo, a_hi, b, h):
+    h_lo, h_hi = h & _LOW32, h >> np.uint64(32)
+    mid = a_hi * h_lo
+    mid += a_lo * h_hi
+    total = a_hi * h_hi
+    total <<= np.uint64(3)
+    total += mid >> np.uint64(29)
+    mid &= _LOW29
+    mid <<= np.uint64(32)
+    total += mid
+    low = a_lo * h_lo
+    total += low & _PRIME
+    low >>= np.uint64(61)
+    total += low
+    total += b
+    for _ in range(2):
+        high = total >> np.uint64(61)
+        total &= _PRIME
+        total += high
+    np.subtract(total, _PRIME, out=total, where=total >= _PRIME)
+    return total.min(axis=1)
+
+# Function to turn text into a set of hashed word shingles
+def shingle_hashes(text, size=NEAR_DUP_SHINGLE_SIZE):
+    words = text.split()
+    if len(words) <= size:
+        return {hash64(' '.join(words)) & MAX_HASH} if words else set()
+    return {hash64(' '.join(words[i:i + size])) & MAX_HASH for i in range(len(words) - size + 1)}
+
+# Function to pick the LSH band/row split whose S-curve threshold (1/b)^(1/r) is closest to the target
+def choose_bands(num_perm, threshold):
+    best = None
+    for rows in range(1, num_perm + 1):
+        if num_perm % rows:
+            continue
+        bands = num_perm // rows
+        error = abs((1 / bands) ** (1 / rows) - threshold)
+        if best is None or error < best[0]:
+            best = (error, bands, rows)
+    return best[1], best[2]
+
+# MinHash signatures using universal hashes (a*x + b) mod p over 61-bit shingle hashes.
+# All permutations are applied at once: a (num_perm, 1) parameter column against a row of
+# shingle hashes, reduced with a min along the shingle axis.
+class MinHasher:
+    def __init__(self, num_perm=NEAR_DUP_NUM_PERM, seed=1):
+        rng = random.Random(seed)
+        self.num_perm = num_perm
+        self.params = [(rng.randrange(1, MERSENNE_PRIME), rng.randrange(0, MERSENNE_PRIME)) for _ in range(num_perm)]
+        a = np.array([a for a, _ in self.params], dtype=np.uint64)[:, None]
+        self._a_lo, self._a_hi = a & _LOW32, a >> np.uint64(32)
+        self._b = np.array([b for _, b in self.params], dtype=np.uint64)[:, None]
+
+    def signature(self, hashes):
+        if not hashes:
+            return array('Q', [MAX_HASH] * self.num_perm)
+        values = np.fromiter(hashes, dtype=np.uint64, count=len(hashes))
+        mins = np.full(self.num_perm, MAX_HASH, dtype=np.uint64)
+        for start in range(0, len(values), SIGNATURE_CHUNK):
+            chunk = values[None, start:start + SIGNATURE_CHUNK]
+            np.minimum(mins, _min_universal_hash(self._a_lo, self._a_hi, self._b, chunk), out=mins)
+        signature = array('Q')
+        signature.frombytes(mins.tobytes())
+        return signature
+
+    @staticmethod
+    def similarity(sig_a, sig_b):
+        return sum(1 for x, y in zip(sig_a, sig_b) if x == y) / len(sig_a)
+
+# Banded LSH index over MinHash signatures. Lookups only compare against documents that
+# share at least one band bucket, so cost grows with the number of candidates, not the corpus.
+# Memory is bounded by capacity: signatures are kept in LRU order (a match counts as a use),
+# and past capacity the least recently used document is dropped from its buckets as well.
+class LSHIndex:
+    def __init__(self, num_perm=NEAR_DUP_NUM_PERM, threshold=NEAR_DUP_THRESHOLD, capacity=NEAR_DUP_MAX_PAGES):
+        self.threshold = threshold
+        self.capacity = capacity
+        self.bands, self.rows = choose_bands(num_perm, threshold)
+        self.buckets = [{} for _ in range(self.bands)]
+        self.signatures = OrderedDict()
+        self.evicted = 0
+
+    def __len__(self):
+        return len(self.signatures)
+
+    def _band_keys(self, signature):
+        rows = self.rows
+        for band in range(self.bands):
+            yield band, hash(tuple(signature[band * rows:(band + 1) * rows]))
+
+    def add(self, key, signature):
+        if key in self.signatures:
+            self._remove(key)
+        self.signatures[key] = signature
+        for band, band_key in self._band_keys(signature):
+            self.buckets[band].setdefault(band_key, []).append(key)
+        if self.capacity and len(self.signatures) > self.capacity:
+            self._remove(next(iter(self.signatures)))
+            self.evicted += 1
+
+    def _remove(self, key):
+        for band, band_key in self._band_keys(self.signatures.pop(key)):
+            bucket = self.buckets[band][band_key]
+            bucket.remove(key)
+            if not bucket:
+                del self.buckets[band][band_key]
+
+    # Returns (key, estimated similarity) of the closest indexed document above the threshold
+    def query(self, signature):
+        candidates = set()
+        for band, band_key in self._band_keys(signature):
+            candidates.update(self.buckets[band].get(band_key, ()))
+        best = (None, 0.0)
+        for key in candidates:
+            similarity = MinHasher.similarity(signature, self.signatures[key])
+            if similarity >= self.threshold and similarity > best[1]:
+                best = (key, similarity)
+        if best[0] is None:
+            return None
+        self.signatures.move_to_end(best[0])
+        return best
+
+# Near-duplicate detector for scraped pages: shingles the cleaned text and code blocks,
+# and reports a page as a near-dupe when its estimated Jaccard similarity to an earlier
+# page is at least the threshold.
+class NearDuplicateDetector:
+    def __init__(self, threshold=NEAR_DUP_THRESHOLD, num_perm=NEAR_DUP_NUM_PERM, shingle_size=NEAR_DUP_SHINGLE_SIZE,
+                 max_pages=NEAR_DUP_MAX_PAGES):
+        self.shingle_size = shingle_size
+        self.hasher = MinHasher(num_perm)
+        self.index = LSHIndex(num_perm, threshold, max_pages)
+
+    def signature(self, content, code_blocks=()):
+        hashes = shingle_hashes(content, self.shingle_size)
+        for code in code_blocks:
+            hashes |= shingle_hashes(code, self.shingle_size)
+        return self.hasher.signature(hashes)
+
+    # Returns the matching (key, similarity) for a near-duplicate; otherwise indexes the page and returns None
+    def check_and_add(self, key, content, code_blocks=(), signature=None):
+        if signature is None:
+            signature = self.signature(content, code_blocks)
+        match = self.index.query(signature)
+        if match is None:
+            self.index.add(key, signature)
+        return match
@@ -0,0 +1,437 @@
+import argparse
+import asyncio
+import gzip
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import uuid
+import zlib
+from datetime import datetime, timezone
+from http import HTTPStatus
+
+from dedup import ContentDedup
+from near_dup import NearDuplicateDetector
+from postprocess import PostProcessor, build_page_record
+from telemetry import metrics
+from scrape_settings import (
+    ARCHIVE_DIR, ARCHIVE_COMPRESSION, ARCHIVE_COMPRESSION_LEVEL, ARCHIVE_SEGMENT_BYTES, ARCHIVE_REPLAY_BATCH,
+    NEAR_DUP_ENABLED, DB_PATH
+)
+
+INDEX_NAME = 'index.db'
+SEGMENT_SUFFIXES = {'gzip': '.warc.gz', 'zstd': '.warc.zst'}
+SEGMENT_PATTERN = re.compile(r'^pages-(\d+)\.warc\.(gz|zst)$')
+WARC_DATE_FORMAT = '%Y-%m-%dT%H:%M:%S.%fZ'
+# Describe the original transfer, which no longer matches the stored (decoded, maybe rendered) body
+DROPPED_HEADERS = {'content-length', 'content-encoding', 'transfer-encoding'}
+# Records between index commits. The index also commits at every segment rollover and on
+# close; rows lost to a crash in between are rebuilt from the segment tail on the next open.
+INDEX_COMMIT_EVERY = 100
+SCAN_CHUNK = 64 * 1024  # Bytes read at a time when re-indexing a segment tail; about one compressed page
+
+CREATE_RECORDS = '''
+    CREATE TABLE IF NOT EXISTS records (
+        id INTEGER PRIMARY KEY,
+        url TEXT NOT NULL,
+        segment TEXT NOT NULL,
+        offset INTEGER NOT NULL,
+        length INTEGER NOT NULL,
+        fetched_at REAL,
+        status INTEGER,
+        rendered INTEGER NOT NULL DEFAULT 0
+    )
+'''
+
+CREATE_RECORDS_URL_INDEX = 'CREATE INDEX IF NOT EXISTS records_url ON records (url, id)'
+
+INSERT_RECORD = '''
+    INSERT INTO records (url, segment, offset, length, fetched_at, status, rendered) VALUES (?, ?, ?, ?, ?, ?, ?)
+'''
+
+SELECT_URL = 'SELECT segment, offset, length FROM records WHERE url = ? ORDER BY id DESC LIMIT 1'
+
+# Latest record of every URL, in file order so replay reads each segment front to back
+SELECT_LATEST = '''
+    SELECT segment, offset, length FROM records
+    WHERE id IN (SELECT MAX(id) FROM records GROUP BY url)
+    ORDER BY segment, offset
+'''
+
+SELECT_ALL = 'SELECT segment, offset, length FROM records ORDER BY segment, offset'
+
+SELECT_LAST = 'SELECT segment, offset + length FROM records ORDER BY id DESC LIMIT 1'
+
+# Function to return a compress(bytes) function. Every record is compressed on its own (one
+# gzip member or zstd frame), so a record can be read from its offset without the rest of
+# the segment, and a .warc.gz segment is still a valid gzip file as a whole.
+def make_compressor(compression=ARCHIVE_COMPRESSION, level=ARCHIVE_COMPRESSION_LEVEL):
+    if compression == 'gzip':
+        return lambda data: gzip.compress(data, compresslevel=level, mtime=0)
+    if compression == 'zstd':
+        import zstandard
+
+        # A compressor object isn't safe to share between threads, and is cheap to create
+        return lambda data: zstandard.ZstdCompressor(level=level).compress(data)
+    raise ValueError(f"Unknown archive compression: {compression}")
+
+# Function to decompress one record, going by the segment's file extension
+def decompress(segment, data):
+    if segment.endswith('.zst'):
+        import zstandard
+
+        return zstandard.ZstdDecompressor().decompress(data)
+    return gzip.decompress(data)
+
+def _decompressor(segment):
+    if segment.endswith('.zst'):
+        import zstandard
+
+        return zstandard.ZstdDecompressor().decompressobj()
+    return zlib.decompressobj(wbits=31)
+
+# Function to walk the records of a segment file from offset, yielding (offset, length,
+# record). Stops at the end of the file or at a record cut short by a crash mid-write.
+def scan_records(f, segment, offset):
+    f.seek(offset)
+    pending = b''
+    while True:
+        decompressor = _decompressor(segment)
+        output = []
+        length = 0
+        while not decompressor.eof:
+            data = pending or f.read(SCAN_CHUNK)
+            pending = b''
+            if not data:
+                return
+            output.append(decompressor.decompress(data))
+            length += len(data)
+        pending = decompressor.unused_data
+        length -= len(pending)
+        yield offset, length, parse_record(b''.join(output))
+        offset += length
+
+# Function to serialize a fetched page as a WARC/1.1 response record: WARC headers, then
+# the HTTP status line and headers, then the HTML as it was extracted (rendered for pages
+# that went through the browser)
+def build_record(url, html, status=200, headers=(), fetched_at=None, source_type=None, rendered=False):
+    fetched_at = time.time() if fetched_at is None else fetched_at
+    try:
+        reason = HTTPStatus(status).phrase
+    except ValueError:
+        reason = ''
+    http = [f'HTTP/1.1 {status} {reason}'.rstrip()]
+    http += [f'{name}: {value}' for name, value in headers if name.lower() not in DROPPED_HEADERS]
+    payload = ('\r\n'.join(http) + '\r\n\r\n').encode('utf-8') + html.encode('utf-8', 'surrogatepass')
+    warc = [
+        'WARC/1.1',
+        'WARC-Type: response',
+        f'WARC-Record-ID: <urn:uuid:{uuid.uuid4()}>',
+        f'WARC-Date: {datetime.fromtimestamp(fetched_at, timezone.utc).strftime(WARC_DATE_FORMAT)}',
+        f'WARC-Target-URI: {url}',
+        'Content-Type: application/http; msgtype=response',
+        f'X-Scrape-Rendered: {int(rendered)}',
+    ]
+    if source_type:
+        warc.append(f'X-Scrape-Source-Type: {source_type}')
+    warc.append(f'Content-Length: {len(payload)}')
+    return ('\r\n'.join(warc) + '\r\n\r\n').encode('utf-8') + payload + b'\r\n\r\n'
+
+def _header_lines(lines):
+    headers = []
+    for line in lines:
+        name, _, value = line.partition(':')
+        headers.append((name.strip(), value.strip()))
+    return headers
+
+# Function to parse a decompressed record back into a dict (url, fetched_at, status,
+# headers, html, source_type, rendered)
+def parse_record(data):
+    warc_head, _, rest = data.partition(b'\r\n\r\n')
+    fields = {name.lower(): value for name, value in _header_lines(warc_head.decode('utf-8').split('\r\n')[1:])}
+    payload = rest[:int(fields['content-length'])]
+    http_head, _, body = payload.partition(b'\r\n\r\n')
+    http_lines = http_head.decode('utf-8').split('\r\n')
+    fetched_at = datetime.strptime(fields['warc-date'], WARC_DATE_FORMAT).replace(tzinfo=timezone.utc)
+    return {
+        'url': fields['warc-target-uri'],
+        'fetched_at': fetched_at.timestamp(),
+        'status': int(http_lines[0].split()[1]),
+        'headers': _header_lines(http_lines[1:]),
+        'html': body.decode('utf-8', 'surrogatepass'),
+        'source_type': fields.get('x-scrape-source-type'),
+        'rendered': fields.get('x-scrape-rendered') == '1',
+    }
+
+def _read_at(f, segment, offset, length):
+    f.seek(offset)
+    return parse_record(decompress(segment, f.read(length)))
+
+# Function to read one record from an archive directory by its index entry
+def read_record(directory, segment, offset, length):
+    with open(os.path.join(directory, segment), 'rb') as f:
+        return _read_at(f, segment, offset, length)
+
+# Function to read and extract a batch of (directory, segment, offset, length) records in a
+# worker, so only the index entries and the extracted records cross the process boundary.
+# Returns (ok, (page record, links)) per record like postprocess.build_page_records.
+def replay_records(jobs):
+    results = []
+    files = {}
+    try:
+        for directory, segment, offset, length in jobs:
+            try:
+                path = os.path.join(directory, segment)
+                if path not in files:
+                    files[path] = open(path, 'rb')
+                record = _read_at(files[path], segment, offset, length)
+                results.append((True, build_page_record(record['url'], record['html'], record['source_type'] or 'website')))
+            except Exception as e:
+                results.append((False, f"{segment}@{offset}: {type(e).__name__}: {e}"))
+    finally:
+        for f in files.values():
+            f.close()
+    return results
+
+# Append-only archive of every page the crawler extracted. Records go to numbered segment
+# files (a new one past segment_bytes) and each gets a row in an SQLite index with its
+# segment, offset and compressed length, for random access by URL and for replay.
+# Compression runs on the calling thread; appends are serialized by a lock, and the index
+# is committed every commit_every records, at each segment rollover and on close, after the
+# segment data it points to is flushed. Records appended after the last commit by a run that
+# crashed are re-indexed from the segment tail when the archive is opened again.
+class PageArchive:
+    def __init__(self, directory=ARCHIVE_DIR, compression=ARCHIVE_COMPRESSION, level=ARCHIVE_COMPRESSION_LEVEL,
+                 segment_bytes=ARCHIVE_SEGMENT_BYTES, commit_every=INDEX_COMMIT_EVERY):
+        if compression not in SEGMENT_SUFFIXES:
+            raise ValueError(f"Unknown archive compression: {compression}")
+        self.directory = directory
+        self.compression = compression
+        self.segment_bytes = segment_bytes
+        self.commit_every = commit_every
+        self.records_written = 0
+        self._compress = make_compressor(compression, level)
+        self._lock = threading.Lock()
+        self._pending = 0
+        os.makedirs(directory, exist_ok=True)
+        self.conn = sqlite3.connect(os.path.join(directory, INDEX_NAME), check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute(CREATE_RECORDS)
+        self.conn.execute(CREATE_RECORDS_URL_INDEX)
+        self.conn.commit()
+        self._recover()
+        self._open_segment(*self._last_segment())
+
+    # Segment files in the directory as sorted (number, name) pairs
+    def _segments(self):
+        matches = [match for match in map(SEGMENT_PATTERN.match, os.listdir(self.directory)) if match]
+        return sorted((int(match.group(1)), match.group(0)) for match in matches)
+
+    # Continue the newest segment if it has the same compression and room left
+    def _last_segment(self):
+        segments = self._segments()
+        if not segments:
+            return 0, False
+        number, name = segments[-1]
+        reusable = (name.endswith(SEGMENT_SUFFIXES[self.compression])
+                    and os.path.getsize(os.path.join(self.directory, name)) < self.segment_bytes)
+        return number if reusable else number + 1, reusable
+
+    # Index the records a previous run appended after its last index commit. Every segment
+    # before the one holding the last indexed record was committed at rollover, so only that
+    # segment (from the end of the record) and newer ones are scanned. A record torn by the
+    # crash is cut off, so later appends don't follow garbage.
+    def _recover(self):
+        last = self.conn.execute(SELECT_LAST).fetchone()
+        first = int(SEGMENT_PATTERN.match(last[0]).group(1)) if last else 0
+        recovered = 0
+        for number, name in self._segments():
+            start = last[1] if last and name == last[0] else 0
+            path = os.path.join(self.directory, name)
+            if number < first or os.path.getsize(path) <= start:
+                continue
+            end = start
+            with open(path, 'r+b') as f:
+                try:
+                    for offset, length, record in scan_records(f, name, start):
+                        self.conn.execute(INSERT_RECORD, (record['url'], name, offset, length, record['fetched_at'],
+                                                          record['status'], int(record['rendered'])))
+                        recovered += 1
+                        end = offset + length
+                except Exception as e:
+                    logging.warning(f"Unreadable page archive record in {name} at offset {end}: {str(e)}")
+                size = f.seek(0, os.SEEK_END)
+                if size > end:
+                    logging.warning(f"Truncating {size - end} bytes of incomplete records from {name}")
+                    f.truncate(end)
+        self.conn.commit()
+        if recovered:
+            logging.info(f"Re-indexed {recovered} page archive records written after the last index commit")
+
+    def _open_segment(self, number, existing=False):
+        self.number = number
+        self.segment = f'pages-{number:05d}{SEGMENT_SUFFIXES[self.compression]}'
+        self._file = open(os.path.join(self.directory, self.segment), 'ab')
+        if existing:
+            logging.info(f"Appending to page archive segment {self.segment}")
+
+    def _commit(self):
+        self._file.flush()
+        self.conn.commit()
+        self._pending = 0
+
+    # Compress and append one page; returns (segment, offset, length)
+    def append(self, url, html, status=200, headers=(), fetched_at=None, source_type=None, rendered=False):
+        fetched_at = time.time() if fetched_at is None else fetched_at
+        data = self._compress(build_record(url, html, status, headers, fetched_at, source_type, rendered))
+        with self._lock:
+            if self._file.tell() and self._file.tell() + len(data) > self.segment_bytes:
+                self._commit()
+                self._file.close()
+                self._open_segment(self.number + 1)
+            offset = self._file.tell()
+            self._file.write(data)
+            self.conn.execute(INSERT_RECORD, (url, self.segment, offset, len(data), fetched_at, status, int(rendered)))
+            self.records_written += 1
+            self._pending += 1
+            if self._pending >= self.commit_every:
+                self._commit()
+        metrics.inc('bytes_total', len(data), kind='archived')
+        return self.segment, offset, len(data)
+
+    # Same as append, on a worker thread so compression and disk writes stay off the event loop
+    async def add(self, *args, **kwargs):
+        with metrics.timer('archive'):
+            return await asyncio.to_thread(self.append, *args, **kwargs)
+
+    # Latest archived record of a URL, or None
+    def get(self, url):
+        with self._lock:
+            self._file.flush()
+            row = self.conn.execute(SELECT_URL, (url,)).fetchone()
+        return read_record(self.directory, *row) if row else None
+
+    def close(self):
+        with self._lock:
+            self._commit()
+            self._file.close()
+            self.conn.close()
+        logging.info(f"Page archive closed after writing {self.records_written} records")
+
+# Re-extracts archived pages into the database with no browser and no network: index
+# entries are sent to the post-processing workers in batches of batch_records (which read,
+# decompress and extract them), with at most two batches per worker in flight. Results go
+# through the crawl's exact and near-duplicate checks and into the DB writer. Only the
+# latest record of each URL is replayed unless all_records is set. Returns outcome counts.
+async def replay(writer, postprocessor, directory=ARCHIVE_DIR, all_records=False, batch_records=ARCHIVE_REPLAY_BATCH):
+    conn = sqlite3.connect(os.path.join(directory, INDEX_NAME))
+    content_hashes = ContentDedup()
+    near_duplicates = NearDuplicateDetector() if NEAR_DUP_ENABLED else None
+    batches = asyncio.Semaphore(2 * max(1, postprocessor.workers))
+    counts = {}
+    tasks = set()
+
+    def classify(data):
+        code_blocks = [block['code'] for block in data['code_blocks']]
+        if not data['content'] and not code_blocks:
+            return 'empty'
+        if not content_hashes.add_fingerprint(data['fingerprint']):
+            return 'duplicate'
+        if near_duplicates is not None and near_duplicates.check_and_add(
+                data['url'], data['content'], code_blocks, data.get('signature')):
+            return 'near_duplicate'
+        return 'stored'
+
+    def count(outcome, amount=1):
+        counts[outcome] = counts.get(outcome, 0) + amount
+        metrics.inc('pages_total', amount, outcome=outcome)
+
+    async def run(jobs):
+        try:
+            with metrics.timer('replay_batch'):
+                results = await postprocessor.run_batch(replay_records, jobs)
+        except Exception as e:
+            logging.error(f"Error replaying {len(jobs)} archived pages: {str(e)}")
+            count('failed', len(jobs))
+            return
+        finally:
+            batches.release()
+        pages = []
+        for ok, value in results:
+            if not ok:
+                logging.warning(f"Could not replay archived page {value}")
+                count('failed')
+                continue
+            data, _ = value
+            for stage, seconds in data.pop('timings', {}).items():
+                metrics.observe_stage(stage, seconds)
+            outcome = classify(data)
+            count(outcome)
+            if outcome == 'stored':
+                pages.append(data)
+        if pages:
+            await writer.store_data(pages)
+
+    def spawn(jobs):
+        task = asyncio.ensure_future(run(jobs))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+
+    started = time.monotonic()
+    try:
+        batch = []
+        for segment, offset, length in conn.execute(SELECT_ALL if all_records else SELECT_LATEST):
+            batch.append((directory, segment, offset, length))
+            if len(batch) >= batch_records:
+                await batches.acquire()
+                spawn(batch)
+                batch = []
+        if batch:
+            await batches.acquire()
+            spawn(batch)
+        while tasks:
+            await asyncio.gather(*list(tasks))
+        await writer.flush()
+    finally:
+        conn.close()
+        content_hashes.close()
+    elapsed = time.monotonic() - started
+    total = sum(counts.values())
+    logging.info(f"Replayed {total} archived pages in {elapsed:.1f}s ({total / max(elapsed, 1e-9):.1f} pages/s): {counts}")
+    return counts
+
+if __name__ == '__main__':
+    from db_writer import DBWriter
+
+    parser = argparse.ArgumentParser(description='Read or replay the raw page archive')
+    parser.add_argument('--archive', default=ARCHIVE_DIR, help='Archive directory (default: ARCHIVE_DIR)')
+    commands = parser.add_subparsers(dest='command', required=True)
+    replay_parser = commands.add_parser('replay', help='Re-extract every archived page into the database')
+    replay_parser.add_argument('--db', default=DB_PATH, help='Database to write to (default: DB_PATH)')
+    replay_parser.add_argument('--all', action='store_true', help='Replay every record, not just the latest per URL')
+    get_parser = commands.add_parser('get', help='Print the latest archived HTML of a URL')
+    get_parser.add_argument('url')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    if args.command == 'get':
+        conn = sqlite3.connect(os.path.join(args.archive, INDEX_NAME))
+        row = conn.execute(SELECT_URL, (args.url,)).fetchone()
+        conn.close()
+        if row is None:
+            raise SystemExit(f"{args.url} is not in {args.archive}")
+        print(read_record(args.archive, *row)['html'])
+    else:
+        async def run_replay():
+            writer = DBWriter(args.db)
+            postprocessor = PostProcessor()
+            try:
+                await replay(writer, postprocessor, args.archive, args.all)
+            finally:
+                await postprocessor.close()
+                await writer.close()
+
+        asyncio.run(run_replay())
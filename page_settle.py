@@ -0,0 +1,126 @@
+import logging
+
+from scrape_settings import SETTLE_QUIET_MS, SETTLE_TIMEOUT, SCROLL_MAX_ITERATIONS, SCROLL_TIME_BUDGET
+
+# Counts fetch/XHR requests in flight from the moment it is installed (once per document);
+# requests started earlier are still seen through Resource Timing entries when they finish
+NETWORK_TRACKER = '''
+if (!window.__settleTracker) {
+    const tracker = window.__settleTracker = {inFlight: 0};
+    const track = (promise) => {
+        tracker.inFlight++;
+        const done = () => { tracker.inFlight = Math.max(0, tracker.inFlight - 1); };
+        promise.then(done, done);
+        return promise;
+    };
+    if (window.fetch) {
+        const fetch = window.fetch;
+        window.fetch = function () { return track(fetch.apply(this, arguments)); };
+    }
+    const send = XMLHttpRequest.prototype.send;
+    XMLHttpRequest.prototype.send = function () {
+        track(new Promise((resolve) => this.addEventListener('loadend', resolve)));
+        return send.apply(this, arguments);
+    };
+}
+'''
+
+# Resolves once the DOM has had no mutations, no new finished resources and no tracked
+# requests in flight for quietMs (and the document is loaded), or after timeoutMs
+WAIT_FOR_QUIET = NETWORK_TRACKER + '''
+const waitForQuiet = (quietMs, timeoutMs) => new Promise((resolve) => {
+    const start = performance.now();
+    let last = start;
+    let resources = performance.getEntriesByType('resource').length;
+    const observer = new MutationObserver(() => { last = performance.now(); });
+    observer.observe(document.documentElement, {childList: true, subtree: true, attributes: true, characterData: true});
+    const timer = setInterval(() => {
+        const now = performance.now();
+        const finished = performance.getEntriesByType('resource').length;
+        if (finished !== resources || window.__settleTracker.inFlight > 0) {
+            resources = finished;
+            last = now;
+        }
+        const settled = document.readyState === 'complete' && now - last >= quietMs;
+        if (settled || now - start >= timeoutMs) {
+            clearInterval(timer);
+            observer.disconnect();
+            resolve({settled: settled, waited: now - start});
+        }
+    }, 50);
+});
+'''
+
+SETTLE_SCRIPT = WAIT_FOR_QUIET + '''
+const done = arguments[arguments.length - 1];
+waitForQuiet(arguments[0], arguments[1]).then(done);
+'''
+
+# Scrolls to the bottom and waits for the page to settle, until the height stops growing,
+# maxIterations scrolls were made or budgetMs has passed; all in one WebDriver call
+SCROLL_SCRIPT = WAIT_FOR_QUIET + '''
+const [quietMs, timeoutMs, maxIterations, budgetMs] = arguments;
+const done = arguments[arguments.length - 1];
+const start = performance.now();
+(async () => {
+    let height = document.body.scrollHeight;
+    let iterations = 0;
+    while (iterations < maxIterations) {
+        const remaining = budgetMs - (performance.now() - start);
+        if (remaining <= 0) break;
+        window.scrollTo(0, document.body.scrollHeight);
+        iterations++;
+        await waitForQuiet(quietMs, Math.min(timeoutMs, remaining));
+        const grown = document.body.scrollHeight;
+        if (grown === height) break;
+        height = grown;
+    }
+    done({iterations: iterations, height: height, elapsed: performance.now() - start});
+})();
+'''
+
+# Clicks every button whose text contains one of the labels, in one WebDriver call
+CLICK_SCRIPT = '''
+const labels = arguments[0];
+let clicked = 0;
+let failed = 0;
+for (const button of Array.from(document.querySelectorAll('button'))) {
+    const text = button.textContent || '';
+    if (!labels.some((label) => text.includes(label))) continue;
+    try {
+        button.click();
+        clicked++;
+    } catch (e) {
+        failed++;
+    }
+}
+return [clicked, failed];
+'''
+
+def _script_timeout(seconds):
+    # Selenium's own script timeout must outlast the in-page cap
+    return seconds + 5
+
+# Function to wait until a page stops changing (DOM mutations and network), up to timeout seconds
+async def wait_for_settle(browser, timeout=SETTLE_TIMEOUT, quiet_ms=SETTLE_QUIET_MS):
+    await browser.set_script_timeout(_script_timeout(timeout))
+    result = await browser.execute_async_script(SETTLE_SCRIPT, quiet_ms, timeout * 1000)
+    if not result['settled']:
+        logging.debug(f"Page did not settle within {timeout}s")
+    return result
+
+# Function to load lazily appended content, bounded by both scroll count and time budget
+async def scroll_to_end(browser, max_iterations=SCROLL_MAX_ITERATIONS, budget=SCROLL_TIME_BUDGET,
+                        timeout=SETTLE_TIMEOUT, quiet_ms=SETTLE_QUIET_MS):
+    await browser.set_script_timeout(_script_timeout(budget))
+    return await browser.execute_async_script(SCROLL_SCRIPT, quiet_ms, timeout * 1000, max_iterations, budget * 1000)
+
+# Function to click every matching button in one batch, then wait once for the page to settle.
+# Returns how many buttons were clicked.
+async def click_all(browser, labels, timeout=SETTLE_TIMEOUT):
+    clicked, failed = await browser.execute_script(CLICK_SCRIPT, list(labels))
+    if failed:
+        logging.warning(f"{failed} button clicks failed at {await browser.current_url()}")
+    if clicked:
+        await wait_for_settle(browser, timeout)
+    return clicked
@@ -0,0 +1,271 @@
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+
+from scrape_settings import (
+    POLITENESS_INITIAL_RATE, POLITENESS_MIN_RATE, POLITENESS_MAX_RATE, POLITENESS_RATE_STEP,
+    POLITENESS_BACKOFF_FACTOR, POLITENESS_BURST, POLITENESS_INITIAL_CONCURRENCY, POLITENESS_MAX_CONCURRENCY,
+    POLITENESS_TARGET_LATENCY, POLITENESS_MAX_RETRY_AFTER, POLITENESS_MAX_RETRIES, POLITENESS_TOTAL_CONCURRENCY
+)
+
+BACKOFF_STATUSES = (429, 503)
+
+# Function to get the host key a URL is scheduled under (same as the frontier's host column)
+def host_of(url):
+    return urlparse(url).netloc.lower()
+
+# Function to turn a Retry-After header (delta-seconds or an HTTP date) into seconds from now
+def parse_retry_after(value, now=None):
+    if value is None:
+        return None
+    if isinstance(value, bytes):
+        value = value.decode('latin-1')
+    value = value.strip()
+    if not value:
+        return None
+    if value.isdigit():
+        return float(value)
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when.timestamp() - (time.time() if now is None else now))
+
+# One request's hold on a host. The caller fills in status / retry_after / error
+# before it is released, and the scheduler adapts the host's rate from them.
+class HostLease:
+    def __init__(self, host):
+        self.host = host
+        self.started = time.monotonic()
+        self.status = None
+        self.retry_after = None
+        self.error = False
+
+# Token bucket plus concurrency limit for one host, tuned AIMD-style: a fast success adds
+# rate_step requests/second (and one slot per window of successes), while a 429/503, an
+# error or a response slower than target_latency multiplies both by backoff_factor, at
+# most once per observed round trip so one burst of bad responses only counts once.
+class HostState:
+    def __init__(self, host, rate, concurrency, burst):
+        self.host = host
+        self.rate = rate
+        self.concurrency = concurrency
+        self.burst = burst
+        self.tokens = min(1.0, burst)
+        self.refilled_at = time.monotonic()
+        self.in_flight = 0
+        self.blocked_until = 0.0
+        self.last_decrease = 0.0
+        self.successes = 0
+        self.requests = 0
+        self.backoffs = 0
+        self.changed = asyncio.Event()
+
+    # Wake every request waiting on this host so it re-checks its wait time
+    def notify(self):
+        self.changed.set()
+        self.changed = asyncio.Event()
+
+    def refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.refilled_at) * self.rate)
+        self.refilled_at = now
+
+    # Seconds until a request may start, or None while every concurrency slot is taken
+    def wait_time(self, now):
+        if self.in_flight >= self.concurrency:
+            return None
+        self.refill(now)
+        wait = max(0.0, self.blocked_until - now)
+        if self.tokens < 1:
+            wait = max(wait, (1 - self.tokens) / self.rate)
+        return wait
+
+    def snapshot(self):
+        return {
+            'rate': round(self.rate, 3),
+            'concurrency': self.concurrency,
+            'in_flight': self.in_flight,
+            'blocked_for': round(max(0.0, self.blocked_until - time.monotonic()), 1),
+            'requests': self.requests,
+            'backoffs': self.backoffs,
+        }
+
+# Per-host politeness scheduler shared by every download path (Scrapy downloads through
+# PolitenessMiddleware, static re-fetches and browser renders through slot()). Each host
+# has its own HostState, so a slow or throttling host only delays its own requests while
+# the others keep going; limit (total_concurrency unless throttled) caps downloads in
+# flight across all hosts.
+class PolitenessScheduler:
+    def __init__(self, initial_rate=POLITENESS_INITIAL_RATE, min_rate=POLITENESS_MIN_RATE, max_rate=POLITENESS_MAX_RATE,
+                 rate_step=POLITENESS_RATE_STEP, backoff_factor=POLITENESS_BACKOFF_FACTOR, burst=POLITENESS_BURST,
+                 initial_concurrency=POLITENESS_INITIAL_CONCURRENCY, max_concurrency=POLITENESS_MAX_CONCURRENCY,
+                 target_latency=POLITENESS_TARGET_LATENCY, max_retry_after=POLITENESS_MAX_RETRY_AFTER,
+                 total_concurrency=POLITENESS_TOTAL_CONCURRENCY):
+        self.initial_rate = initial_rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.rate_step = rate_step
+        self.backoff_factor = backoff_factor
+        self.burst = burst
+        self.initial_concurrency = initial_concurrency
+        self.max_concurrency = max_concurrency
+        self.target_latency = target_latency
+        self.max_retry_after = max_retry_after
+        self.total_concurrency = total_concurrency
+        self.limit = total_concurrency
+        self.hosts = {}
+        self._active = 0
+        self._slot_freed = None
+
+    @property
+    def in_flight(self):
+        return sum(state.in_flight for state in self.hosts.values())
+
+    # Change how many downloads may be in flight across all hosts (e.g. under memory
+    # pressure); downloads already running finish, new ones wait until below the limit
+    def set_limit(self, limit):
+        self.limit = max(1, min(limit, self.total_concurrency))
+        self._free_slot()
+
+    def _free_slot(self):
+        if self._slot_freed is not None:
+            self._slot_freed.set()
+            self._slot_freed = None
+
+    async def _acquire_total(self):
+        while self._active >= self.limit:
+            if self._slot_freed is None:
+                # Created on first use so the scheduler can be built outside a running loop
+                self._slot_freed = asyncio.Event()
+            await self._slot_freed.wait()
+        self._active += 1
+
+    def state(self, host):
+        state = self.hosts.get(host)
+        if state is None:
+            state = self.hosts[host] = HostState(host, self.initial_rate, self.initial_concurrency, self.burst)
+        return state
+
+    async def acquire(self, url):
+        state = self.state(host_of(url))
+        while True:
+            wait = state.wait_time(time.monotonic())
+            if wait == 0:
+                break
+            try:
+                await asyncio.wait_for(state.changed.wait(), wait)
+            except asyncio.TimeoutError:
+                pass
+        state.tokens -= 1
+        state.in_flight += 1
+        try:
+            await self._acquire_total()
+        except BaseException:
+            state.in_flight -= 1
+            state.notify()
+            raise
+        state.requests += 1
+        return HostLease(state.host)
+
+    def release(self, lease):
+        state = self.hosts[lease.host]
+        state.in_flight -= 1
+        self._active -= 1
+        self._free_slot()
+        now = time.monotonic()
+        latency = now - lease.started
+        if lease.status in BACKOFF_STATUSES or lease.error:
+            reason = f"HTTP {lease.status}" if lease.status else "error"
+            self._decrease(state, now, latency, reason)
+            retry_after = parse_retry_after(lease.retry_after)
+            if lease.status in BACKOFF_STATUSES:
+                delay = min(retry_after if retry_after is not None else 1 / state.rate, self.max_retry_after)
+                state.blocked_until = max(state.blocked_until, now + delay)
+                state.tokens = min(state.tokens, 0.0)
+                logging.info(f"{state.host} answered {lease.status}; pausing {delay:.1f}s "
+                             f"at {state.rate:.2f} req/s x {state.concurrency}")
+        elif latency > self.target_latency:
+            self._decrease(state, now, latency, f"{latency:.1f}s response")
+        else:
+            state.rate = min(self.max_rate, state.rate + self.rate_step)
+            state.successes += 1
+            if state.successes >= state.concurrency and state.concurrency < self.max_concurrency:
+                state.concurrency += 1
+                state.successes = 0
+        state.notify()
+
+    def _decrease(self, state, now, latency, reason):
+        if now - state.last_decrease < latency:
+            return
+        state.rate = max(self.min_rate, state.rate * self.backoff_factor)
+        state.concurrency = max(1, int(state.concurrency * self.backoff_factor))
+        state.successes = 0
+        state.last_decrease = now
+        state.backoffs += 1
+        logging.debug(f"Backing off {state.host} ({reason}): {state.rate:.2f} req/s x {state.concurrency}")
+
+    # Hold a host slot around a download that doesn't go through Scrapy; set status and
+    # retry_after on the yielded lease so the scheduler can adapt to the response
+    @asynccontextmanager
+    async def slot(self, url):
+        lease = await self.acquire(url)
+        try:
+            yield lease
+        except Exception:
+            lease.error = True
+            raise
+        finally:
+            self.release(lease)
+
+    def snapshot(self):
+        return {host: state.snapshot() for host, state in self.hosts.items()}
+
+# Scrapy downloader middleware that routes every download through the crawling spider's
+# PolitenessScheduler (crawler.spider.politeness). 429/503 responses are retried here, after
+# the host's Retry-After pause, up to max_retries times; Scrapy's RetryMiddleware must leave
+# those codes alone (see WebsiteSpider.custom_settings).
+class PolitenessMiddleware:
+    def __init__(self, crawler, max_retries=POLITENESS_MAX_RETRIES):
+        self.crawler = crawler
+        self.max_retries = max_retries
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler)
+
+    @property
+    def scheduler(self):
+        return getattr(self.crawler.spider, 'politeness', None)
+
+    async def process_request(self, request):
+        scheduler = self.scheduler
+        if scheduler is not None and 'politeness_lease' not in request.meta:
+            request.meta['politeness_lease'] = await scheduler.acquire(request.url)
+        return None
+
+    def process_response(self, request, response):
+        lease = request.meta.pop('politeness_lease', None)
+        if lease is None:
+            return response
+        lease.status = response.status
+        lease.retry_after = response.headers.get('Retry-After')
+        self.scheduler.release(lease)
+        if response.status in BACKOFF_STATUSES:
+            retries = request.meta.get('politeness_retries', 0)
+            if retries < self.max_retries:
+                logging.info(f"Retrying {request.url} after HTTP {response.status} (retry {retries + 1}/{self.max_retries})")
+                retry = request.copy()
+                retry.meta['politeness_retries'] = retries + 1
+                retry.dont_filter = True
+                return retry
+        return response
+
+    def process_exception(self, request, exception):
+        lease = request.meta.pop('politeness_lease', None)
+        if lease is not None:
+            lease.error = True
+            self.scheduler.release(lease)
+        return None
@@ -0,0 +1,194 @@
+import asyncio
+import logging
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from urllib.parse import urljoin
+
+from dedup import ContentDedup, canonicalize_url
+from telemetry import metrics
+from html_extract import extract_page, clean_text
+from lang_detect import detect_language
+from near_dup import NearDuplicateDetector
+from token_store import tokenize_for_storage
+from scrape_settings import (
+    TOKENIZE_ON_WRITE, NEAR_DUP_ENABLED, POSTPROCESS_MODE, POSTPROCESS_WORKERS, POSTPROCESS_MAX_PENDING,
+    POSTPROCESS_BATCH_BYTES, POSTPROCESS_BATCH_DELAY, LINK_EXCLUDE_CLASSES
+)
+
+_near_duplicates = None
+
+# Function to resolve a page's (href, class) pairs into unique canonical absolute URLs,
+# dropping fragment-only links and anchors with an excluded class (e.g. sidebar navigation)
+def resolve_links(url, links, exclude_classes=LINK_EXCLUDE_CLASSES):
+    resolved = {}
+    for href, css_class in links:
+        if href.startswith('#') or any(name in css_class for name in exclude_classes):
+            continue
+        resolved.setdefault(canonicalize_url(urljoin(url, href)), None)
+    return list(resolved)
+
+# Function to turn raw HTML into a page record plus canonical links. Runs in the worker
+# pool, so it also precomputes the exact and near-duplicate fingerprints that
+# is_valid_data would otherwise compute on the event loop. Per-stage seconds are returned
+# in data['timings'] for the parent process to record.
+def build_page_record(url, html, source_type):
+    global _near_duplicates
+    timings = {'extract': 0.0, 'detect': 0.0, 'tokenize': 0.0, 'fingerprint': 0.0}
+    started = time.perf_counter()
+    page = extract_page(html)
+    data = {
+        'url': url,
+        'title': page['title'],
+        'content': clean_text(page['text']),
+        'code_blocks': [],
+        'source_type': source_type
+    }
+    now = time.perf_counter()
+    timings['extract'] = now - started
+    for code_block, hint in page['code_blocks']:
+        language, _ = detect_language(code_block, hint)
+        detected = time.perf_counter()
+        timings['detect'] += detected - now
+        data['code_blocks'].append({
+            'code': code_block,
+            'language': language,
+            'tokens': tokenize_for_storage(code_block, language, eager=TOKENIZE_ON_WRITE)
+        })
+        now = time.perf_counter()
+        timings['tokenize'] += now - detected
+
+    codes = [block['code'] for block in data['code_blocks']]
+    data['fingerprint'] = ContentDedup.fingerprint(data['content'], codes)
+    if NEAR_DUP_ENABLED:
+        if _near_duplicates is None:
+            _near_duplicates = NearDuplicateDetector()
+        data['signature'] = _near_duplicates.signature(data['content'], codes)
+    timings['fingerprint'] = time.perf_counter() - now
+    data['timings'] = timings
+
+    return data, resolve_links(url, page['links'])
+
+# Function to process a batch of (url, html, source_type) jobs in one worker round trip
+def build_page_records(jobs):
+    results = []
+    for url, html, source_type in jobs:
+        try:
+            results.append((True, build_page_record(url, html, source_type)))
+        except Exception as e:
+            results.append((False, f"{type(e).__name__}: {e}"))
+    return results
+
+# Post-processing stage between fetching and the DB writer. Pages are sent to a process
+# (or thread) pool; pages smaller than batch_bytes are grouped into one task to amortize
+# pickling and scheduling, and at most max_pending pages may be outstanding, so fetchers
+# block (backpressure) instead of queueing unbounded HTML in memory.
+class PostProcessor:
+    def __init__(self, mode=POSTPROCESS_MODE, workers=POSTPROCESS_WORKERS, max_pending=POSTPROCESS_MAX_PENDING,
+                 batch_bytes=POSTPROCESS_BATCH_BYTES, batch_delay=POSTPROCESS_BATCH_DELAY):
+        self.mode = mode
+        self.workers = workers
+        self.max_pending = max_pending
+        self.batch_bytes = batch_bytes
+        self.batch_delay = batch_delay
+        self.pages_processed = 0
+        self.pending = 0
+        self._executor = None
+        self._slots = None
+        self._batch = []
+        self._batch_size = 0
+        self._flush_handle = None
+        self._tasks = set()
+
+    def _ensure_started(self):
+        if self._slots is not None:
+            return
+        self._slots = asyncio.Semaphore(self.max_pending)
+        if self.mode == 'process':
+            # spawn: forking a process that already runs browser and executor threads is unsafe
+            self._executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'))
+        elif self.mode == 'thread':
+            self._executor = ThreadPoolExecutor(self.workers)
+        elif self.mode != 'inline':
+            raise ValueError(f"Unknown post-processing mode: {self.mode}")
+        logging.info(f"Post-processing in {self.mode} mode with {self.workers} workers")
+
+    async def _run(self, jobs):
+        if self._executor is None:
+            return build_page_records(jobs)
+        return await asyncio.get_running_loop().run_in_executor(self._executor, build_page_records, jobs)
+
+    def _flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if not self._batch:
+            return
+        batch, self._batch, self._batch_size = self._batch, [], 0
+        self._spawn(batch)
+
+    def _spawn(self, batch):
+        task = asyncio.ensure_future(self._dispatch(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _dispatch(self, batch):
+        jobs = [job for job, _ in batch]
+        try:
+            results = await self._run(jobs)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), (ok, value) in zip(batch, results):
+            if future.done():
+                continue
+            if ok:
+                future.set_result(value)
+            else:
+                future.set_exception(RuntimeError(value))
+
+    # Returns (page record, links) for one page
+    async def process(self, url, html, source_type):
+        self._ensure_started()
+        await self._slots.acquire()
+        self.pending += 1
+        try:
+            started = time.monotonic()
+            future = asyncio.get_running_loop().create_future()
+            job = (url, html, source_type)
+            if len(html) >= self.batch_bytes:
+                self._spawn([(job, future)])
+            else:
+                self._batch.append((job, future))
+                self._batch_size += len(html)
+                if self._batch_size >= self.batch_bytes:
+                    self._flush()
+                elif self._flush_handle is None:
+                    self._flush_handle = asyncio.get_running_loop().call_later(self.batch_delay, self._flush)
+            data, links = await future
+            self.pages_processed += 1
+            for stage, seconds in data.pop('timings', {}).items():
+                metrics.observe_stage(stage, seconds)
+            metrics.observe_stage('postprocess', time.monotonic() - started)
+            metrics.inc('items_total', len(data['code_blocks']), kind='code_blocks')
+            logging.debug(f"Post-processed {url} in {time.monotonic() - started:.3f}s")
+            return data, links
+        finally:
+            self.pending -= 1
+            self._slots.release()
+
+    # Run fn(jobs) for a batch of non-HTML work (e.g. repository files) on the same workers;
+    # fn must be a module-level function so process workers can unpickle it
+    async def run_batch(self, fn, jobs):
+        self._ensure_started()
+        if self._executor is None:
+            return fn(jobs)
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, jobs)
+
+    async def close(self):
+        self._flush()
+        if self._executor is not None:
+            await asyncio.to_thread(self._executor.shutdown, True)
+            self._executor = None
@@ -1,17 +1,30 @@
-import torch
-from transformers import LlamaTokenizer, LlamaForCausalLM, pipeline
+import asyncio
+import logging
+import os
 import sqlite3
+import time
 from tqdm import tqdm
 
+from generation import BatchedGenerator, load_model
+from generation_cache import GenerationCache
+from telemetry import metrics
+from db_writer import open_database
+from scrape_settings import QA_MODEL, QA_CHUNK_PAGES, QA_CACHE_PATH
+
 class LlamaQAGenerator:
-    def __init__(self, input_db="code_data.db", output_db="qa_pairs_llama.db"):
-        self.tokenizer = LlamaTokenizer.from_pretrained("meta-llama/Meta-Llama-3.1-8B-Instruct")  # Replace if using a different tokenizer
-        self.model = LlamaForCausalLM.from_pretrained("meta-llama/Meta-Llama-3.1-8B-Instruct", torch_dtype=torch.float16, device_map='auto')
+    def __init__(self, input_db="code_data.db", output_db="qa_pairs_llama.db", model_name=QA_MODEL):
+        self.tokenizer, self.model = load_model(model_name)
         self.input_db = input_db
         self.output_db = output_db
+        # Checkpoints count pages.id; the suffix keeps them apart from old code_data.id checkpoints
+        self.source_key = f"{os.path.abspath(input_db)}:pages"
         self.setup_database()
-        # Ensure you have a GPU available
-        self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+        asyncio.run(self.prepare_input())
+
+    # Create the normalized schema in the input database, migrating a legacy code_data table
+    async def prepare_input(self):
+        db = await open_database(self.input_db)
+        await db.close()
 
     def setup_database(self):
         with sqlite3.connect(self.output_db) as conn:
@@ -26,64 +39,147 @@ class LlamaQAGenerator:
                     qa_type TEXT
                 )
             ''')
-
-    def process_data(self):
-        pipe = pipeline(
-            "text-generation",
-            model=self.model,
-            tokenizer=self.tokenizer,
-            max_length=1024,
-            temperature=0.7,
-            top_p=0.95,
-            repetition_penalty=1.15
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS qa_checkpoint (
+                    source_db TEXT PRIMARY KEY,
+                    last_id INTEGER NOT NULL,
+                    updated_at REAL,
+                    changed_at REAL NOT NULL DEFAULT 0,
+                    changed_id INTEGER NOT NULL DEFAULT 0
+                )
+            ''')
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(qa_checkpoint)")}
+            for column, definition in (('changed_at', 'REAL NOT NULL DEFAULT 0'), ('changed_id', 'INTEGER NOT NULL DEFAULT 0')):
+                if column not in columns:
+                    conn.execute(f"ALTER TABLE qa_checkpoint ADD COLUMN {column} {definition}")
+            conn.execute("CREATE INDEX IF NOT EXISTS qa_pairs_source_url ON qa_pairs (source_url)")
+
+    # Returns (last page id, (changed_at, id) of the last regenerated changed page), or None
+    # when this input has no checkpoint yet
+    def load_checkpoint(self, conn):
+        row = conn.execute("SELECT last_id, changed_at, changed_id FROM qa_checkpoint WHERE source_db = ?",
+                           (self.source_key,)).fetchone()
+        return (row[0], (row[1], row[2])) if row else None
+
+    def reset_checkpoint(self):
+        with sqlite3.connect(self.output_db) as conn:
+            conn.execute("DELETE FROM qa_checkpoint WHERE source_db = ?", (self.source_key,))
+
+    # Pages are read in id order, QA_CHUNK_PAGES at a time (keyset pagination, so memory stays
+    # flat). Questions for every page in a chunk are generated in batches, each batch's
+    # answers (prompt + question) continuing from its questions' KV cache. Each chunk's pairs and the checkpoint are
+    # committed together, so a restarted run resumes after the last completed chunk.
+    # Pages processed by an earlier run are regenerated only when a re-crawl changed them
+    # (pages.changed_at); their old pairs are replaced.
+    def process_data(self, resume=True):
+        cache = GenerationCache(QA_CACHE_PATH) if QA_CACHE_PATH else None
+        generator = BatchedGenerator(self.model, self.tokenizer, cache=cache)
+        try:
+            self._process_chunks(generator, resume)
+        finally:
+            if cache is not None:
+                logging.info(f"Generation cache: {cache.stats()}")
+                cache.close()
+            logging.info(f"Generation timings: {metrics.snapshot()['stages'].get('generate')}")
+
+    def _process_chunks(self, generator, resume):
+        with sqlite3.connect(self.input_db) as source, sqlite3.connect(self.output_db) as output:
+            checkpoint = self.load_checkpoint(output) if resume else None
+            if checkpoint is not None:
+                last_id, changed = checkpoint
+            else:
+                # A run from the first page covers every change made so far, so the changed
+                # cursor starts at the current maximum and later runs only see newer changes
+                last_id = 0
+                changed = source.execute("SELECT COALESCE(MAX(changed_at), 0), COALESCE(MAX(id), 0) FROM pages").fetchone()
+            processed_id = last_id
+            remaining = source.execute(
+                "SELECT COUNT(*) FROM pages WHERE id > ? OR (id <= ? AND (changed_at > ? OR (changed_at = ? AND id > ?)))",
+                (last_id, processed_id, changed[0], changed[0], changed[1])
+            ).fetchone()[0]
+            with tqdm(total=remaining, desc="Generating Q&A pairs") as pbar:
+                while True:
+                    pages = source.execute(
+                        "SELECT id, url, title, content, source_type FROM page_texts WHERE id > ? ORDER BY id LIMIT ?",
+                        (last_id, QA_CHUNK_PAGES)
+                    ).fetchall()
+                    if not pages:
+                        break
+                    qa_rows = self._process_pages(pages, self._load_code_blocks(source, pages), generator)
+                    last_id = pages[-1][0]
+                    self._store_qa_pairs(output, qa_rows, last_id, changed)
+                    pbar.update(len(pages))
+
+                # Pages before this run's starting point that a re-crawl has changed since
+                while True:
+                    rows = source.execute(
+                        "SELECT page_texts.id, page_texts.url, page_texts.title, page_texts.content, "
+                        "page_texts.source_type, pages.changed_at FROM page_texts JOIN pages ON pages.id = page_texts.id "
+                        "WHERE pages.id <= ? AND (pages.changed_at > ? OR (pages.changed_at = ? AND pages.id > ?)) "
+                        "ORDER BY pages.changed_at, pages.id LIMIT ?",
+                        (processed_id, changed[0], changed[0], changed[1], QA_CHUNK_PAGES)
+                    ).fetchall()
+                    if not rows:
+                        break
+                    pages = [row[:5] for row in rows]
+                    qa_rows = self._process_pages(pages, self._load_code_blocks(source, pages), generator)
+                    changed = (rows[-1][5], rows[-1][0])
+                    self._store_qa_pairs(output, qa_rows, last_id, changed, replace_urls=[page[1] for page in pages])
+                    pbar.update(len(pages))
+
+    # Returns {page id: [(code, language), ...]} for a chunk of pages
+    def _load_code_blocks(self, source, pages):
+        code_blocks = {}
+        placeholders = ','.join('?' * len(pages))
+        for page_id, code, language in source.execute(
+            f"SELECT page_id, code, language FROM code_block_texts WHERE page_id IN ({placeholders}) "
+            "ORDER BY page_id, ordinal",
+            [page[0] for page in pages]
+        ):
+            code_blocks.setdefault(page_id, []).append((code, language))
+        return code_blocks
+
+    # Returns qa_pairs rows for a chunk of pages: one code Q&A per code block and one concept Q&A per page.
+    # Every prompt starts with its page's context, so the generator can prefill it once per page;
+    # the answer prompt is the question prompt followed by the generated question.
+    def _process_pages(self, pages, code_blocks, generator):
+        jobs = []
+        for page in pages:
+            page_id, url, title, content, source_type = page
+            context = self._context_prompt(url, title, content or '')
+
+            # Generate code-focused Q&A (if code is present)
+            for code_block, language in code_blocks.get(page_id, ()):
+                jobs.append((page, "code", context, self._code_question_prompt(code_block, language)))
+
+            # Generate concept-focused Q&A (always generate at least one)
+            jobs.append((page, "concept", context, self._concept_question_prompt(source_type)))
+
+        questions, answers = generator.generate_with_followup(
+            [context for _, _, context, _ in jobs], [prompt for _, _, _, prompt in jobs], "\nAnswer:"
         )
-        with sqlite3.connect(self.input_db) as conn:
-            cursor = conn.execute("SELECT * FROM code_data")
-            rows = cursor.fetchall()
-            for row in tqdm(rows, desc="Generating Q&A pairs"):
-                url, title, content, code_block, language, tokens, source_type = row[1:]
-
-                qa_pairs = []
 
-                # Generate code-focused Q&A (if code is present)
-                if code_block:
-                    qa_pairs.extend(self._generate_code_qa(url, title, content, code_block, language, pipe))
+        return [(page[1], page[2], page[3], question, answer, qa_type)
+                for (page, qa_type, _, _), question, answer in zip(jobs, questions, answers)]
 
-                # Generate concept-focused Q&A (always generate at least one)
-                qa_pairs.extend(self._generate_concept_qa(url, title, content, source_type, pipe))
+    def _context_prompt(self, url, title, content):
+        return f"""Context from {url} (titled "{title}"):
+        {content[:500]}
 
-                self._store_qa_pairs(url, title, content, qa_pairs)
+        """
 
-    def _generate_code_qa(self, url, title, content, code_block, language, pipe):
-        prompt = f"""Generate a detailed question that requires a full, working code solution based on the following code snippet (in {language}) and context from {url} (titled "{title}"):
+    def _code_question_prompt(self, code_block, language):
+        return f"""Generate a detailed question that requires a full, working code solution based on the context above and the following code snippet (in {language}):
 
         Code:
         ```{language}
         {code_block}
         ```
-
-        Context:
-        {content[:500]}
         
         Question:"""
 
-        output_sequences = pipe(prompt)
-        question = output_sequences[0]['generated_text'][len(prompt):].strip()
-        
-        prompt += f"\n{question}\nAnswer:"
-        
-        output_sequences = pipe(prompt)
-        answer = output_sequences[0]['generated_text'][len(prompt):].strip()
-
-        return [{"question": question, "answer": answer, "type": "code"}]
-        
-
-
-    def _generate_concept_qa(self, url, title, content, source_type, pipe):
-        prompt = f"""Generate a question and answer pair based on the following content from {url} (titled "{title}"):
-
-        Content:
-        {content[:500]}
+    def _concept_question_prompt(self, source_type):
+        return f"""Generate a question and answer pair based on the content above.
 
         The question should focus on a key concept or principle from the content.
         The answer should explain the concept, its importance, and practical applications.
@@ -92,20 +188,18 @@ class LlamaQAGenerator:
         
         Question:"""
 
-        output_sequences = pipe(prompt)
-        question = output_sequences[0]['generated_text'][len(prompt):].strip()
-
-        prompt += f"\n{question}\nAnswer:"
-
-        output_sequences = pipe(prompt)
-        answer = output_sequences[0]['generated_text'][len(prompt):].strip()
-
-        return [{"question": question, "answer": answer, "type": "concept"}]
-
-    def _store_qa_pairs(self, url, title, content, qa_pairs):
-        with sqlite3.connect(self.output_db) as conn:
-            for pair in qa_pairs:
-                conn.execute(
-                    "INSERT INTO qa_pairs (source_url, source_title, content, question, answer, qa_type) VALUES (?, ?, ?, ?, ?, ?)",
-                    (url, title, content, pair["question"], pair["answer"], pair["type"])
-                )
\ No newline at end of file
+    # Write a chunk's pairs and advance the checkpoint in one transaction; pairs previously
+    # generated for replace_urls are dropped first
+    def _store_qa_pairs(self, conn, qa_rows, last_id, changed, replace_urls=()):
+        with conn:
+            conn.executemany("DELETE FROM qa_pairs WHERE source_url = ?", [(url,) for url in replace_urls])
+            conn.executemany(
+                "INSERT INTO qa_pairs (source_url, source_title, content, question, answer, qa_type) VALUES (?, ?, ?, ?, ?, ?)",
+                qa_rows
+            )
+            conn.execute(
+                "INSERT INTO qa_checkpoint (source_db, last_id, updated_at, changed_at, changed_id) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT(source_db) DO UPDATE SET last_id = excluded.last_id, updated_at = excluded.updated_at, "
+                "changed_at = excluded.changed_at, changed_id = excluded.changed_id",
+                (self.source_key, last_id, time.time(), changed[0], changed[1])
+            )
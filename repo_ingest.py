@@ -0,0 +1,250 @@
+import argparse
+import asyncio
+import logging
+import os
+import subprocess
+import tarfile
+import tempfile
+import time
+from urllib.parse import urlparse
+
+from lang_detect import language_from_filename
+from telemetry import metrics
+from token_store import tokenize_for_storage
+from scrape_settings import (
+    TOKENIZE_ON_WRITE, GITHUB_TOKEN, GITHUB_API_URL, REPO_ARCHIVE_TIMEOUT, REPO_SPOOL_BYTES, REPO_MAX_FILE_BYTES,
+    REPO_BATCH_FILES, REPO_SKIP_DIRS
+)
+
+BINARY_SNIFF_BYTES = 8192
+
+# Function to split a GitHub URL into (owner, repo, ref); ref is None for the default branch.
+# Only the first path segment after tree/blob is taken, so a ref containing a slash
+# (tree/release/1.2) comes back truncated; ref_candidates() lists the longer readings.
+def parse_github_url(url):
+    parts = [part for part in urlparse(url).path.split('/') if part]
+    if len(parts) < 2:
+        raise ValueError(f"Not a GitHub repository URL: {url}")
+    owner, repo = parts[0], parts[1]
+    if repo.endswith('.git'):
+        repo = repo[:-4]
+    ref = parts[3] if len(parts) > 3 and parts[2] in ('tree', 'blob') else None
+    return owner, repo, ref
+
+# Function to list the refs a GitHub URL can name, shortest first. In .../tree/release/1.2/docs
+# the ref is 'release', 'release/1.2' or 'release/1.2/docs' (git allows only one of them to
+# exist), and only the API can tell which.
+def ref_candidates(url):
+    parts = [part for part in urlparse(url).path.split('/') if part]
+    if len(parts) < 4 or parts[2] not in ('tree', 'blob'):
+        return []
+    return ['/'.join(parts[3:end]) for end in range(4, len(parts) + 1)]
+
+# Function to decide whether an archive member is worth storing: a regular source file
+# with a known extension, not too large and outside vendored/generated directories
+def wanted_member(path, size, max_bytes=REPO_MAX_FILE_BYTES, skip_dirs=REPO_SKIP_DIRS):
+    if size > max_bytes or language_from_filename(path) is None:
+        return False
+    return not any(part in skip_dirs for part in path.split('/')[:-1])
+
+# Function to stream (path, bytes) for every wanted file in a tar archive. GitHub tarballs
+# and git archive --prefix put everything under one top-level directory, which is stripped.
+def iter_archive_files(fileobj, strip_top_level=True):
+    with tarfile.open(fileobj=fileobj, mode='r|*') as archive:
+        for member in archive:
+            if not member.isfile():
+                continue
+            path = member.name
+            if strip_top_level:
+                path = path.split('/', 1)[1] if '/' in path else path
+            if not wanted_member(path, member.size):
+                continue
+            f = archive.extractfile(member)
+            if f is not None:
+                yield path, f.read()
+
+# Function to turn one source file into a page record whose single code block is the whole
+# file, with the language taken from the extension. Returns None for binary/undecodable files.
+def build_file_record(base_url, title, path, raw):
+    if b'\0' in raw[:BINARY_SNIFF_BYTES]:
+        return None
+    try:
+        text = raw.decode('utf-8')
+    except UnicodeDecodeError:
+        return None
+    if not text.strip():
+        return None
+    language = language_from_filename(path)
+    return {
+        'url': f'{base_url}/{path}',
+        'title': title,
+        # Same text as the code block, so the content-addressed blob is stored once
+        'content': text,
+        'code_blocks': [{
+            'code': text,
+            'language': language,
+            'tokens': tokenize_for_storage(text, language, eager=TOKENIZE_ON_WRITE)
+        }],
+        'source_type': 'github_repo'
+    }
+
+# Function to build page records for a batch of (base_url, title, path, raw) jobs in a worker
+def build_file_records(jobs):
+    return [record for record in (build_file_record(*job) for job in jobs) if record is not None]
+
+# Function to write a local git repository (bare or not) at ref as a tar archive to a temp file
+def archive_local_repo(repo_path, ref='HEAD'):
+    spool = tempfile.TemporaryFile()
+    subprocess.run(['git', '-C', repo_path, 'archive', '--format=tar', '--prefix=repo/', ref],
+                   stdout=spool, check=True)
+    spool.seek(0)
+    return spool
+
+# Repository ingestion: one archive download per repository (GitHub's tarball endpoint),
+# streamed member by member. Files are turned into records in batches of batch_files on
+# the post-processing pool, and each batch goes to the DB writer as one store_data call.
+class RepoIngester:
+    def __init__(self, writer, postprocessor=None, politeness=None, token=GITHUB_TOKEN, api_url=GITHUB_API_URL,
+                 batch_files=REPO_BATCH_FILES):
+        self.writer = writer
+        self.postprocessor = postprocessor
+        self.politeness = politeness
+        self.token = token
+        self.api_url = api_url.rstrip('/')
+        self.batch_files = batch_files
+        self.files_stored = 0
+        self._session = None
+
+    async def session(self):
+        if self._session is None or self._session.closed:
+            from aiohttp import ClientSession, ClientTimeout
+
+            headers = {'Accept': 'application/vnd.github+json'}
+            if self.token:
+                headers['Authorization'] = f'Bearer {self.token}'
+            self._session = ClientSession(timeout=ClientTimeout(total=REPO_ARCHIVE_TIMEOUT), headers=headers)
+        return self._session
+
+    # Download a repository tarball into a spooled temp file (in memory up to REPO_SPOOL_BYTES)
+    async def download_archive(self, owner, repo, ref=None):
+        url = f'{self.api_url}/repos/{owner}/{repo}/tarball' + (f'/{ref}' if ref else '')
+        session = await self.session()
+        spool = tempfile.SpooledTemporaryFile(max_size=REPO_SPOOL_BYTES)
+        started = time.perf_counter()
+        try:
+            if self.politeness is not None:
+                async with self.politeness.slot(url) as lease:
+                    await self._fetch_into(session, url, spool, lease)
+            else:
+                await self._fetch_into(session, url, spool)
+        except BaseException:
+            spool.close()
+            raise
+        metrics.observe_stage('repo_download', time.perf_counter() - started)
+        metrics.inc('bytes_total', spool.tell(), kind='repo_archive')
+        spool.seek(0)
+        return spool
+
+    # Download the first of refs the repository has, trying each while GitHub answers 404, and
+    # the default branch when none exists; returns (archive, ref), ref None for the default branch
+    async def download_ref(self, owner, repo, refs):
+        from aiohttp import ClientResponseError
+
+        for ref in refs:
+            try:
+                return await self.download_archive(owner, repo, ref), ref
+            except ClientResponseError as e:
+                if e.status != 404:
+                    raise
+        if refs:
+            logging.warning(f"No ref {' or '.join(refs)} in {owner}/{repo}; ingesting the default branch")
+        return await self.download_archive(owner, repo), None
+
+    async def _fetch_into(self, session, url, spool, lease=None):
+        async with session.get(url) as resp:
+            if lease is not None:
+                lease.status = resp.status
+                lease.retry_after = resp.headers.get('Retry-After')
+            resp.raise_for_status()
+            async for chunk in resp.content.iter_chunked(1 << 16):
+                spool.write(chunk)
+
+    async def ingest_url(self, url):
+        owner, repo, _ = parse_github_url(url)
+        archive, ref = await self.download_ref(owner, repo, ref_candidates(url))
+        try:
+            return await self.ingest_archive(archive, f'https://github.com/{owner}/{repo}/blob/{ref or "HEAD"}', repo)
+        finally:
+            archive.close()
+
+    # Store every wanted file of a tar archive (file object) under base_url/<path>
+    async def ingest_archive(self, archive, base_url, title):
+        stored = 0
+        files = iter_archive_files(archive)
+        while True:
+            # Reading the tar stream is blocking I/O, so each batch is pulled on a thread
+            batch = await asyncio.to_thread(self._next_batch, files, base_url, title)
+            if not batch:
+                break
+            stored += await self._store_batch(batch)
+        self.files_stored += stored
+        logging.info(f"Ingested {stored} files from {base_url}")
+        return stored
+
+    def _next_batch(self, files, base_url, title):
+        batch = []
+        for path, raw in files:
+            batch.append((base_url, title, path, raw))
+            if len(batch) >= self.batch_files:
+                break
+        return batch
+
+    async def _store_batch(self, jobs):
+        started = time.perf_counter()
+        if self.postprocessor is not None:
+            records = await self.postprocessor.run_batch(build_file_records, jobs)
+        else:
+            records = build_file_records(jobs)
+        metrics.observe_stage('repo_files', time.perf_counter() - started)
+        if records:
+            await self.writer.store_data(records)
+        return len(records)
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+if __name__ == '__main__':
+    from db_writer import DBWriter
+
+    parser = argparse.ArgumentParser(description='Ingest a repository archive or local git repository into the database')
+    parser.add_argument('source', help='A .tar/.tar.gz archive, a local (bare) git repository, or a GitHub URL')
+    parser.add_argument('--url', help='Repository URL stored pages are named after (default: derived from source)')
+    parser.add_argument('--ref', default='HEAD', help='Ref to archive from a local repository')
+    parser.add_argument('--db', default=None, help='Database to write to (default: DB_PATH)')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    async def ingest():
+        writer = DBWriter(args.db) if args.db else DBWriter()
+        ingester = RepoIngester(writer)
+        try:
+            if args.source.startswith(('http://', 'https://')):
+                await ingester.ingest_url(args.source)
+                return
+            if args.url:
+                owner, repo, _ = parse_github_url(args.url)
+            else:
+                owner, repo = 'local', os.path.basename(os.path.abspath(args.source)).split('.')[0]
+            base_url = f'https://github.com/{owner}/{repo}/blob/{args.ref}'
+            if os.path.isdir(args.source):
+                archive = archive_local_repo(args.source, args.ref)
+            else:
+                archive = open(args.source, 'rb')
+            with archive:
+                await ingester.ingest_archive(archive, base_url, repo)
+        finally:
+            await ingester.close()
+            await writer.close()
+
+    asyncio.run(ingest())
@@ -1,5 +1,7 @@
 # scrape_settings.py
 
+import os
+
 # User Agents
 USER_AGENTS = [
     # Desktop - Windows
@@ -36,12 +38,161 @@ USER_AGENTS = [
 ]
 
 # Concurrency and Delay
-CONCURRENT_REQUESTS = 3  # Number of concurrent requests (adjust based on website policies)
-DOWNLOAD_DELAY = 10  # Delay between requests (in seconds)
+CONCURRENT_REQUESTS = 3  # Number of pages processed (and browsers rendering) concurrently
+# Per-host request rates and delays are set adaptively by the politeness scheduler below
 
 # Robots.txt
 ROBOTSTXT_OBEY = False  # Set to False if you want to ignore robots.txt rules (use with caution)
 
 # Resource Limits (in MB and percentage)
-MEMORY_LIMIT = 2048  # 2 GB
-CPU_LIMIT = 70  # 30% CPU usage
\ No newline at end of file
+MEMORY_LIMIT = 2048  # 2 GB, RSS of the crawler plus its browsers and workers
+CPU_LIMIT = 70  # Percent of the whole machine used by the crawler process tree
+GOVERNOR_INTERVAL = 2  # Seconds between resource samples
+GOVERNOR_THROTTLE_FACTOR = 0.25  # Fraction of POLITENESS_TOTAL_CONCURRENCY allowed while over a limit
+GOVERNOR_RESUME_RATIO = 0.8  # Resume once usage is below this fraction of both limits...
+GOVERNOR_RESUME_SAMPLES = 3  # ...for this many consecutive samples
+GOVERNOR_RECYCLE_COOLDOWN = 120  # Minimum seconds between browser recycles triggered by the memory limit
+GOVERNOR_BROWSER_SHARE = 0.5  # Recycle browsers only when they hold more than this fraction of the crawl's RSS
+
+# Browser Pool
+BROWSER_POOL_SIZE = CONCURRENT_REQUESTS  # Number of headless browsers rendering pages in parallel
+BROWSER_MAX_PAGES = 200  # Recycle a browser after this many page loads
+BROWSER_MAX_RSS = 1024  # Recycle a browser once its process tree exceeds this many MB
+BROWSER_PAGE_LOAD_TIMEOUT = 30  # Page load timeout per browser (in seconds)
+CHROME_BINARY = None  # e.g. "/Users/bytes/Downloads/chrome-mac/Chromium-114.app"; None uses the system Chrome
+CHROMEDRIVER_PATH = None  # e.g. "/Users/bytes/Documents/chromedriver_mac64/chromedriver"; None lets Selenium resolve it
+
+# Page Settling
+SETTLE_QUIET_MS = 300  # A page is settled after this long without DOM mutations or network activity
+SETTLE_TIMEOUT = 3  # Give up waiting for a page to settle after this many seconds
+SCROLL_MAX_ITERATIONS = 20  # Most scrolls to the bottom per page when loading infinite-scroll content
+SCROLL_TIME_BUDGET = 10  # Seconds of infinite scrolling per page at most
+SHOW_MORE_LABELS = ['Show more']  # Buttons whose text contains one of these are clicked to expand content
+CODE_TOGGLE_LABELS = ['Code', 'Show Code', 'View Code']  # ...and these to reveal hidden code
+
+# Fetch Tiers
+STATIC_FETCH_TIMEOUT = 20  # Timeout for static (non-browser) fetches (in seconds)
+STATIC_MIN_TEXT_CHARS = 200  # Pages with less visible text than this are rendered in a browser
+STATIC_ESCALATE_AFTER = 3  # Consecutive pages needing JavaScript before a whole domain skips the static tier
+STATIC_REPROBE_EVERY = 20  # ...after which every Nth page of that domain tries the static tier again
+SPA_SHELL_MARKERS = [
+    '<div id="root"></div>',
+    '<div id="app"></div>',
+    '<div id="__next"></div>',
+    '<div id="___gatsby"></div>',
+    'ng-version=',
+    'data-server-rendered="false"',
+]
+
+# Database Writer
+DB_PATH = 'code_data.db'  # SQLite database scraped pages and code blocks are written to
+DB_BATCH_SIZE = 100  # Pages per write transaction
+DB_FLUSH_INTERVAL = 2  # Flush a partial batch after this many seconds
+DB_QUEUE_SIZE = 1000  # Maximum pages waiting to be written before producers block
+DB_BUSY_RETRIES = 10  # Times a batch is retried when another process (e.g. a crawl shard) holds the write lock...
+DB_BUSY_BACKOFF = 0.1  # ...after this many seconds, doubling per retry up to DB_BUSY_BACKOFF_MAX
+DB_BUSY_BACKOFF_MAX = 5
+
+# Crawl Frontier
+FRONTIER_PATH = 'frontier.db'  # SQLite file holding queued/in-flight/done/failed URLs between runs
+FRONTIER_LEASE_SIZE = 50  # URLs leased from the frontier per batch
+FRONTIER_MAX_IN_FLIGHT = 200  # Maximum URLs leased but not yet finished
+FRONTIER_CHECKPOINT_EVERY = 100  # Commit frontier state after this many changes
+FRONTIER_CHECKPOINT_INTERVAL = 10  # ...or after this many seconds
+
+# Link Scope
+LINK_INCLUDE_PATTERNS = []  # Regexes a discovered URL must match (any of them) to be crawled; empty allows all
+LINK_EXCLUDE_PATTERNS = []  # Regexes that drop a discovered URL, e.g. r'/v\d+\.\d+/' for old doc versions
+LINK_EXCLUDE_CLASSES = ('sidebar',)  # Anchors whose class contains one of these aren't followed
+
+# Incremental Re-crawl
+RECRAWL_CONDITIONAL = True  # Send If-None-Match/If-Modified-Since and skip pages whose body hash hasn't changed
+RECRAWL_REQUEUE_DONE = False  # Re-queue every finished URL at start, e.g. for a nightly refresh of the same sites
+
+# Page Archive
+ARCHIVE_ENABLED = True  # Keep every fetched/rendered page so extraction can be re-run offline (page_archive.py replay)
+ARCHIVE_DIR = 'archive'  # Segment files plus index.db, the URL -> (segment, offset, length) index
+ARCHIVE_COMPRESSION = 'gzip'  # 'gzip', or 'zstd' (faster, smaller; needs the zstandard package)
+ARCHIVE_COMPRESSION_LEVEL = 6  # gzip 1-9, zstd 1-22
+ARCHIVE_SEGMENT_BYTES = 1024 * 1024 * 1024  # A new segment file is started past this size
+ARCHIVE_REPLAY_BATCH = 32  # Archived pages read and extracted per worker task during replay
+
+# Sharded Crawl
+SHARD_WORKERS = os.cpu_count() or 1  # Worker processes for `python shard.py`; each crawls the hosts hashed to it
+SHARD_RING_REPLICAS = 64  # Points per worker on the consistent-hash ring, so hosts spread evenly
+SHARD_DEDUP_PATH = 'content_dedup.bloom'  # Content Bloom filter file every worker maps, so duplicates are caught across shards
+SHARD_DEDUP_CAPACITY = 10_000_000  # Distinct pages the shared filter holds at DEDUP_ERROR_RATE (~36 MB at 1e-6)
+SHARD_POLL_INTERVAL = 0.5  # Seconds between inbox checks in the workers and termination checks in the coordinator
+
+# Deduplication
+DEDUP_BACKEND = 'bloom'  # 'bloom' (scalable Bloom filter, approximate) or 'hashset' (exact 64-bit hashes)
+DEDUP_INITIAL_CAPACITY = 100000  # Entries before the first Bloom slice / hash table grows
+DEDUP_ERROR_RATE = 1e-6  # Target false-positive rate for the Bloom backend
+DEDUP_SPILL_DIR = None  # Directory for mmap-backed Bloom slices; None keeps them in memory
+
+# Near-Duplicate Detection
+NEAR_DUP_ENABLED = True  # Skip pages that are near-copies of an already stored page
+NEAR_DUP_THRESHOLD = 0.85  # Estimated Jaccard similarity at which a page counts as a near-duplicate
+NEAR_DUP_NUM_PERM = 128  # MinHash permutations per signature
+NEAR_DUP_SHINGLE_SIZE = 5  # Words per shingle
+NEAR_DUP_MAX_PAGES = 250_000  # Pages the LSH index holds (~2.5 KB each); past this the least recently added or matched are dropped, 0 for no limit
+
+# Language Detection
+LANGUAGE_MIN_CONFIDENCE = 0.1  # Token-model guesses scoring below this (ties, one stray keyword) are labelled 'unknown'
+
+# Code Tokens
+TOKENIZE_ON_WRITE = False  # True packs Pygments tokens at scrape time; False leaves them to token_store.load_tokens on read
+
+# HTML Extraction
+HTML_PARSER_BACKEND = 'auto'  # 'selectolax', 'lxml', 'bs4', or 'auto' for the fastest one installed
+
+# Post-processing
+POSTPROCESS_MODE = 'process'  # 'process' (worker processes), 'thread', or 'inline' on the event loop
+POSTPROCESS_WORKERS = max(1, (os.cpu_count() or 2) - 1)  # Parse/detect/tokenize/hash workers
+POSTPROCESS_MAX_PENDING = 4 * POSTPROCESS_WORKERS  # Pages in post-processing before fetchers wait
+POSTPROCESS_BATCH_BYTES = 65536  # Pages smaller than this are grouped up to this much HTML per worker task
+POSTPROCESS_BATCH_DELAY = 0.02  # Seconds to wait for more small pages before sending a partial batch
+
+# Q&A Generation
+QA_MODEL = 'meta-llama/Meta-Llama-3.1-8B-Instruct'  # Any causal LM; a tiny model (e.g. 'sshleifer/tiny-gpt2') runs on CPU for testing
+QA_MAX_NEW_TOKENS = 512  # Tokens generated per question or answer (prompt tokens are not counted)
+QA_BATCH_SIZE = 16  # Maximum prompts per generation batch
+QA_MAX_BATCH_TOKENS = 32768  # Cap on batch size x (longest prompt + QA_MAX_NEW_TOKENS), to bound KV-cache memory
+QA_CHUNK_PAGES = 128  # Pages whose prompts are batched together
+QA_TEMPERATURE = 0.7
+QA_TOP_P = 0.95
+QA_REPETITION_PENALTY = 1.15
+QA_CACHE_PATH = 'qa_cache.db'  # SQLite cache of generations keyed by (model, params, prompt); None disables it
+QA_CACHE_MAX_BYTES = 512 * 1024 * 1024  # Least recently used generations are evicted past this size
+QA_REUSE_KV_CACHE = True  # Prefill each page's shared context once and answer from the question pass's KV cache
+
+# Politeness
+POLITENESS_INITIAL_RATE = 1.0  # Requests per second a new host starts at
+POLITENESS_MIN_RATE = 0.05  # Floor for a host that keeps pushing back (one request per 20s)
+POLITENESS_MAX_RATE = 10.0  # Ceiling for a fast, healthy host
+POLITENESS_RATE_STEP = 0.25  # Additive rate increase after each fast successful response
+POLITENESS_BACKOFF_FACTOR = 0.5  # Multiplicative rate/concurrency decrease on 429/503, errors or slow responses
+POLITENESS_BURST = 3  # Token bucket size: requests a host may receive back to back
+POLITENESS_INITIAL_CONCURRENCY = 2  # Requests in flight per host to start from
+POLITENESS_MAX_CONCURRENCY = 8  # Requests in flight per host at most
+POLITENESS_TARGET_LATENCY = 2.0  # Seconds; slower responses count as congestion
+POLITENESS_MAX_RETRY_AFTER = 600  # Cap on a server-provided Retry-After, in seconds
+POLITENESS_MAX_RETRIES = 5  # Times a 429/503 response is retried after backing off
+POLITENESS_TOTAL_CONCURRENCY = 32  # Downloads in flight across all hosts
+POLITENESS_MAX_LEASED_PER_HOST = 16  # Frontier URLs in flight per host, so one slow host can't take every lease
+
+# Repository Ingestion
+GITHUB_TOKEN = os.environ.get('GITHUB_TOKEN')  # Raises the API rate limit and allows private repositories
+GITHUB_API_URL = 'https://api.github.com'
+REPO_ARCHIVE_TIMEOUT = 300  # Seconds to download one repository tarball
+REPO_SPOOL_BYTES = 64 * 1024 * 1024  # Archives larger than this are spooled to a temp file instead of memory
+REPO_MAX_FILE_BYTES = 1024 * 1024  # Larger files (usually generated or data) are skipped
+REPO_BATCH_FILES = 200  # Files per worker task and per DB write
+REPO_SKIP_DIRS = {'node_modules', 'vendor', 'third_party', 'dist', 'build', '.git', '__pycache__'}
+
+# Telemetry
+TELEMETRY_ENABLED = True  # Serve crawl metrics over HTTP and write periodic JSON snapshots
+TELEMETRY_HOST = '127.0.0.1'
+TELEMETRY_PORT = 9410  # /metrics (Prometheus text format) and /metrics.json; None disables the endpoint
+TELEMETRY_SNAPSHOT_PATH = 'metrics.json'  # Rewritten every TELEMETRY_SNAPSHOT_INTERVAL seconds; None disables it
+TELEMETRY_SNAPSHOT_INTERVAL = 30
@@ -0,0 +1,225 @@
+import argparse
+import asyncio
+import bisect
+import logging
+import multiprocessing
+import os
+import queue
+import time
+
+from tqdm import tqdm
+
+import scrape_settings
+from dedup import BloomFilter, SharedContentDedup, URLDedup, canonicalize_url, hash64
+from politeness import host_of
+from scrape_settings import (
+    SHARD_WORKERS, SHARD_RING_REPLICAS, SHARD_DEDUP_PATH, SHARD_DEDUP_CAPACITY, SHARD_POLL_INTERVAL,
+    DEDUP_ERROR_RATE, DB_PATH
+)
+
+# Host-sharded crawl: `python shard.py --workers N` runs N crawler processes, each a full
+# WebsiteSpider with its own frontier, fetchers, post-processing pool and DB writer. Hosts
+# are assigned to workers by a consistent hash, so per-host politeness stays exact (a host
+# is only ever fetched by one worker) and the assignment barely moves if N changes. Links
+# to another worker's hosts go to that worker's inbox queue; the queues could be swapped
+# for a broker to put the workers on separate machines. Content dedup is shared through
+# one mmap'd Bloom filter; URL dedup needs no sharing since a URL's host decides its worker.
+#
+# Module-level imports here must not bind settings the workers override (see
+# worker_settings): spawned workers import this module before applying them.
+
+# Function to name a per-worker copy of a file: frontier.db -> frontier.shard-0.db
+def shard_path(path, index):
+    if path is None:
+        return None
+    root, ext = os.path.splitext(path)
+    return f'{root}.shard-{index}{ext}'
+
+# Function to get the settings a worker overrides: its own frontier, archive and telemetry
+# files, and its share of the machine-wide resource limits
+def worker_settings(index, count):
+    settings = scrape_settings
+    return {
+        'FRONTIER_PATH': shard_path(settings.FRONTIER_PATH, index),
+        'ARCHIVE_DIR': os.path.join(settings.ARCHIVE_DIR, f'shard-{index}'),
+        'TELEMETRY_PORT': settings.TELEMETRY_PORT + index if settings.TELEMETRY_PORT is not None else None,
+        'TELEMETRY_SNAPSHOT_PATH': shard_path(settings.TELEMETRY_SNAPSHOT_PATH, index),
+        'MEMORY_LIMIT': settings.MEMORY_LIMIT / count,
+        'CPU_LIMIT': settings.CPU_LIMIT / count,
+        'POSTPROCESS_WORKERS': max(1, settings.POSTPROCESS_WORKERS // count),
+        'POSTPROCESS_MAX_PENDING': max(1, settings.POSTPROCESS_MAX_PENDING // count),
+    }
+
+# Consistent-hash ring of workers: each worker owns SHARD_RING_REPLICAS points, and a host
+# belongs to the first point at or after its hash
+class HashRing:
+    def __init__(self, shards, replicas=SHARD_RING_REPLICAS):
+        self.shards = shards
+        points = sorted((hash64(f'shard-{shard}-{replica}'), shard)
+                        for shard in range(shards) for replica in range(replicas))
+        self._hashes = [h for h, _ in points]
+        self._owners = [shard for _, shard in points]
+
+    # Links arrive canonical; start URLs go through canonicalize_url first
+    def shard_of(self, url):
+        i = bisect.bisect_left(self._hashes, hash64(host_of(url)))
+        return self._owners[i % len(self._owners)]
+
+# State shared by the coordinator and its workers. sent/received count routed URLs, so
+# the crawl is finished only when every worker is idle and nothing is left in an inbox.
+class SharedState:
+    def __init__(self, ctx, count):
+        self.count = count
+        self.dedup_lock = ctx.Lock()
+        self.progress = ctx.Array('q', 2 * count)  # done, total per worker
+        self.idle = ctx.Array('b', count)
+        self.sent = ctx.Value('q', 0)
+        self.received = ctx.Value('q', 0)
+        self.stop = ctx.Event()
+
+    def totals(self):
+        progress = self.progress[:]
+        return sum(progress[0::2]), sum(progress[1::2])
+
+    # (sent, received) when every worker is idle and every routed URL has been taken, else None
+    def quiescent(self):
+        if not all(self.idle[:]):
+            return None
+        sent, received = self.sent.value, self.received.value
+        return (sent, received) if sent == received else None
+
+# A worker's view of the sharded crawl, passed to WebsiteSpider as shard=
+class ShardContext:
+    def __init__(self, index, count, inboxes, state):
+        self.index = index
+        self.count = count
+        self.ring = HashRing(count)
+        self.inboxes = inboxes
+        self.state = state
+        # URLs already sent to another worker, so popular links are routed once
+        self.routed = URLDedup()
+
+    @property
+    def stopping(self):
+        return self.state.stop.is_set()
+
+    def owns(self, url):
+        return self.ring.shard_of(canonicalize_url(url)) == self.index
+
+    def content_dedup(self):
+        return SharedContentDedup(SHARD_DEDUP_PATH, self.state.dedup_lock, SHARD_DEDUP_CAPACITY)
+
+    # Send links on other workers' hosts to their inboxes; returns the ones this worker crawls
+    def route(self, urls, depth):
+        local = []
+        outgoing = {}
+        for url in urls:
+            shard = self.ring.shard_of(url)
+            if shard == self.index:
+                local.append(url)
+            elif self.routed.add(url):
+                outgoing.setdefault(shard, []).append(url)
+        for shard, batch in outgoing.items():
+            # Counted before the put, so the coordinator never sees a URL in transit as received
+            with self.state.sent.get_lock():
+                self.state.sent.value += len(batch)
+            self.inboxes[shard].put((batch, depth))
+        return local
+
+    # Batches of (urls, depth) routed here since the last call
+    def receive(self):
+        batches = []
+        while True:
+            try:
+                batches.append(self.inboxes[self.index].get_nowait())
+            except queue.Empty:
+                return batches
+
+    # Called once received URLs are in the frontier, after set_idle(False)
+    def mark_received(self, count):
+        with self.state.received.get_lock():
+            self.state.received.value += count
+
+    def set_idle(self, idle):
+        self.state.idle[self.index] = idle
+
+    def report(self, counts):
+        self.state.progress[2 * self.index] = counts['done'] + counts['failed']
+        self.state.progress[2 * self.index + 1] = sum(counts.values())
+
+    def close(self):
+        self.routed.close()
+
+# Worker process entry point: one Scrapy crawl over this worker's share of the hosts
+def run_worker(index, count, inboxes, state):
+    for name, value in worker_settings(index, count).items():
+        setattr(scrape_settings, name, value)
+    # Imported only now, since these modules read their settings at import time
+    from scrapy.crawler import CrawlerProcess
+    from scrapy.utils.project import get_project_settings
+    from spider import WebsiteSpider
+
+    process = CrawlerProcess(get_project_settings())
+    process.crawl(WebsiteSpider, shard=ShardContext(index, count, inboxes, state))
+    process.start()
+
+# Function to create the database schema once, before the workers' writers open it together
+def prepare_database(path=DB_PATH):
+    from db_writer import open_database
+
+    async def prepare():
+        db = await open_database(path)
+        await db.close()
+    asyncio.run(prepare())
+
+# Run a crawl over `workers` processes and show their combined progress. It ends when every
+# worker has been idle with no routed URLs in flight for two checks in a row with no
+# routing in between; Ctrl-C or a crashed worker stops the others.
+def run_sharded(workers=SHARD_WORKERS):
+    ctx = multiprocessing.get_context('spawn')
+    prepare_database()
+    dedup = BloomFilter(SHARD_DEDUP_CAPACITY, DEDUP_ERROR_RATE, SHARD_DEDUP_PATH)
+    state = SharedState(ctx, workers)
+    inboxes = [ctx.Queue() for _ in range(workers)]
+    processes = [ctx.Process(target=run_worker, args=(index, workers, inboxes, state), name=f'shard-{index}')
+                 for index in range(workers)]
+    for process in processes:
+        process.start()
+    logging.info(f"Started {workers} crawl shards")
+
+    pbar = tqdm(total=0, desc=f"Scraping Website ({workers} shards)")
+    last_quiet = None
+    try:
+        while any(process.is_alive() for process in processes):
+            time.sleep(SHARD_POLL_INTERVAL)
+            done, total = state.totals()
+            pbar.total = total
+            pbar.n = done
+            pbar.refresh()
+            if state.stop.is_set():
+                continue
+            crashed = [process.name for process in processes if process.exitcode not in (None, 0)]
+            if crashed:
+                logging.error(f"Crawl shards {crashed} exited with an error; stopping the others")
+                state.stop.set()
+                continue
+            quiet = state.quiescent()
+            if quiet is not None and quiet == last_quiet:
+                logging.info(f"All shards idle after routing {quiet[0]} URLs between them; stopping")
+                state.stop.set()
+            last_quiet = quiet
+    except KeyboardInterrupt:
+        print("Stopping scraper...")
+        state.stop.set()
+    finally:
+        for process in processes:
+            process.join()
+        pbar.close()
+        dedup.close()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Crawl links_to_scrape.txt with hosts split across worker processes')
+    parser.add_argument('--workers', type=int, default=SHARD_WORKERS, help='Worker processes (default: SHARD_WORKERS)')
+    args = parser.parse_args()
+    logging.basicConfig(filename='scraper.log', level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    run_sharded(args.workers)
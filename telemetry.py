@@ -0,0 +1,233 @@
+import asyncio
+import bisect
+import json
+import logging
+import os
+import time
+from contextlib import contextmanager
+
+from scrape_settings import (
+    TELEMETRY_ENABLED, TELEMETRY_HOST, TELEMETRY_PORT, TELEMETRY_SNAPSHOT_PATH, TELEMETRY_SNAPSHOT_INTERVAL
+)
+
+PREFIX = 'scrape_'
+
+# Latency buckets in seconds, from a cached parse up to a slow browser render
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+HELP = {
+    'stage_seconds': 'Latency of one unit of work per crawl stage',
+    'pages_total': 'Pages finished, by outcome',
+    'items_total': 'Items processed, by kind',
+    'bytes_total': 'Bytes processed, by kind',
+}
+
+# Cumulative-bucket histogram, as Prometheus expects; quantiles are interpolated within buckets
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q):
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, bucket_count in enumerate(self.counts):
+            if seen + bucket_count >= rank and bucket_count:
+                lower = self.buckets[i - 1] if i else 0.0
+                upper = self.buckets[i] if i < len(self.buckets) else self.buckets[-1]
+                return lower + (upper - lower) * (rank - seen) / bucket_count
+            seen += bucket_count
+        return self.buckets[-1]
+
+def _labels(labels):
+    return tuple(sorted(labels.items()))
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{key}="{value}"' for key, value in pairs) + '}'
+
+# In-process metrics registry: labelled counters and histograms, plus gauges that are read
+# from callbacks when scraped (queue depths, pool occupancy), so nothing has to push them.
+class Metrics:
+    def __init__(self):
+        self.started = time.time()
+        self.counters = {}
+        self.histograms = {}
+        self.gauges = {}
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, _labels(labels))
+        self.counters[key] = self.counters.get(key, 0) + amount
+
+    def observe(self, name, value, **labels):
+        key = (name, _labels(labels))
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram()
+        histogram.observe(value)
+
+    def gauge(self, name, fn, help=''):
+        self.gauges[name] = (fn, help)
+
+    def observe_stage(self, stage, seconds):
+        self.observe('stage_seconds', seconds, stage=stage)
+
+    # Time a block of work as one observation of a stage
+    @contextmanager
+    def timer(self, stage):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe_stage(stage, time.perf_counter() - started)
+
+    def _read_gauges(self):
+        values = {}
+        for name, (fn, _) in self.gauges.items():
+            try:
+                values[name] = fn()
+            except Exception as e:
+                logging.debug(f"Error reading gauge {name}: {str(e)}")
+        return values
+
+    # Prometheus text exposition format (version 0.0.4)
+    def render_prometheus(self):
+        lines = []
+        typed = set()
+
+        def header(name, kind, help):
+            if name not in typed:
+                typed.add(name)
+                lines.append(f'# HELP {PREFIX}{name} {help}')
+                lines.append(f'# TYPE {PREFIX}{name} {kind}')
+
+        for (name, labels), value in sorted(self.counters.items()):
+            header(name, 'counter', HELP.get(name, name))
+            lines.append(f'{PREFIX}{name}{_format_labels(labels)} {value}')
+        for (name, labels), histogram in sorted(self.histograms.items()):
+            header(name, 'histogram', HELP.get(name, name))
+            cumulative = 0
+            for bound, bucket_count in zip(histogram.buckets, histogram.counts):
+                cumulative += bucket_count
+                lines.append(f'{PREFIX}{name}_bucket{_format_labels(labels, [("le", bound)])} {cumulative}')
+            lines.append(f'{PREFIX}{name}_bucket{_format_labels(labels, [("le", "+Inf")])} {histogram.count}')
+            lines.append(f'{PREFIX}{name}_sum{_format_labels(labels)} {histogram.sum}')
+            lines.append(f'{PREFIX}{name}_count{_format_labels(labels)} {histogram.count}')
+        for name, value in sorted(self._read_gauges().items()):
+            header(name, 'gauge', self.gauges[name][1] or name)
+            lines.append(f'{PREFIX}{name} {value}')
+        return '\n'.join(lines) + '\n'
+
+    # JSON-friendly view with per-stage count, rate, mean, p50 and p99
+    def snapshot(self):
+        elapsed = max(time.time() - self.started, 1e-9)
+        stages = {}
+        for (name, labels), histogram in sorted(self.histograms.items()):
+            key = dict(labels)['stage'] if name == 'stage_seconds' else name + _format_labels(labels)
+            stages[key] = {
+                'count': histogram.count,
+                'per_second': round(histogram.count / elapsed, 3),
+                'mean': round(histogram.sum / histogram.count, 6) if histogram.count else 0.0,
+                'p50': round(histogram.quantile(0.5), 6),
+                'p99': round(histogram.quantile(0.99), 6),
+            }
+        counters = {}
+        for (name, labels), value in sorted(self.counters.items()):
+            counters[name + _format_labels(labels)] = value
+        return {
+            'timestamp': time.time(),
+            'uptime': round(elapsed, 1),
+            'stages': stages,
+            'counters': counters,
+            'gauges': self._read_gauges(),
+        }
+
+    def write_snapshot(self, path=TELEMETRY_SNAPSHOT_PATH):
+        temp_path = f'{path}.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump(self.snapshot(), f, indent=2, default=str)
+        os.replace(temp_path, path)
+
+# Process-wide registry; every stage records into it
+metrics = Metrics()
+
+# Serves /metrics (Prometheus) and /metrics.json over HTTP and rewrites the JSON snapshot
+# file every snapshot_interval seconds while the crawl runs.
+class MetricsReporter:
+    def __init__(self, registry=metrics, host=TELEMETRY_HOST, port=TELEMETRY_PORT,
+                 snapshot_path=TELEMETRY_SNAPSHOT_PATH, snapshot_interval=TELEMETRY_SNAPSHOT_INTERVAL,
+                 enabled=TELEMETRY_ENABLED):
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self.snapshot_path = snapshot_path
+        self.snapshot_interval = snapshot_interval
+        self.enabled = enabled
+        self._runner = None
+        self._task = None
+
+    async def start(self):
+        if not self.enabled or self._task is not None:
+            return
+        if self.port is not None:
+            await self._start_server()
+        self._task = asyncio.create_task(self._snapshot_loop())
+
+    async def _start_server(self):
+        from aiohttp import web
+
+        async def prometheus(request):
+            return web.Response(text=self.registry.render_prometheus(), content_type='text/plain', charset='utf-8')
+
+        async def snapshot(request):
+            return web.json_response(self.registry.snapshot(), dumps=lambda value: json.dumps(value, default=str))
+
+        app = web.Application()
+        app.router.add_get('/metrics', prometheus)
+        app.router.add_get('/metrics.json', snapshot)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        try:
+            await web.TCPSite(self._runner, self.host, self.port).start()
+            logging.info(f"Serving metrics on http://{self.host}:{self.port}/metrics")
+        except OSError as e:
+            logging.warning(f"Could not serve metrics on {self.host}:{self.port}: {str(e)}")
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def _snapshot_loop(self):
+        while True:
+            await asyncio.sleep(self.snapshot_interval)
+            self.write_snapshot()
+
+    def write_snapshot(self):
+        if not self.snapshot_path:
+            return
+        try:
+            self.registry.write_snapshot(self.snapshot_path)
+        except OSError as e:
+            logging.warning(f"Could not write metrics snapshot to {self.snapshot_path}: {str(e)}")
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            self.write_snapshot()
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
@@ -0,0 +1,43 @@
+import asyncio
+import multiprocessing
+import sqlite3
+
+from db_writer import DBWriter, open_database
+
+PAGES_PER_WORKER = 300
+
+def page(url):
+    return {'url': url, 'title': url, 'content': f'text of {url}', 'source_type': 'docs',
+            'code_blocks': [{'code': f'print({url!r})', 'language': 'python', 'tokens': None}]}
+
+# One crawl shard's writer. Once it is open, busy_timeout is dropped to 0 so every
+# overlapping commit fails with SQLITE_BUSY at once, and only the writer's retries keep the pages.
+def run_writer(path, index, busy_retries):
+    async def write():
+        writer = DBWriter(path, batch_size=5, flush_interval=0.01, busy_retries=busy_retries, busy_backoff=0.005)
+        await writer.start()
+        await writer._db.execute('PRAGMA busy_timeout=0')
+        for i in range(PAGES_PER_WORKER):
+            await writer.store_data([page(f'https://shard-{index}.example.com/{i}')])
+        await writer.close()
+    asyncio.run(write())
+
+def test_two_writers_store_every_page(tmp_path):
+    path = str(tmp_path / 'pages.db')
+
+    async def prepare():
+        db = await open_database(path)
+        await db.close()
+    asyncio.run(prepare())
+
+    ctx = multiprocessing.get_context('spawn')
+    workers = [ctx.Process(target=run_writer, args=(path, index, 1000)) for index in range(2)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join(120)
+        assert worker.exitcode == 0
+
+    with sqlite3.connect(path) as conn:
+        assert conn.execute('SELECT COUNT(*) FROM pages').fetchone()[0] == 2 * PAGES_PER_WORKER
+        assert conn.execute('SELECT COUNT(*) FROM code_blocks').fetchone()[0] == 2 * PAGES_PER_WORKER
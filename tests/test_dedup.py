@@ -0,0 +1,74 @@
+from dedup import BloomFilter, ContentDedup, Hash64Set, ScalableBloomFilter, URLDedup, canonicalize_url, hash64
+
+# Function to build distinct keys that were never added to a filter
+def probe_keys(count):
+    return [f'https://absent.example/page/{i}' for i in range(count)]
+
+def test_hash64set_membership_and_growth():
+    keys = [f'https://docs.example/page/{i}' for i in range(5000)]
+    hashes = Hash64Set(capacity=16)
+    assert all(hashes.add(key) for key in keys)
+    assert not any(hashes.add(key) for key in keys)
+    assert len(hashes) == len(keys)
+    assert all(key in hashes for key in keys)
+    assert not any(key in hashes for key in probe_keys(5000))
+
+def test_hash64set_zero_hash_is_stored():
+    hashes = Hash64Set()
+    assert hashes.add_hash(0)
+    assert not hashes.add_hash(0)
+    assert len(hashes) == 1
+
+def test_bloom_filter_has_no_false_negatives_and_bounded_false_positives():
+    capacity, error_rate = 10000, 0.01
+    bloom = BloomFilter(capacity, error_rate)
+    keys = [hash64(f'https://docs.example/page/{i}') for i in range(capacity)]
+    for h in keys:
+        bloom.add_hash(h)
+    assert all(bloom.contains_hash(h) for h in keys)
+    # Keys whose bits were all set already count as seen, so the count trails slightly
+    assert bloom.count > (1 - error_rate) * capacity
+    false_positives = sum(bloom.contains_hash(hash64(key)) for key in probe_keys(20000))
+    assert false_positives / 20000 < 2 * error_rate
+
+def test_spilled_bloom_filter_is_shared_with_attached_filter(tmp_path):
+    path = str(tmp_path / 'shared.bloom')
+    owner = BloomFilter(1000, 0.01, path)
+    attached = BloomFilter(1000, 0.01, path, attach=True)
+    assert owner.add_hash(hash64('page'))
+    assert attached.contains_hash(hash64('page'))
+    assert not attached.add_hash(hash64('page'))
+    attached.close()
+    assert (tmp_path / 'shared.bloom').exists()
+    owner.close()
+    assert not (tmp_path / 'shared.bloom').exists()
+
+def test_scalable_bloom_filter_grows_and_keeps_false_positive_rate(tmp_path):
+    error_rate = 0.01
+    bloom = ScalableBloomFilter(initial_capacity=500, error_rate=error_rate, spill_dir=str(tmp_path))
+    keys = [f'https://docs.example/page/{i}' for i in range(8000)]
+    added = sum(bloom.add(key) for key in keys)
+    assert len(bloom._filters) > 1
+    assert len(bloom) == added
+    assert all(key in bloom for key in keys)
+    false_positives = sum(key in bloom for key in probe_keys(20000))
+    assert false_positives / 20000 < 2 * error_rate
+    bloom.close()
+    assert not list(tmp_path.iterdir())
+
+def test_url_dedup_canonicalizes():
+    assert canonicalize_url('HTTPS://Docs.Example:443/guide/?b=2&a=1#intro') == 'https://docs.example/guide?a=1&b=2'
+    for backend in ('hashset', 'bloom'):
+        urls = URLDedup(backend)
+        assert urls.add('https://docs.example/guide/')
+        assert not urls.add('https://docs.example/guide#install')
+        assert 'https://DOCS.example/guide' in urls
+        assert 'https://docs.example/guide/api' not in urls
+        urls.close()
+
+def test_content_dedup_fingerprint_covers_code_blocks():
+    content = ContentDedup('hashset')
+    assert content.add('Install', ['pip install demo'])
+    assert not content.add('Install', ['pip install demo'])
+    assert content.add('Install', ['pip install other'])
+    assert len(content) == 2
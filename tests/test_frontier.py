@@ -0,0 +1,79 @@
+from frontier import DONE, FAILED, IN_FLIGHT, QUEUED, Frontier
+
+# Function to open a frontier that commits on every change
+def open_frontier(tmp_path):
+    return Frontier(str(tmp_path / 'frontier.db'), checkpoint_every=1, checkpoint_interval=0)
+
+def test_add_ignores_known_urls(tmp_path):
+    frontier = open_frontier(tmp_path)
+    assert frontier.add(['https://a.example/1', 'https://a.example/2']) == 2
+    assert frontier.add(['https://a.example/2', 'https://a.example/3']) == 1
+    assert frontier.counts()[QUEUED] == 3
+    frontier.close()
+
+def test_lease_orders_by_priority_then_depth(tmp_path):
+    frontier = open_frontier(tmp_path)
+    frontier.add(['https://a.example/deep'], depth=3)
+    frontier.add(['https://a.example/shallow'], depth=1)
+    frontier.add(['https://a.example/urgent'], depth=5, priority=10, callback='parse_item')
+    assert frontier.lease(2) == [('https://a.example/urgent', 5, 'parse_item'), ('https://a.example/shallow', 1, 'parse')]
+    assert frontier.counts() == {QUEUED: 1, IN_FLIGHT: 2, DONE: 0, FAILED: 0}
+    frontier.close()
+
+def test_lease_interleaves_hosts(tmp_path):
+    frontier = open_frontier(tmp_path)
+    for host in ('a', 'b', 'c'):
+        frontier.add([f'https://{host}.example/{i}' for i in range(10)])
+    leased = [url for url, _, _ in frontier.lease(6, per_host=4)]
+    hosts = [url.split('/')[2] for url in leased]
+    # Every host's first URL comes before any host's second
+    assert sorted(hosts[:3]) == sorted(hosts[3:]) == ['a.example', 'b.example', 'c.example']
+    frontier.close()
+
+def test_lease_respects_per_host_limit(tmp_path):
+    frontier = open_frontier(tmp_path)
+    frontier.add([f'https://busy.example/{i}' for i in range(10)])
+    frontier.add([f'https://idle.example/{i}' for i in range(10)])
+    leased = frontier.lease(10, per_host=3, in_flight={'busy.example': 2})
+    hosts = [url.split('/')[2] for url, _, _ in leased]
+    assert hosts.count('busy.example') == 1
+    assert hosts.count('idle.example') == 3
+    assert frontier.lease(10, per_host=3, in_flight={'busy.example': 3, 'idle.example': 3}) == []
+    frontier.close()
+
+def test_interleaved_lease_keeps_priority_within_host(tmp_path):
+    frontier = open_frontier(tmp_path)
+    frontier.add([f'https://a.example/low{i}' for i in range(5)], priority=0)
+    frontier.add(['https://a.example/high'], priority=5)
+    frontier.add(['https://b.example/deep'], depth=2)
+    frontier.add(['https://b.example/top'], depth=0)
+    leased = [url for url, _, _ in frontier.lease(2, per_host=2)]
+    assert sorted(leased) == ['https://a.example/high', 'https://b.example/top']
+    frontier.close()
+
+def test_in_flight_urls_are_requeued_on_open(tmp_path):
+    frontier = open_frontier(tmp_path)
+    frontier.add([f'https://a.example/{i}' for i in range(5)])
+    leased = frontier.lease(3)
+    frontier.mark_done(leased[0][0])
+    # Simulate a crash: the connection goes away with two URLs still leased
+    frontier.conn.close()
+    frontier = open_frontier(tmp_path)
+    assert frontier.counts() == {QUEUED: 4, IN_FLIGHT: 0, DONE: 1, FAILED: 0}
+    assert leased[0][0] not in [url for url, _, _ in frontier.lease(10)]
+    frontier.close()
+
+def test_requeue_done_and_failed_keep_validators(tmp_path):
+    frontier = open_frontier(tmp_path)
+    frontier.add(['https://a.example/ok', 'https://a.example/broken'])
+    frontier.lease(2)
+    frontier.set_validators('https://a.example/ok', '"v1"', 'Sat, 17 Oct 2026 10:00:00 GMT', b'digest')
+    frontier.mark_done('https://a.example/ok')
+    frontier.mark_failed('https://a.example/broken')
+    assert frontier.requeue_failed() == 1
+    assert [url for url, _, _ in frontier.lease(10)] == ['https://a.example/broken']
+    assert frontier.requeue_done() == 1
+    assert frontier.counts()[QUEUED] == 1
+    assert frontier.validators('https://a.example/ok') == ('"v1"', 'Sat, 17 Oct 2026 10:00:00 GMT', b'digest')
+    assert frontier.validators('https://a.example/missing') == (None, None, None)
+    frontier.close()
@@ -0,0 +1,45 @@
+import pytest
+import torch
+from tokenizers import Tokenizer, decoders, models, pre_tokenizers, trainers
+from transformers import GPT2Config, GPT2LMHeadModel, PreTrainedTokenizerFast
+
+from generation import BatchedGenerator
+
+CORPUS = [
+    "Context from https://example.com/docs (titled \"Training\"):\n        The Trainer class runs the training loop.",
+    "Generate a detailed question that requires a full, working code solution.\n\nQuestion: How do I train?",
+    "def train(model, data):\n    for batch in data:\n        loss = model(batch)\n        loss.backward()",
+    "Answer: Call trainer.train() after building the Trainer with a model and a dataset.",
+]
+
+# A randomly initialised two-layer GPT-2 with a byte-level BPE trained on CORPUS, so the
+# test needs no downloads; greedy decoding makes its output a function of the prompt tokens
+@pytest.fixture(scope='module')
+def tiny_model():
+    torch.manual_seed(0)
+    bpe = Tokenizer(models.BPE())
+    bpe.pre_tokenizer = pre_tokenizers.ByteLevel(add_prefix_space=False)
+    bpe.decoder = decoders.ByteLevel()
+    bpe.train_from_iterator(CORPUS, trainers.BpeTrainer(vocab_size=300, special_tokens=['<|endoftext|>'],
+                                                        initial_alphabet=pre_tokenizers.ByteLevel.alphabet()))
+    tokenizer = PreTrainedTokenizerFast(tokenizer_object=bpe, eos_token='<|endoftext|>', pad_token='<|endoftext|>')
+    tokenizer.padding_side = 'left'
+    config = GPT2Config(vocab_size=len(tokenizer), n_positions=512, n_embd=32, n_layer=2, n_head=2,
+                        bos_token_id=tokenizer.eos_token_id, eos_token_id=tokenizer.eos_token_id)
+    model = GPT2LMHeadModel(config).eval()
+    return model, tokenizer
+
+def generate(tiny_model, reuse_kv, prefixes, suffixes):
+    model, tokenizer = tiny_model
+    generator = BatchedGenerator(model, tokenizer, max_new_tokens=12, batch_size=4, reuse_kv=reuse_kv)
+    generator.generation_kwargs.update(do_sample=False, temperature=None, top_p=None)
+    return generator.generate_with_followup(prefixes, suffixes, "\nAnswer:")
+
+def test_reused_kv_answers_match_plain_prompts(tiny_model):
+    # The context ends in whitespace, so tokenizing it apart from the question would split differently
+    prefixes = ["Context from https://example.com/docs (titled \"Training\"):\n        The Trainer class.\n\n        "] * 2
+    suffixes = ["Generate a detailed question about the code.\n\nQuestion:",
+                "Generate a question and answer pair.\n\nQuestion:"]
+    reused = generate(tiny_model, True, prefixes, suffixes)
+    plain = generate(tiny_model, False, prefixes, suffixes)
+    assert reused == plain
@@ -0,0 +1,51 @@
+import importlib
+import os
+
+import pytest
+
+from html_extract import BACKENDS, extract_page
+from lang_detect import detect_language
+
+FIXTURES = os.path.join(os.path.dirname(__file__), '..', 'bench_fixtures', 'html')
+BACKEND_MODULES = {'selectolax': 'selectolax.lexbor', 'lxml': 'lxml.html', 'bs4': 'bs4'}
+
+def installed_backends():
+    names = []
+    for name in BACKENDS:
+        try:
+            importlib.import_module(BACKEND_MODULES[name])
+        except ImportError:
+            continue
+        names.append(name)
+    return names
+
+def load(name):
+    with open(os.path.join(FIXTURES, name), encoding='utf-8') as f:
+        return f.read()
+
+def test_sphinx_hints_come_from_markup():
+    html = load('sphinx_transformers_training.html')
+    for backend in installed_backends():
+        page = extract_page(html, backend)
+        hints = {hint for code, hint in page['code_blocks'] if '\n' in code}
+        # The <pre> sits in <div class="highlight"> inside <div class="highlight-python notranslate">
+        assert hints == {'highlight-python notranslate'}, backend
+        assert {detect_language(code, hint) for code, hint in page['code_blocks'] if '\n' in code} == {('python', 1.0)}
+
+def test_inline_code_ignores_container_classes():
+    html = load('mkdocs_datasets_loading.html')
+    for backend in installed_backends():
+        hints = {hint for _, hint in extract_page(html, backend)['code_blocks']}
+        assert 'md-content__inner md-typeset' not in hints, backend
+
+@pytest.mark.parametrize('name', sorted(os.listdir(FIXTURES)))
+def test_backends_agree(name):
+    html = load(name)
+    backends = installed_backends()
+    if len(backends) < 2:
+        pytest.skip('needs two HTML backends')
+    records = [extract_page(html, backend) for backend in backends]
+    for backend, record in zip(backends[1:], records[1:]):
+        assert record['code_blocks'] == records[0]['code_blocks'], backend
+        assert record['links'] == records[0]['links'], backend
+        assert record['title'] == records[0]['title'], backend
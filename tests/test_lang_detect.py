@@ -0,0 +1,20 @@
+from lang_detect import UNKNOWN, detect_language, score_tokens
+
+def test_explicit_signals_win():
+    assert detect_language('x = 1', hint='language-rust') == ('rust', 1.0)
+    assert detect_language('x = 1', hint='py') == ('python', 1.0)
+    assert detect_language('x = 1', filename='main.go') == ('go', 0.95)
+    assert detect_language('#!/usr/bin/env python3\nx = 1\n') == ('python', 0.95)
+
+def test_token_model_keeps_confident_guesses():
+    language, confidence = detect_language('SELECT name FROM users WHERE id = 1 ORDER BY name')
+    assert language == 'sql'
+    assert confidence == score_tokens('SELECT name FROM users WHERE id = 1 ORDER BY name')[1]
+
+def test_low_confidence_guesses_are_unknown():
+    # A lone keyword shared by many languages: the model picks one, but barely
+    guessed, confidence = score_tokens('return x')
+    assert guessed != UNKNOWN and 0 < confidence < 0.1
+    assert detect_language('return x') == (UNKNOWN, confidence)
+    assert detect_language('return x', min_confidence=0) == (guessed, confidence)
+    assert detect_language('a = b + c') == (UNKNOWN, 0.0)
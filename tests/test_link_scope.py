@@ -0,0 +1,58 @@
+from link_scope import LinkScope
+from postprocess import resolve_links
+
+START_URLS = ['https://docs.example/guide/', 'https://api.example/v2/reference', 'https://DOCS.example/guide/install']
+
+def test_links_under_a_start_path_are_in_scope():
+    scope = LinkScope(START_URLS, include=(), exclude=())
+    assert scope.matches('https://docs.example/guide')
+    assert scope.matches('https://docs.example/guide/install/linux')
+    assert scope.matches('https://api.example/v2/reference/users?page=2')
+
+def test_links_outside_the_start_paths_are_out_of_scope():
+    scope = LinkScope(START_URLS, include=(), exclude=())
+    # Path segments are matched whole, so a shared string prefix isn't enough
+    assert not scope.matches('https://docs.example/guides')
+    assert not scope.matches('https://docs.example/blog/post')
+    assert not scope.matches('https://api.example/v2')
+    assert not scope.matches('https://other.example/guide')
+    assert not scope.matches('ftp://docs.example/guide/file')
+
+def test_shorter_prefix_covers_longer_ones():
+    scope = LinkScope(['https://docs.example/guide/install', 'https://docs.example/guide'], include=(), exclude=())
+    assert scope.hosts == {'docs.example': {'guide': {'': True}}}
+    assert scope.matches('https://docs.example/guide/tutorial')
+
+def test_root_start_url_covers_the_whole_host():
+    scope = LinkScope(['https://docs.example'], include=(), exclude=())
+    assert scope.matches('https://docs.example/')
+    assert scope.matches('https://docs.example/anything/at/all')
+
+def test_non_crawlable_start_urls_are_ignored():
+    scope = LinkScope(['mailto:team@docs.example', 'file:///tmp/docs'], include=(), exclude=())
+    assert scope.hosts == {}
+    assert not scope.matches('https://docs.example/guide')
+
+def test_include_and_exclude_patterns():
+    scope = LinkScope(START_URLS, include=[r'/guide/', r'/reference'], exclude=[r'/v\d+\.\d+/', r'\?print=1'])
+    assert scope.matches('https://docs.example/guide/install')
+    assert scope.matches('https://api.example/v2/reference/users')
+    # In scope by path, but matching no include pattern
+    assert not scope.matches('https://docs.example/guide')
+    assert not scope.matches('https://docs.example/guide/v1.4/install')
+    assert not scope.matches('https://docs.example/guide/install?print=1')
+    assert scope.filter(['https://docs.example/guide/faq', 'https://docs.example/guide/v2.0/faq',
+                         'https://other.example/guide/faq']) == ['https://docs.example/guide/faq']
+
+def test_resolved_links_are_canonical_unique_and_skip_excluded_classes():
+    links = [
+        ('install/', ''),
+        ('./install#linux', 'reference internal'),
+        ('#top', ''),
+        ('/guide/tutorial', 'sidebar-link'),
+        ('https://DOCS.example:443/guide/faq?b=2&a=1', ''),
+    ]
+    assert resolve_links('https://docs.example/guide/', links, exclude_classes=('sidebar',)) == [
+        'https://docs.example/guide/install',
+        'https://docs.example/guide/faq?a=1&b=2',
+    ]
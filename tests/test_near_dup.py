@@ -0,0 +1,79 @@
+import random
+
+from near_dup import MERSENNE_PRIME, MinHasher, NearDuplicateDetector, shingle_hashes
+
+WORDS = [f'word{i}' for i in range(2000)]
+
+# Function to build a random page of words
+def make_page(rng, length=300):
+    return ' '.join(rng.choice(WORDS) for _ in range(length))
+
+# Function to change a few words of a page, like a version banner or a date in the footer
+def perturb(rng, page, edits=1):
+    words = page.split()
+    for _ in range(edits):
+        words[rng.randrange(len(words))] = rng.choice(WORDS)
+    return ' '.join(words)
+
+def test_signature_matches_reference_hashes():
+    hasher = MinHasher(num_perm=16)
+    hashes = shingle_hashes(make_page(random.Random(0)))
+    expected = [min((a * h + b) % MERSENNE_PRIME for h in hashes) for a, b in hasher.params]
+    assert list(hasher.signature(hashes)) == expected
+
+def test_similarity_estimates_jaccard():
+    rng = random.Random(1)
+    hasher = MinHasher(num_perm=256)
+    a = shingle_hashes(make_page(rng))
+    b = set(sorted(a)[:200]) | set(sorted(shingle_hashes(make_page(rng)))[:100])
+    jaccard = len(a & b) / len(a | b)
+    estimate = MinHasher.similarity(hasher.signature(a), hasher.signature(b))
+    assert abs(estimate - jaccard) < 0.1
+
+def test_lsh_recalls_near_duplicate_pages():
+    rng = random.Random(2)
+    detector = NearDuplicateDetector()
+    originals = [make_page(rng) for _ in range(200)]
+    for i, page in enumerate(originals):
+        assert detector.check_and_add(f'page{i}', page) is None
+    found = 0
+    for i, page in enumerate(originals):
+        match = detector.check_and_add(f'copy{i}', perturb(rng, page), [])
+        found += match is not None and match[0] == f'page{i}'
+    assert found / len(originals) >= 0.95
+    assert len(detector.index) == len(originals) + len(originals) - found
+
+def test_distinct_pages_are_not_near_duplicates():
+    rng = random.Random(3)
+    detector = NearDuplicateDetector()
+    matches = sum(detector.check_and_add(i, make_page(rng)) is not None for i in range(300))
+    assert matches == 0
+
+def test_code_blocks_count_towards_similarity():
+    rng = random.Random(4)
+    detector = NearDuplicateDetector()
+    text = make_page(rng, 30)
+    detector.check_and_add('python', text, [make_page(rng)])
+    assert detector.check_and_add('javascript', text, [make_page(rng)]) is None
+
+def test_index_evicts_least_recently_used_pages_past_capacity():
+    rng = random.Random(5)
+    detector = NearDuplicateDetector(max_pages=3)
+    pages = [make_page(rng) for _ in range(4)]
+    for i, page in enumerate(pages[:3]):
+        detector.check_and_add(i, page)
+    # Matching page 0 makes it the most recently used, so page 1 goes first
+    assert detector.check_and_add('copy0', perturb(rng, pages[0]))[0] == 0
+    detector.check_and_add(3, pages[3])
+    assert list(detector.index.signatures) == [2, 0, 3]
+    assert detector.index.evicted == 1
+    assert all(1 not in bucket for buckets in detector.index.buckets for bucket in buckets.values())
+    assert detector.check_and_add('copy1', perturb(rng, pages[1])) is None
+
+def test_readding_a_key_replaces_its_buckets():
+    rng = random.Random(6)
+    detector = NearDuplicateDetector()
+    detector.index.add('page', detector.signature(make_page(rng)))
+    detector.index.add('page', detector.signature(make_page(rng)))
+    assert len(detector.index) == 1
+    assert sum(len(bucket) for buckets in detector.index.buckets for bucket in buckets.values()) == detector.index.bands
@@ -0,0 +1,82 @@
+import gzip
+import os
+import sqlite3
+
+from page_archive import INDEX_NAME, PageArchive
+
+PAGES = [(f'https://docs.example/page/{i}', f'<html><body><h1>Page {i}</h1><pre>print({i})</pre></body></html>')
+         for i in range(10)]
+
+# Function to count the index rows another process would see
+def committed_rows(directory):
+    conn = sqlite3.connect(os.path.join(directory, INDEX_NAME))
+    try:
+        return conn.execute('SELECT COUNT(*) FROM records').fetchone()[0]
+    finally:
+        conn.close()
+
+# Function to stop an archive the way a killed crawl would: segment data reaches the file,
+# but uncommitted index rows are rolled back
+def crash(archive):
+    archive._file.flush()
+    archive._file.close()
+    archive.conn.close()
+
+def test_records_round_trip(tmp_path):
+    archive = PageArchive(str(tmp_path), commit_every=3)
+    for url, html in PAGES:
+        archive.append(url, html, status=200, headers=[('Content-Type', 'text/html')], source_type='website')
+    record = archive.get(PAGES[4][0])
+    assert record['html'] == PAGES[4][1]
+    assert record['headers'] == [('Content-Type', 'text/html')]
+    assert archive.get('https://docs.example/missing') is None
+    archive.close()
+    assert committed_rows(str(tmp_path)) == len(PAGES)
+
+def test_uncommitted_index_rows_are_rebuilt_on_open(tmp_path):
+    archive = PageArchive(str(tmp_path), commit_every=4)
+    for url, html in PAGES:
+        archive.append(url, html)
+    crash(archive)
+    assert committed_rows(str(tmp_path)) == 8
+    archive = PageArchive(str(tmp_path), commit_every=4)
+    assert committed_rows(str(tmp_path)) == len(PAGES)
+    assert all(archive.get(url)['html'] == html for url, html in PAGES)
+    archive.close()
+    # Reopening a cleanly closed archive adds nothing
+    PageArchive(str(tmp_path)).close()
+    assert committed_rows(str(tmp_path)) == len(PAGES)
+
+def test_segment_rollover_commits_the_index(tmp_path):
+    archive = PageArchive(str(tmp_path), segment_bytes=400, commit_every=1000)
+    for url, html in PAGES:
+        archive.append(url, html)
+    segments = sorted(name for name in os.listdir(tmp_path) if name.startswith('pages-'))
+    assert len(segments) > 1
+    # Everything but the records of the segment still being written is committed
+    current = archive.conn.execute('SELECT COUNT(*) FROM records WHERE segment = ?', (archive.segment,)).fetchone()[0]
+    assert committed_rows(str(tmp_path)) == len(PAGES) - current
+    crash(archive)
+    archive = PageArchive(str(tmp_path), segment_bytes=400)
+    assert committed_rows(str(tmp_path)) == len(PAGES)
+    assert all(archive.get(url)['html'] == html for url, html in PAGES)
+    archive.close()
+
+def test_torn_record_is_truncated(tmp_path):
+    archive = PageArchive(str(tmp_path), commit_every=1000)
+    for url, html in PAGES[:5]:
+        archive.append(url, html)
+    segment = os.path.join(str(tmp_path), archive.segment)
+    crash(archive)
+    size = os.path.getsize(segment)
+    with open(segment, 'ab') as f:
+        f.write(gzip.compress(b'WARC/1.1\r\n' * 100)[:40])
+    archive = PageArchive(str(tmp_path))
+    assert os.path.getsize(segment) == size
+    for url, html in PAGES[5:]:
+        archive.append(url, html)
+    archive.close()
+    assert committed_rows(str(tmp_path)) == len(PAGES)
+    # The segment is still one valid gzip stream of whole records
+    with gzip.open(segment) as f:
+        assert f.read().count(b'WARC/1.1\r\n') == len(PAGES)
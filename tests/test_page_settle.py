@@ -0,0 +1,58 @@
+import asyncio
+
+from page_settle import CLICK_SCRIPT, SCROLL_SCRIPT, SETTLE_SCRIPT, click_all, scroll_to_end, wait_for_settle
+
+# Stand-in for a driverless browser that records the calls page_settle makes and answers
+# each script the way the in-page code would
+class FakeBrowser:
+    def __init__(self, settled=True, clicks=(0, 0)):
+        self.settled = settled
+        self.clicks = clicks
+        self.calls = []
+        self.script_timeout = None
+
+    async def set_script_timeout(self, seconds):
+        self.script_timeout = seconds
+
+    async def execute_async_script(self, script, *args):
+        self.calls.append((script, args))
+        if script is SETTLE_SCRIPT:
+            return {'settled': self.settled, 'waited': args[1] if not self.settled else args[0]}
+        return {'iterations': args[2], 'height': 1000, 'elapsed': 10.0}
+
+    async def execute_script(self, script, *args):
+        self.calls.append((script, args))
+        return list(self.clicks)
+
+    async def current_url(self):
+        return 'https://docs.example/guide'
+
+def test_settle_waits_in_one_call_with_an_outer_timeout():
+    browser = FakeBrowser()
+    result = asyncio.run(wait_for_settle(browser, timeout=2, quiet_ms=150))
+    assert result['settled']
+    assert browser.calls == [(SETTLE_SCRIPT, (150, 2000))]
+    # Selenium's script timeout must outlast the in-page cap so a slow page returns settled=False
+    assert browser.script_timeout > 2
+
+def test_unsettled_page_is_returned_not_raised():
+    browser = FakeBrowser(settled=False)
+    assert asyncio.run(wait_for_settle(browser, timeout=1, quiet_ms=100)) == {'settled': False, 'waited': 1000}
+
+def test_scroll_runs_in_one_call_bounded_by_budget():
+    browser = FakeBrowser()
+    result = asyncio.run(scroll_to_end(browser, max_iterations=5, budget=4, timeout=1, quiet_ms=100))
+    assert result['iterations'] == 5
+    assert browser.calls == [(SCROLL_SCRIPT, (100, 1000, 5, 4000))]
+    assert browser.script_timeout > 4
+
+def test_click_all_waits_once_after_clicking():
+    browser = FakeBrowser(clicks=(3, 0))
+    assert asyncio.run(click_all(browser, ('Show more', 'Expand'), timeout=1)) == 3
+    assert [script for script, _ in browser.calls] == [CLICK_SCRIPT, SETTLE_SCRIPT]
+    assert browser.calls[0][1] == (['Show more', 'Expand'],)
+
+def test_click_all_skips_the_wait_when_nothing_was_clicked():
+    browser = FakeBrowser(clicks=(0, 1))
+    assert asyncio.run(click_all(browser, ['Show more'])) == 0
+    assert [script for script, _ in browser.calls] == [CLICK_SCRIPT]
@@ -0,0 +1,122 @@
+import asyncio
+import time
+from datetime import datetime, timezone
+from email.utils import format_datetime
+
+import pytest
+
+from politeness import PolitenessScheduler, host_of, parse_retry_after
+
+URL = 'https://Docs.Example/guide'
+
+# Function to build a scheduler with round numbers so the AIMD steps are easy to follow
+def make_scheduler(**kwargs):
+    settings = dict(initial_rate=1.0, min_rate=0.1, max_rate=2.0, rate_step=0.25, backoff_factor=0.5, burst=10,
+                    initial_concurrency=4, max_concurrency=6, target_latency=1.0, max_retry_after=60,
+                    total_concurrency=32)
+    settings.update(kwargs)
+    return PolitenessScheduler(**settings)
+
+# Function to acquire and immediately release one lease, filling in the response first. The
+# token bucket is topped up beforehand so the tests exercise the AIMD steps, not the pacing.
+async def round_trip(scheduler, url=URL, status=200, retry_after=None, error=False, latency=0.0):
+    state = scheduler.state(host_of(url))
+    state.tokens = state.burst
+    lease = await scheduler.acquire(url)
+    lease.started -= latency
+    lease.status, lease.retry_after, lease.error = status, retry_after, error
+    scheduler.release(lease)
+    return scheduler.state(host_of(url))
+
+def test_parse_retry_after():
+    now = time.time()
+    assert parse_retry_after(None) is None
+    assert parse_retry_after('  ') is None
+    assert parse_retry_after('soon') is None
+    assert parse_retry_after('120') == 120.0
+    assert parse_retry_after(b'5') == 5.0
+    date = format_datetime(datetime.fromtimestamp(now + 30, timezone.utc), usegmt=True)
+    assert parse_retry_after(date, now=now) == pytest.approx(30, abs=1)
+    past = format_datetime(datetime.fromtimestamp(now - 30, timezone.utc), usegmt=True)
+    assert parse_retry_after(past, now=now) == 0.0
+
+def test_successes_increase_rate_and_concurrency_additively():
+    async def run():
+        scheduler = make_scheduler()
+        for _ in range(3):
+            state = await round_trip(scheduler)
+        assert state.rate == 1.75
+        assert state.concurrency == 4
+        state = await round_trip(scheduler)
+        assert state.concurrency == 5
+        for _ in range(20):
+            state = await round_trip(scheduler)
+        assert state.rate == 2.0
+        assert state.concurrency == 6
+    asyncio.run(run())
+
+def test_throttling_response_backs_off_and_honours_retry_after():
+    async def run():
+        scheduler = make_scheduler()
+        state = await round_trip(scheduler, status=429, retry_after=b'7')
+        assert state.rate == 0.5
+        assert state.concurrency == 2
+        assert state.backoffs == 1
+        assert state.wait_time(time.monotonic()) == pytest.approx(7, abs=0.5)
+        # A server asking for more than max_retry_after is capped
+        state = await round_trip(make_scheduler(), status=503, retry_after='3600')
+        assert state.wait_time(time.monotonic()) == pytest.approx(60, abs=0.5)
+    asyncio.run(run())
+
+def test_throttling_without_retry_after_waits_one_request_interval():
+    async def run():
+        state = await round_trip(make_scheduler(), status=503)
+        assert state.wait_time(time.monotonic()) == pytest.approx(1 / state.rate, abs=0.1)
+    asyncio.run(run())
+
+def test_backoff_counts_once_per_round_trip():
+    async def run():
+        scheduler = make_scheduler()
+        # Three 429s that were all in flight during the same 5 s round trip
+        for _ in range(3):
+            state = await round_trip(scheduler, status=429, retry_after='0', latency=5.0)
+        assert state.rate == 0.5
+        assert state.backoffs == 1
+    asyncio.run(run())
+
+def test_errors_and_slow_responses_back_off_to_the_floor():
+    async def run():
+        scheduler = make_scheduler()
+        state = await round_trip(scheduler, latency=3.0)
+        assert state.rate == 0.5
+        for _ in range(10):
+            state = await round_trip(scheduler, status=None, error=True)
+        assert state.rate == 0.1
+        assert state.concurrency == 1
+        assert state.blocked_until == 0.0
+    asyncio.run(run())
+
+def test_full_host_does_not_block_other_hosts():
+    async def run():
+        scheduler = make_scheduler(initial_concurrency=1)
+        held = await scheduler.acquire('https://slow.example/a')
+        waiting = asyncio.ensure_future(scheduler.acquire('https://slow.example/b'))
+        await asyncio.sleep(0.05)
+        assert not waiting.done()
+        other = await asyncio.wait_for(scheduler.acquire('https://fast.example/a'), 1)
+        scheduler.release(other)
+        scheduler.release(held)
+        scheduler.release(await asyncio.wait_for(waiting, 2))
+        assert scheduler.in_flight == 0
+    asyncio.run(run())
+
+def test_slot_reports_errors():
+    async def run():
+        scheduler = make_scheduler()
+        with pytest.raises(RuntimeError):
+            async with scheduler.slot(URL):
+                raise RuntimeError("connection reset")
+        state = scheduler.state(host_of(URL))
+        assert state.backoffs == 1
+        assert state.in_flight == 0
+    asyncio.run(run())
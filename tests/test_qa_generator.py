@@ -0,0 +1,62 @@
+import asyncio
+import sqlite3
+import time
+
+from db_writer import open_database, write_pages
+from qa_generator import LlamaQAGenerator
+
+# Stands in for BatchedGenerator: records the prompts it was asked for, answers with placeholders
+class FakeGenerator:
+    def __init__(self):
+        self.prompts = []
+
+    def generate_with_followup(self, prefixes, suffixes, followup):
+        self.prompts.extend(prefixes)
+        return ['question'] * len(prefixes), ['answer'] * len(prefixes)
+
+def page(url, content):
+    return {'url': url, 'title': url, 'content': content, 'source_type': 'docs', 'code_blocks': []}
+
+async def write(path, pages):
+    db = await open_database(path)
+    await write_pages(db, pages)
+    await db.commit()
+    await db.close()
+
+def make_generator(tmp_path):
+    # Skip __init__ so no model is loaded
+    qa = LlamaQAGenerator.__new__(LlamaQAGenerator)
+    qa.input_db = str(tmp_path / 'input.db')
+    qa.output_db = str(tmp_path / 'output.db')
+    qa.source_key = f"{qa.input_db}:pages"
+    qa.setup_database()
+    return qa
+
+def run(qa):
+    generator = FakeGenerator()
+    qa._process_chunks(generator, resume=True)
+    return generator.prompts
+
+def test_resume_without_checkpoint_does_not_regenerate_earlier_changes(tmp_path):
+    qa = make_generator(tmp_path)
+    urls = [f'https://example.com/{i}' for i in range(3)]
+    asyncio.run(write(qa.input_db, [page(url, 'first crawl') for url in urls]))
+    # A re-crawl changes a page before QA generation has ever run
+    asyncio.run(write(qa.input_db, [page(urls[0], 'second crawl')]))
+
+    assert len(run(qa)) == 3
+    with sqlite3.connect(qa.output_db) as conn:
+        last_id, changed = qa.load_checkpoint(conn)
+    with sqlite3.connect(qa.input_db) as conn:
+        assert changed == conn.execute("SELECT MAX(changed_at), MAX(id) FROM pages").fetchone()
+    assert last_id == 3
+
+    # The change was already covered by the first run
+    assert run(qa) == []
+
+    time.sleep(0.01)
+    asyncio.run(write(qa.input_db, [page(urls[1], 'third crawl')]))
+    prompts = run(qa)
+    assert len(prompts) == 1 and urls[1] in prompts[0]
+    with sqlite3.connect(qa.output_db) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM qa_pairs").fetchone()[0] == 3
@@ -0,0 +1,111 @@
+import asyncio
+import io
+import sqlite3
+import tarfile
+
+from aiohttp import web
+
+from db_writer import DBWriter
+from repo_ingest import RepoIngester, build_file_records, iter_archive_files, parse_github_url, ref_candidates
+from scrape_settings import REPO_MAX_FILE_BYTES
+
+BASE_URL = 'https://github.com/octo/demo/blob/main'
+
+FILES = {
+    'repo/src/app.py': b'def main():\n    return 42\n',
+    'repo/docs/guide.md': b'# Guide\n\nRun `python -m app`.\n',
+    'repo/web/index.ts': b'export const answer: number = 42;\n',
+    'repo/node_modules/left-pad/index.js': b'module.exports = () => {};\n',
+    'repo/build/generated.py': b'GENERATED = True\n',
+    'repo/data/big.py': b'#' * (REPO_MAX_FILE_BYTES + 1),
+    'repo/assets/logo.png': b'\x89PNG\r\n\x1a\n',
+    'repo/src/blob.py': b'\x00\x01\x02binary',
+    'repo/src/empty.py': b'   \n',
+}
+
+def make_tarball(files=FILES):
+    data = io.BytesIO()
+    with tarfile.open(fileobj=data, mode='w:gz') as archive:
+        for name, content in files.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(content)
+            archive.addfile(info, io.BytesIO(content))
+    return data.getvalue()
+
+def test_archive_skips_vendored_large_and_unknown_files():
+    paths = [path for path, _ in iter_archive_files(io.BytesIO(make_tarball()))]
+    assert sorted(paths) == ['docs/guide.md', 'src/app.py', 'src/blob.py', 'src/empty.py', 'web/index.ts']
+
+def test_file_records_drop_binary_and_empty_files():
+    jobs = [(BASE_URL, 'demo', path, raw) for path, raw in iter_archive_files(io.BytesIO(make_tarball()))]
+    records = {record['url']: record for record in build_file_records(jobs)}
+    assert sorted(records) == [f'{BASE_URL}/docs/guide.md', f'{BASE_URL}/src/app.py', f'{BASE_URL}/web/index.ts']
+    app = records[f'{BASE_URL}/src/app.py']
+    assert app['content'] == app['code_blocks'][0]['code'] == FILES['repo/src/app.py'].decode()
+    assert app['code_blocks'][0]['language'] == 'python'
+    assert records[f'{BASE_URL}/web/index.ts']['code_blocks'][0]['language'] == 'typescript'
+
+def test_ingest_archive_stores_records(tmp_path):
+    db_path = str(tmp_path / 'repo.db')
+
+    async def ingest():
+        writer = DBWriter(db_path)
+        ingester = RepoIngester(writer, batch_files=2)
+        try:
+            return await ingester.ingest_archive(io.BytesIO(make_tarball()), BASE_URL, 'demo')
+        finally:
+            await ingester.close()
+            await writer.close()
+
+    assert asyncio.run(ingest()) == 3
+    with sqlite3.connect(db_path) as conn:
+        rows = conn.execute('SELECT page_texts.url, code_block_texts.language FROM page_texts '
+                            'JOIN code_block_texts ON code_block_texts.page_id = page_texts.id ORDER BY url').fetchall()
+        assert rows == [(f'{BASE_URL}/docs/guide.md', 'markdown'), (f'{BASE_URL}/src/app.py', 'python'),
+                        (f'{BASE_URL}/web/index.ts', 'typescript')]
+        assert conn.execute('SELECT DISTINCT source_type FROM pages').fetchall() == [('github_repo',)]
+
+def test_refs_with_slashes():
+    url = 'https://github.com/octo/demo/tree/release/1.2/docs'
+    assert parse_github_url(url) == ('octo', 'demo', 'release')
+    assert ref_candidates(url) == ['release', 'release/1.2', 'release/1.2/docs']
+    assert ref_candidates('https://github.com/octo/demo') == []
+
+# A stand-in for GitHub's tarball endpoint that only knows the ref release/1.2
+def test_ingest_url_finds_ref_with_slash(tmp_path):
+    tarball = make_tarball()
+    requested = []
+
+    async def tarball_handler(request):
+        ref = request.match_info.get('ref')
+        requested.append(ref)
+        if ref not in (None, 'release/1.2'):
+            raise web.HTTPNotFound()
+        return web.Response(body=tarball)
+
+    async def ingest():
+        app = web.Application()
+        app.router.add_get('/repos/octo/demo/tarball', tarball_handler)
+        app.router.add_get('/repos/octo/demo/tarball/{ref:.+}', tarball_handler)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, '127.0.0.1', 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        writer = DBWriter(str(tmp_path / 'repo.db'))
+        ingester = RepoIngester(writer, token=None, api_url=f'http://127.0.0.1:{port}')
+        try:
+            stored = await ingester.ingest_url('https://github.com/octo/demo/tree/release/1.2/docs')
+            stored_default = await ingester.ingest_url('https://github.com/octo/demo/tree/missing')
+            return stored, stored_default
+        finally:
+            await ingester.close()
+            await writer.close()
+            await runner.cleanup()
+
+    assert asyncio.run(ingest()) == (3, 3)
+    assert requested == ['release', 'release/1.2', 'missing', None]
+    with sqlite3.connect(str(tmp_path / 'repo.db')) as conn:
+        urls = {row[0] for row in conn.execute('SELECT url FROM pages')}
+    assert 'https://github.com/octo/demo/blob/release/1.2/src/app.py' in urls
+    assert 'https://github.com/octo/demo/blob/HEAD/src/app.py' in urls
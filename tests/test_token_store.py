@@ -0,0 +1,57 @@
+import json
+import sqlite3
+
+import pytest
+from pygments.lexers import get_lexer_by_name
+
+from token_store import (CREATE_TOKEN_TYPES, INSERT_TOKEN_TYPES, TOKEN_TYPE_NAMES, get_lexer, load_tokens, pack_tokens,
+                         token_type_id, tokenize_for_storage, unpack_tokens, vocabulary_rows)
+
+PYTHON = 'def greet(name):\n    """Say hello."""\n    return f"Hello, {name}!"  # greeting\n'
+
+def test_round_trip_restores_code_and_token_types():
+    blob = pack_tokens(PYTHON, 'python')
+    tokens = list(unpack_tokens(blob, PYTHON))
+    assert ''.join(text for _, text in tokens) == PYTHON
+    # Adjacent tokens of one type are merged, so neighbours always differ
+    assert all(a[0] != b[0] for a, b in zip(tokens, tokens[1:]))
+    expected = []
+    for _, ttype, text in get_lexer('python').get_tokens_unprocessed(PYTHON):
+        name = TOKEN_TYPE_NAMES[token_type_id(ttype)]
+        if expected and expected[-1][0] == name:
+            expected[-1][1] += text
+        else:
+            expected.append([name, text])
+    assert tokens == [tuple(token) for token in expected]
+    assert ('Token.Keyword', 'def') in tokens
+
+def test_long_tokens_use_multibyte_lengths():
+    code = '"' + 'x' * 1000 + '"\n'
+    blob = pack_tokens(code, 'python')
+    assert ''.join(text for _, text in unpack_tokens(blob, code)) == code
+    assert len(blob) < len(code) // 10
+
+def test_unknown_version_is_rejected():
+    blob = bytearray(pack_tokens('x = 1\n', 'python'))
+    blob[0] = 99
+    with pytest.raises(ValueError):
+        list(unpack_tokens(bytes(blob), 'x = 1\n'))
+
+def test_legacy_json_rows_are_still_readable():
+    # Rows from before the packed format hold json.dumps(list(lexer.get_tokens(code)))
+    raw = list(get_lexer_by_name('python').get_tokens(PYTHON))
+    tokens = load_tokens(PYTHON, 'python', json.dumps(raw))
+    assert tokens == [(str(ttype), text) for ttype, text in raw]
+
+def test_load_tokens_tokenizes_deferred_rows():
+    assert tokenize_for_storage(PYTHON, 'python', eager=False) is None
+    assert load_tokens(PYTHON, 'python') == list(unpack_tokens(pack_tokens(PYTHON, 'python'), PYTHON))
+    assert load_tokens(PYTHON, 'no-such-language') == []
+
+def test_vocabulary_table_decodes_blobs_without_pygments():
+    db = sqlite3.connect(':memory:')
+    db.execute(CREATE_TOKEN_TYPES)
+    db.executemany(INSERT_TOKEN_TYPES, vocabulary_rows())
+    names = [name for _, name in db.execute('SELECT id, name FROM token_types ORDER BY id')]
+    blob = pack_tokens(PYTHON, 'python')
+    assert list(unpack_tokens(blob, PYTHON, names)) == list(unpack_tokens(blob, PYTHON))
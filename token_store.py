@@ -0,0 +1,109 @@
+import json
+import logging
+import struct
+
+from pygments.lexers import get_lexer_by_name
+from pygments.token import STANDARD_TYPES, Token
+
+FORMAT_VERSION = 1
+HEADER = struct.Struct('<BI')  # format version, token count
+
+# Shared vocabulary: every standard Pygments token type gets a stable integer id, and
+# lexer-specific subtypes fall back to their nearest standard ancestor. The table is
+# also written to the database (token_types) so readers don't depend on Pygments.
+TOKEN_TYPE_NAMES = sorted(str(ttype) for ttype in STANDARD_TYPES)
+TOKEN_TYPE_IDS = {name: i for i, name in enumerate(TOKEN_TYPE_NAMES)}
+assert len(TOKEN_TYPE_NAMES) <= 256, "Token type ids are packed into one byte"
+
+CREATE_TOKEN_TYPES = '''
+    CREATE TABLE IF NOT EXISTS token_types (
+        id INTEGER PRIMARY KEY,
+        name TEXT UNIQUE
+    )
+'''
+
+INSERT_TOKEN_TYPES = 'INSERT OR IGNORE INTO token_types (id, name) VALUES (?, ?)'
+
+_lexers = {}
+
+def token_type_id(ttype):
+    while ttype is not Token:
+        type_id = TOKEN_TYPE_IDS.get(str(ttype))
+        if type_id is not None:
+            return type_id
+        ttype = ttype.parent
+    return TOKEN_TYPE_IDS['Token']
+
+def vocabulary_rows():
+    return list(enumerate(TOKEN_TYPE_NAMES))
+
+def get_lexer(language):
+    lexer = _lexers.get(language)
+    if lexer is None:
+        lexer = _lexers[language] = get_lexer_by_name(language)
+    return lexer
+
+# Function to tokenize code into a packed BLOB: a header, one byte of type id per token,
+# then every token's length as a LEB128 varint (one byte for tokens under 128 chars).
+# Token text is not copied; it is sliced back out of the code on read. Adjacent tokens
+# of the same type are merged.
+def pack_tokens(code, language):
+    types = bytearray()
+    offsets = []
+    for index, ttype, _ in get_lexer(language).get_tokens_unprocessed(code):
+        type_id = token_type_id(ttype)
+        if not types or type_id != types[-1]:
+            types.append(type_id)
+            offsets.append(index)
+    offsets.append(len(code))
+    lengths = bytearray()
+    for i in range(len(types)):
+        length = offsets[i + 1] - offsets[i]
+        while length >= 0x80:
+            lengths.append((length & 0x7F) | 0x80)
+            length >>= 7
+        lengths.append(length)
+    return HEADER.pack(FORMAT_VERSION, len(types)) + bytes(types) + bytes(lengths)
+
+# Function to lazily decode a packed BLOB back into (token type name, text) pairs
+def unpack_tokens(blob, code, type_names=TOKEN_TYPE_NAMES):
+    version, count = HEADER.unpack_from(blob)
+    if version != FORMAT_VERSION:
+        raise ValueError(f"Unsupported token format version {version}")
+    types = blob[HEADER.size:HEADER.size + count]
+    position = HEADER.size + count
+    start = 0
+    for type_id in types:
+        length = shift = 0
+        while True:
+            byte = blob[position]
+            position += 1
+            length |= (byte & 0x7F) << shift
+            if byte < 0x80:
+                break
+            shift += 7
+        yield type_names[type_id], code[start:start + length]
+        start += length
+
+# Function to tokenize a code block for storage. Returns None when tokenization is deferred
+# to read time or no lexer exists for the language.
+def tokenize_for_storage(code, language, eager=True):
+    if not eager:
+        return None
+    try:
+        return pack_tokens(code, language)
+    except Exception as e:
+        logging.debug(f"Error tokenizing code: {code[:50]}..., Error: {str(e)}")
+        return None
+
+# Function to read the tokens of a stored code block, tokenizing on demand when the row was
+# stored without them. Rows written before the packed format (JSON text) are still readable.
+def load_tokens(code, language, stored=None, type_names=TOKEN_TYPE_NAMES):
+    if isinstance(stored, str):
+        return [('.'.join(['Token'] + ttype) if isinstance(ttype, list) else ttype, value)
+                for ttype, value in json.loads(stored)]
+    if stored is None:
+        stored = tokenize_for_storage(code, language)
+        if stored is None:
+            return []
+    return list(unpack_tokens(stored, code, type_names))